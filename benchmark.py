@@ -0,0 +1,328 @@
+"""Micro-benchmarks for the ingestion path.
+
+Usage:
+    python benchmark.py validation [--rows N]
+    python benchmark.py transform [--intervals N] [--devices N]
+    python benchmark.py wire [--intervals N] [--repeat N]
+    python benchmark.py load [--url URL] [--writers N] [--readers N] [--duration S]
+"""
+
+import argparse
+import asyncio
+import copy
+import gzip
+import json
+import os
+import sys
+import statistics
+import time
+
+import django
+import httpx
+
+os.environ["DJANGO_SETTINGS_MODULE"] = "mysite.settings"
+
+try:
+    django.setup()
+except Exception as e:
+    print("Error setting up Django:", e)
+    sys.exit(1)
+
+# Depends on Django setup
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from scada.parsers import PAYLOAD_PARSERS, msgpack
+from scada.validation import RowValidator
+from scada.views import SERIALIZER_MAPPING, DeviceType
+from suryalog import Transformer, load_json_file
+
+
+def load_sample_payload():
+    with open("samples/suryalog-example-payload.json") as f:
+        return json.load(f)
+
+
+def report(name, rows, seconds):
+    print(f"{name:<24} {rows:>8} rows {seconds:>8.3f}s {rows / seconds:>12,.0f} rows/s")
+
+
+def bench_validation(args):
+    """Serializer path vs compiled `RowValidator`, per device type."""
+    payload = load_sample_payload()
+    extra_fields = {"timestamp": payload["Timestamp"], "uid": payload["UID"]}
+
+    for device_type in DeviceType:
+        if device_type not in payload["Data"]:
+            continue
+        Serializer = SERIALIZER_MAPPING[device_type]
+        tags = payload["Tags"][device_type]
+        sample = payload["Data"][device_type]
+        rows = (sample * (args.rows // len(sample) + 1))[: args.rows]
+
+        print(f"{device_type} ({len(tags)} tags)")
+
+        start = time.perf_counter()
+        for row in rows:
+            data = dict(zip(tags, row))
+            data.update(extra_fields)
+            s = Serializer(data=data)
+            s.is_valid()
+        report("  serializer", len(rows), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        validator = RowValidator(Serializer)
+        validator.validate(rows, tags, extra_fields)
+        report("  compiled validator", len(rows), time.perf_counter() - start)
+
+
+def legacy_transform(data, device_mapping, device_param_mapping, payload_tags):
+    """The per-tag loop the collector used before `suryalog.Transformer`."""
+    payloads = {}
+    for sensor_time, point_device_data in data.items():
+        formatted_data = {}
+        for device_name in point_device_data:
+            device_type = device_mapping[device_name]
+            param_map = device_param_mapping[device_type]
+            device_tags = payload_tags[device_type]
+            specific_device_data = point_device_data[device_name]
+            device_payload_data = []
+            if device_type not in formatted_data:
+                formatted_data[device_type] = []
+            for param in device_tags:
+                if param == "devType":
+                    device_payload_data.append(device_name)
+                    continue
+                if param == "devName":
+                    device_payload_data.append(device_name)
+                    continue
+                if param in param_map:
+                    mapped_param = param_map[param]
+                    device_payload_data.append(
+                        specific_device_data.get(mapped_param, None)
+                    )
+                else:
+                    device_payload_data.append(None)
+            formatted_data[device_type].append(device_payload_data)
+        payloads[int(sensor_time)] = formatted_data
+    return payloads
+
+
+def synthetic_day(intervals, devices):
+    """A Suryalog `data` dict of `intervals` 5 minute intervals and
+    `devices` devices, cloned from the sample API response."""
+    with open("samples/suryalog-api-response.json") as f:
+        sample = json.load(f)["data"]
+    sensor_time, readings = next(iter(sample.items()))
+    device_mapping = load_json_file("device_mapping.json")
+
+    names = list(readings)
+    while len(names) < devices:
+        # Extra inverters and SCBs, cloned from the first ones
+        for prefix in ("I", "S"):
+            template = f"{prefix}1"
+            name = f"{prefix}{sum(n.startswith(prefix) for n in names) + 1}"
+            readings[name] = readings[template]
+            device_mapping[name] = device_mapping[template]
+            names.append(name)
+    readings = {name: readings[name] for name in names[:devices]}
+
+    data = {str(int(sensor_time) + i * 300): readings for i in range(intervals)}
+    return data, device_mapping
+
+
+def bench_transform(args):
+    """Collector per-tag loop vs precompiled `suryalog.Transformer`."""
+    data, device_mapping = synthetic_day(args.intervals, args.devices)
+    device_param_mapping = load_json_file("suryalog_mapping.json")
+    payload_tags = load_json_file("payload_tags.json")
+    rows = args.intervals * args.devices
+
+    print(f"{args.intervals} intervals x {args.devices} devices")
+
+    start = time.perf_counter()
+    expected = legacy_transform(
+        data, device_mapping, device_param_mapping, payload_tags
+    )
+    elapsed = time.perf_counter() - start
+    report("  per-tag loop", rows, elapsed)
+
+    # The per-tag loop has no derived fields, the compiled transform
+    # evaluates them too
+    transformer = Transformer(device_mapping, device_param_mapping, payload_tags)
+    start = time.perf_counter()
+    for formatted_data in expected.values():
+        transformer.derive(formatted_data)
+    report("  + derived fields", rows, elapsed + time.perf_counter() - start)
+
+    start = time.perf_counter()
+    transformer = Transformer(device_mapping, device_param_mapping, payload_tags)
+    result = transformer.transform(data)
+    report("  compiled transform", rows, time.perf_counter() - start)
+
+    if result != expected:
+        print("Transform output differs from the per-tag loop")
+        sys.exit(1)
+
+
+def wire_formats(payload):
+    """`(name, content type, body, content encoding)` of every wire format."""
+    json_body = json.dumps(payload, separators=(",", ":")).encode()
+    formats = [
+        ("json", "application/json", json_body, None),
+        ("json+gzip", "application/json", gzip.compress(json_body), "gzip"),
+    ]
+    if msgpack is not None:
+        msgpack_body = msgpack.packb(payload)
+        formats += [
+            ("msgpack", "application/msgpack", msgpack_body, None),
+            (
+                "msgpack+gzip",
+                "application/msgpack",
+                gzip.compress(msgpack_body),
+                "gzip",
+            ),
+        ]
+    return formats
+
+
+def bench_wire(args):
+    """Body size and parse time of the payload wire formats."""
+    sample = load_sample_payload()
+    payloads = {"single interval": sample}
+    if args.intervals > 1:
+        payloads[f"batch of {args.intervals}"] = {
+            "Tags": sample["Tags"],
+            "UID": sample["UID"],
+            "Intervals": [
+                {"Timestamp": sample["Timestamp"] + i * 300, "Data": sample["Data"]}
+                for i in range(args.intervals)
+            ],
+        }
+    if msgpack is None:
+        print("msgpack is not installed, skipping the msgpack formats")
+
+    factory = APIRequestFactory()
+    for name, payload in payloads.items():
+        print(name)
+        for format_name, content_type, body, encoding in wire_formats(payload):
+            headers = {"HTTP_CONTENT_ENCODING": encoding} if encoding else {}
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                request = Request(
+                    factory.generic(
+                        "POST", "/api/v1/data/", body, content_type, **headers
+                    ),
+                    parsers=[parser() for parser in PAYLOAD_PARSERS],
+                )
+                assert request.data == payload
+            seconds = (time.perf_counter() - start) / args.repeat
+            print(
+                f"  {format_name:<14} {len(body):>10,} bytes {seconds * 1000:>9.3f} ms/parse"
+            )
+
+
+async def load_worker(client, kind, request, deadline, results):
+    """Send `request()` requests until `deadline`, recording their latency."""
+    latencies, failures = results.setdefault(kind, ([], []))
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = await request()
+        except Exception as e:
+            failures.append(type(e).__name__)
+            continue
+        if response.status_code >= 400:
+            failures.append(response.status_code)
+        else:
+            latencies.append(time.perf_counter() - start)
+
+
+async def run_load(args):
+    sample = load_sample_payload()
+    sample["UID"] = args.uid
+    inverter = sample["Data"]["Inverter"][0][sample["Tags"]["Inverter"].index("devName")]
+    # Every ingest request stores a new interval
+    timestamps = iter(range(sample["Timestamp"], sys.maxsize, 300))
+
+    def ingest():
+        payload = copy.copy(sample)
+        payload["Timestamp"] = next(timestamps)
+        return client.post(f"{args.url}/api/v1/data/", json=payload)
+
+    def read_plant():
+        return client.get(f"{args.url}/api/v1/plant/{args.uid}/")
+
+    def read_inverter():
+        return client.get(
+            f"{args.url}/api/v1/inverter/{inverter}/",
+            params={"uid": args.uid, "limit": 100},
+        )
+
+    limits = httpx.Limits(max_connections=args.writers + args.readers * 2)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        # One interval, so that the read endpoints have something to return
+        response = await ingest()
+        response.raise_for_status()
+
+        results = {}
+        deadline = time.perf_counter() + args.duration
+        workers = [
+            load_worker(client, "ingest", ingest, deadline, results)
+            for _ in range(args.writers)
+        ]
+        workers += [
+            load_worker(client, kind, request, deadline, results)
+            for kind, request in (("plant", read_plant), ("inverter", read_inverter))
+            for _ in range(args.readers)
+        ]
+        await asyncio.gather(*workers)
+    return results
+
+
+def bench_load(args):
+    """Concurrent ingest and read throughput of a running server."""
+    results = asyncio.run(run_load(args))
+    print(f"{args.writers} writers, {args.readers} readers per endpoint, {args.duration}s")
+    for kind, (latencies, failures) in results.items():
+        if len(latencies) > 1:
+            quantiles = statistics.quantiles(latencies, n=100)
+            p50, p95, p99 = quantiles[49], quantiles[94], quantiles[98]
+        else:
+            p50 = p95 = p99 = latencies[0] if latencies else 0
+        print(
+            f"{kind:<10} {len(latencies) / args.duration:>9.1f} req/s"
+            f"   p50 {p50 * 1000:>8.1f} ms   p95 {p95 * 1000:>8.1f} ms"
+            f"   p99 {p99 * 1000:>8.1f} ms   {len(failures)} failed"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    validation = subparsers.add_parser("validation", help=bench_validation.__doc__)
+    validation.add_argument("--rows", type=int, default=5000)
+    validation.set_defaults(func=bench_validation)
+
+    transform = subparsers.add_parser("transform", help=bench_transform.__doc__)
+    transform.add_argument("--intervals", type=int, default=288)
+    transform.add_argument("--devices", type=int, default=40)
+    transform.set_defaults(func=bench_transform)
+
+    wire = subparsers.add_parser("wire", help=bench_wire.__doc__)
+    wire.add_argument("--intervals", type=int, default=12)
+    wire.add_argument("--repeat", type=int, default=50)
+    wire.set_defaults(func=bench_wire)
+
+    load = subparsers.add_parser("load", help=bench_load.__doc__)
+    load.add_argument("--url", default="http://localhost:8000")
+    load.add_argument("--uid", default="load-test")
+    load.add_argument("--writers", type=int, default=4)
+    load.add_argument("--readers", type=int, default=8)
+    load.add_argument("--duration", type=float, default=10)
+    load.add_argument("--timeout", type=float, default=30)
+    load.set_defaults(func=bench_load)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -1,6 +1,9 @@
 """Collect data and feed it to the API"""
 # from generate_samples import generate_json_payload
 
+import argparse
+import asyncio
+import gzip
 import time
 import httpx
 import json
@@ -8,114 +11,503 @@ import logging
 
 import os
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from spool import Spool
+from suryalog import Transformer
+
 SURYALOG_SECRET = os.environ.get("SURYALOG_SECRET")
 SURYALOG_PLANT = os.environ.get("SURYALOG_PLANT")
+# Several plants as comma separated `<plant>:<uid>` pairs
+SURYALOG_PLANTS = os.environ.get("SURYALOG_PLANTS")
+SURYALOG_URL = os.environ.get(
+    "SURYALOG_URL", "https://master.suryalog.com/api/get_datalog_v1.php"
+)
+SCADA_API_URL = os.environ.get("SCADA_API_URL", "http://localhost:8000/api/v1/data/")
+SCADA_BATCH_API_URL = os.environ.get(
+    "SCADA_BATCH_API_URL", "http://localhost:8000/api/v1/data/batch/"
+)
+# Timestamps already stored for a plant, to skip them when backfilling
+SCADA_TIMESTAMPS_API_URL = os.environ.get(
+    "SCADA_TIMESTAMPS_API_URL", "http://localhost:8000/api/v1/plant/{uid}/timestamps/"
+)
+# Wire format of the payloads: `json` or `msgpack` (needs the msgpack
+# package), compressed with `gzip` unless set to `none`
+SCADA_API_FORMAT = os.environ.get("SCADA_API_FORMAT", "json")
+SCADA_API_COMPRESSION = os.environ.get("SCADA_API_COMPRESSION", "gzip")
+# Payloads are spooled there before being sent, see spool.py
+SURYALOG_SPOOL_DIR = os.environ.get("SURYALOG_SPOOL_DIR", "spool")
+SURYALOG_SPOOL_FSYNC = os.environ.get("SURYALOG_SPOOL_FSYNC", "always")
+
+DEFAULT_UID = "SLM00E923M"
+INTERVAL = 300  # Suryalog data is logged every 5 minutes
+
+transformer = Transformer.from_files()
+payload_tags = transformer.payload_tags
+
+
+class SuryalogError(Exception):
+    pass
 
-logging.basicConfig(level=logging.INFO)
 
+class RateLimiter:
+    """Spaces out calls to `wait` to at most `rate` per second."""
 
-def load_json_file(file_name):
-    with open(file_name) as f:
-        return json.load(f)
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = 0
+        self._lock = asyncio.Lock()
 
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
 
-sample_response = load_json_file("./samples/suryalog-api-response.json")
-device_mapping = load_json_file("device_mapping.json")
-device_param_mapping = load_json_file("suryalog_mapping.json")
-payload_tags = load_json_file("payload_tags.json")
 
+def get_plants():
+    """The `(plant, uid)` pairs to collect, from the environment.
 
-def ingest(timestamp=int(time.time())):
-    rem = timestamp % 300
-    stime = timestamp - rem
-    etime = stime + 300
-    print(stime, etime)
+    Only `SURYALOG_PLANT` falls back to `DEFAULT_UID`: readings are stored by
+    uid, plants sharing one would overwrite each other.
+    """
+    if SURYALOG_PLANTS:
+        plants = []
+        for item in SURYALOG_PLANTS.split(","):
+            plant, _, uid = item.strip().partition(":")
+            if not plant or not uid:
+                raise SystemExit(f"SURYALOG_PLANTS entry {item.strip()!r} is not <plant>:<uid>")
+            plants.append((plant, uid))
+        uids = [uid for _, uid in plants]
+        duplicates = sorted({uid for uid in uids if uids.count(uid) > 1})
+        if duplicates:
+            raise SystemExit(f"SURYALOG_PLANTS uids used more than once: {', '.join(duplicates)}")
+        return plants
+    return [(SURYALOG_PLANT, DEFAULT_UID)]
 
+
+def get_window(timestamp):
+    stime = timestamp - timestamp % INTERVAL
+    return stime, stime + INTERVAL
+
+
+async def fetch(client, plant, stime, etime):
+    """Fetch the Suryalog data of `plant` between `stime` and `etime`."""
     json_payload = {
         "secret": SURYALOG_SECRET,
-        "plant": SURYALOG_PLANT,
+        "plant": plant,
         "format": "std",
         "for": "data",
         "stime": stime,
         "etime": etime,
     }
 
-    response = httpx.post(
-        "https://master.suryalog.com/api/get_datalog_v1.php", json=json_payload
-    )
+    response = await client.post(SURYALOG_URL, json=json_payload)
 
     json_content = json.loads(response.content)
     if not json_content["result"] == 0:
-        logging.error(f"Invalid result {json_content['result']}")
-        exit(1)
+        raise SuryalogError(f"Invalid result {json_content['result']}")
     if not json_content["data"]:
-        logging.error("Missing data in response")
-        exit(1)
+        raise SuryalogError("Missing data in response")
     if not isinstance(json_content["data"], dict):
-        logging.error(f"Invalid data type {type(json_content['data']).__name__}")
-        exit(1)
+        raise SuryalogError(f"Invalid data type {type(json_content['data']).__name__}")
 
     logging.info(
         f"Data collection from {json_payload['stime']} to {json_payload['etime']}: {json_content['cmsg']} ({response.status_code}); Server Time: {json_content['server_time']}; Data Count: {len(json_content['data'].keys())}"
     )
 
-    device_data_at_interval = json_content["data"]
-
-    UID = "SLM00E923M"
-    count = 1
-    for sensor_time in device_data_at_interval:
-        point_device_data = device_data_at_interval[sensor_time]
-        formatted_data = {}
-
-        for device_name in point_device_data:
-            device_type = device_mapping[device_name]
-            param_map = device_param_mapping[device_type]
-            device_tags = payload_tags[device_type]
-            specific_device_data = point_device_data[device_name]
-            device_payload_data = []
-            if device_type not in formatted_data:
-                formatted_data[device_type] = []
-            for param in device_tags:
-                if param == "devType":
-                    device_payload_data.append(device_name)
-                    continue
-
-                if param == "devName":
-                    device_payload_data.append(device_name)
-                    continue
-
-                if param in param_map:
-                    mapped_param = param_map[param]
-                    # Here we are fetching the mapped param from the actual data response
-                    device_payload_data.append(
-                        specific_device_data.get(mapped_param, None)
-                    )
-                else:
-                    # Since there is no mapping found for param, just make it None which will be null inJSON
-                    device_payload_data.append(None)
+    return json_content["data"]
 
-            formatted_data[device_type].append(device_payload_data)
 
-        payload = {
+def build_payloads(uid, data):
+    """Format a Suryalog `data` dict as one `/api/v1/data/` payload per interval.
+
+    `Data` comes last, so that `/api/v1/data/stream/` reads its rows as they
+    arrive.
+    """
+    return [
+        {
             "Tags": payload_tags,
+            "UID": uid,
+            "Timestamp": sensor_time,
             "Data": formatted_data,
-            "UID": UID,
-            "Timestamp": int(sensor_time),
         }
+        for sensor_time, formatted_data in transformer.transform(data).items()
+    ]
+
+
+def build_batch(uid, payloads):
+    """Merge single-interval payloads into one `/api/v1/data/batch/` payload."""
+    return {
+        "Tags": payload_tags,
+        "UID": uid,
+        "Intervals": [
+            {"Timestamp": payload["Timestamp"], "Data": payload["Data"]}
+            for payload in payloads
+        ],
+    }
+
+
+def describe(payload):
+    if "Intervals" in payload:
+        timestamps = [interval["Timestamp"] for interval in payload["Intervals"]]
+        return f"batch of {len(timestamps)} intervals ({min(timestamps)} - {max(timestamps)})"
+    return f"payload for timestamp {payload['Timestamp']}"
+
+
+def encode(payload):
+    """Body and headers of `payload` in the configured wire format."""
+    if SCADA_API_FORMAT == "msgpack":
+        body = msgpack.packb(payload)
+        headers = {"Content-Type": "application/msgpack"}
+    else:
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        headers = {"Content-Type": "application/json"}
+    if SCADA_API_COMPRESSION == "gzip":
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+async def push(client, payload, semaphore, retries=3, backoff=1.0):
+    """POST `payload` to the API, retrying transport errors and 5xx responses."""
+    url = SCADA_BATCH_API_URL if "Intervals" in payload else SCADA_API_URL
+    body, headers = encode(payload)
+    async with semaphore:
+        for attempt in range(retries + 1):
+            try:
+                r = await client.post(url, content=body, headers=headers)
+                if r.status_code < 500:
+                    logging.info(
+                        f"Sent {describe(payload)}: Response {r.status_code} {r.text}"
+                    )
+                    return r
+                reason = f"Response {r.status_code}"
+            except httpx.TransportError as e:
+                reason = repr(e)
+
+            if attempt < retries:
+                logging.warning(f"Sending {describe(payload)} failed ({reason}), retrying")
+                await asyncio.sleep(backoff * 2**attempt)
+
+        logging.error(
+            f"Giving up on {describe(payload)} after {retries + 1} attempts ({reason})"
+        )
+
+
+async def send(client, spool, position, payload, semaphore, retries=3):
+    """Push a spooled payload and acknowledge it once the API answered.
+
+    Payloads rejected with a `4xx` are acknowledged too, sending them again
+    would not help.
+    """
+    r = await push(client, payload, semaphore, retries)
+    if r is None:
+        return False
+    spool.ack(position)
+    return True
+
+
+async def replay(client, spool, concurrency, retries):
+    """Send again the spooled payloads that were never acknowledged."""
+    pending = list(spool.pending())
+    if not pending:
+        return
+    logging.info(f"Replaying {len(pending)} spooled payloads")
+    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(
+        *(
+            send(client, spool, position, payload, semaphore, retries)
+            for position, payload in pending
+        )
+    )
+
+
+async def ingest(
+    client, spool, plant, uid, timestamp, semaphore, retries=3, batch=False
+):
+    stime, etime = get_window(timestamp)
+    device_data_at_interval = await fetch(client, plant, stime, etime)
+
+    payloads = build_payloads(uid, device_data_at_interval)
+    if batch and payloads:
+        # The whole window in a single request
+        payloads = [build_batch(uid, payloads)]
+
+    positions = [spool.append(payload) for payload in payloads]
+    await asyncio.gather(
+        *(
+            send(client, spool, position, payload, semaphore, retries)
+            for position, payload in zip(positions, payloads)
+        )
+    )
+
+
+async def collect(client, spool, plants, timestamp, concurrency, retries, batch=False):
+    """Collect the window of `timestamp` for all `plants` concurrently."""
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(
+        *(
+            ingest(client, spool, plant, uid, timestamp, semaphore, retries, batch)
+            for plant, uid in plants
+        ),
+        return_exceptions=True,
+    )
+    for (plant, uid), result in zip(plants, results):
+        if isinstance(result, Exception):
+            logging.error(f"Collection failed for plant {uid}: {result!r}")
+
 
-        with open(f"payload_{count}.json", "w") as f:
-            json.dump(payload, f, indent=4)
-            count += 1
+async def stored_timestamps(client, uid, stime, etime):
+    """Timestamps between `stime` and `etime` already stored by the API."""
+    r = await client.get(
+        SCADA_TIMESTAMPS_API_URL.format(uid=uid), params={"from": stime, "to": etime}
+    )
+    r.raise_for_status()
+    return set(r.json()["timestamps"])
+
+
+def load_checkpoint(path, window):
+    """Completed backfill windows as `{uid: set of stime}`."""
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if checkpoint["window"] != window:
+        logging.warning(
+            f"Ignoring checkpoint {path} of {checkpoint['window']}s windows"
+        )
+        return {}
+    return {uid: set(done) for uid, done in checkpoint["done"].items()}
+
+
+def save_checkpoint(path, window, done):
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(
+            {"window": window, "done": {uid: sorted(d) for uid, d in done.items()}},
+            f,
+        )
+    os.replace(f"{path}.tmp", path)
+
+
+async def backfill_window(
+    client, spool, plant, uid, stime, etime, limiter, fetch_semaphore, semaphore, args
+):
+    """Fetch one backfill window and send the intervals not stored yet.
+
+    Returns whether the window is complete.
+    """
+    stored = await stored_timestamps(client, uid, stime, etime)
+    if len(stored) >= (etime - stime) // INTERVAL:
+        logging.info(f"Skipping {uid} {stime} - {etime}, already stored")
+        return True
+
+    async with fetch_semaphore:
+        await limiter.wait()
+        try:
+            data = await fetch(client, plant, stime, etime)
+        except SuryalogError as e:
+            logging.error(f"Backfill of {uid} {stime} - {etime} failed: {e}")
+            return False
+
+    data = {
+        sensor_time: point_device_data
+        for sensor_time, point_device_data in data.items()
+        if stime <= int(sensor_time) < etime and int(sensor_time) not in stored
+    }
+    if not data:
+        return True
+
+    # The batch endpoint stores the whole window in one transaction
+    payload = build_batch(uid, build_payloads(uid, data))
+    position = spool.append(payload)
+    return await send(client, spool, position, payload, semaphore, args.retries)
+
+
+async def backfill(client, spool, plants, start, end, args):
+    """Collect every window between `start` and `end` not collected yet."""
+    window = args.window - args.window % INTERVAL or INTERVAL
+    start = get_window(start)[0]
+    done = load_checkpoint(args.checkpoint, window)
+
+    def windows():
+        for plant, uid in plants:
+            for stime in range(start, end, window):
+                if stime not in done.get(uid, ()):
+                    yield plant, uid, stime, min(stime + window, end)
+
+    total = sum(1 for _ in windows())
+    logging.info(f"Backfilling {total} windows of {window}s")
+
+    limiter = RateLimiter(args.rate)
+    fetch_semaphore = asyncio.Semaphore(args.fetch_concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    failed = 0
+
+    async def run(plant, uid, stime, etime):
+        nonlocal failed
+        try:
+            complete = await backfill_window(
+                client,
+                spool,
+                plant,
+                uid,
+                stime,
+                etime,
+                limiter,
+                fetch_semaphore,
+                semaphore,
+                args,
+            )
+        except Exception as e:
+            # A malformed response only fails its own window
+            logging.error(f"Backfill of {uid} {stime} - {etime} failed: {e!r}")
+            failed += 1
+            return
+        if complete:
+            done.setdefault(uid, set()).add(stime)
+            save_checkpoint(args.checkpoint, window, done)
+        else:
+            failed += 1
+
+    async def worker(pending):
+        for w in pending:
+            await run(*w)
 
-        r = httpx.post(
-            "http://localhost:8000/api/v1/data/", json=payload
-        )  # must be JSON serializable
-        logging.info(
-            f"Sent payload for timestamp {sensor_time}: Response {r.status_code} {r.text}"
+    # A fixed pool of workers takes the windows in turn, so that only the
+    # windows in progress exist at any time
+    pending = windows()
+    await asyncio.gather(
+        *(worker(pending) for _ in range(args.fetch_concurrency + args.concurrency))
+    )
+
+    if failed:
+        logging.warning(
+            f"{failed} windows could not be backfilled, run the backfill again to retry them"
         )
 
 
-while True:
-    timestamp = int(time.time())
-    ingest(timestamp - 300)  # Prev 5 min
-    time.sleep(300)
+async def main(args):
+    if SCADA_API_FORMAT not in ("json", "msgpack"):
+        raise SystemExit(f"Unknown SCADA_API_FORMAT {SCADA_API_FORMAT}")
+    if SCADA_API_FORMAT == "msgpack" and msgpack is None:
+        raise SystemExit("SCADA_API_FORMAT=msgpack needs the msgpack package")
+    if SCADA_API_COMPRESSION not in ("gzip", "none"):
+        raise SystemExit(f"Unknown SCADA_API_COMPRESSION {SCADA_API_COMPRESSION}")
+
+    plants = get_plants()
+    limits = httpx.Limits(
+        max_connections=args.concurrency + len(plants),
+        max_keepalive_connections=args.concurrency + len(plants),
+    )
+    spool = Spool(SURYALOG_SPOOL_DIR, fsync=SURYALOG_SPOOL_FSYNC)
+    try:
+        async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+            if args.replay:
+                await replay(client, spool, args.concurrency, args.retries)
+                return
+
+            if args.backfill is not None:
+                await backfill(client, spool, plants, *args.backfill, args)
+                return
+
+            if args.timestamp is not None:
+                await collect(
+                    client,
+                    spool,
+                    plants,
+                    args.timestamp,
+                    args.concurrency,
+                    args.retries,
+                    args.batch,
+                )
+                return
+
+            while True:
+                # Payloads left over by an API outage go first
+                await replay(client, spool, args.concurrency, args.retries)
+                timestamp = int(time.time())
+                # Prev 5 min
+                await collect(
+                    client,
+                    spool,
+                    plants,
+                    timestamp - INTERVAL,
+                    args.concurrency,
+                    args.retries,
+                    args.batch,
+                )
+                await asyncio.sleep(INTERVAL)
+    finally:
+        spool.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--timestamp",
+        type=int,
+        help="Collect the 5 minute window of this timestamp once and exit",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Maximum number of payloads sent to the API at the same time",
+    )
+    parser.add_argument(
+        "--retries", type=int, default=3, help="Retries of a failed API request"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="HTTP timeout in seconds"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Send each window in a single request to the batch endpoint",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="Send the spooled payloads that were never acknowledged and exit",
+    )
+    parser.add_argument(
+        "--backfill",
+        type=int,
+        nargs=2,
+        metavar=("FROM", "TO"),
+        help="Collect the intervals between these timestamps not stored yet and exit",
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=3600,
+        help="Seconds of data fetched from Suryalog per backfill request",
+    )
+    parser.add_argument(
+        "--fetch-concurrency",
+        type=int,
+        default=2,
+        help="Maximum number of backfill requests to Suryalog at the same time",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1,
+        help="Maximum number of backfill requests to Suryalog per second",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default="backfill.json",
+        help="File recording the completed backfill windows, to resume",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -17,7 +17,8 @@ except Exception as e:
     sys.exit(1)
 
 # Depends on Django setup
-from scada.models import Inverter, SCB, SCBString, Plant, Weather, Meter
+from scada.models import Inverter, SCB, Plant, Weather, Meter
+from scada.strings import STRING_FIELDS
 
 
 dev_types = {
@@ -62,11 +63,9 @@ def generate_sample(device):
         scb_fields = [
             f
             for f in model_map[device]._meta.get_fields()
-            if f.name not in ("id", "uid", "scb", "timestamp")
-        ]
-        scbstring_fields = [
-            f for f in SCBString._meta.get_fields() if f.name not in ("id", "scb")
+            if f.name not in ("id", "uid", "scb", "timestamp", "_scb_strings")
         ]
+        scbstring_fields = [models.FloatField(name=name) for name in STRING_FIELDS]
         fields = scb_fields + scbstring_fields
     else:
         fields = [
@@ -1,10 +1,12 @@
 from django.contrib import admin
-from scada.models import Inverter, Plant, Meter, Weather, SCB, SCBString
+from scada.models import Inverter, Plant, Meter, Weather, SCB, LatestReading, Rollup, IngestReceipt
 
 admin.site.register(Inverter)
 admin.site.register(Plant)
 admin.site.register(Meter)
 admin.site.register(Weather)
 admin.site.register(SCB)
-admin.site.register(SCBString)
+admin.site.register(LatestReading)
+admin.site.register(Rollup)
+admin.site.register(IngestReceipt)
 
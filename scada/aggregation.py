@@ -0,0 +1,110 @@
+"""Time-bucketed aggregation of device readings, computed in SQL."""
+
+from django.db.models import (
+    Avg,
+    Count,
+    ExpressionWrapper,
+    F,
+    IntegerField,
+    Max,
+    Min,
+    Sum,
+    Window,
+)
+from django.db.models.functions import RowNumber
+
+BUCKETS = {
+    "15m": 15 * 60,
+    "1h": 60 * 60,
+    "1d": 24 * 60 * 60,
+}
+
+AGGREGATES = {
+    "avg": Avg,
+    "min": Min,
+    "max": Max,
+    "sum": Sum,
+    "count": Count,
+}
+
+AGGREGATE_CHOICES = ["avg", "min", "max", "sum", "last"]
+
+GROUP_FIELDS = ["uid", "devName", "bucket"]
+
+
+def bucket_expression(seconds):
+    # Integer division on an integer column floors on SQLite and PostgreSQL
+    return ExpressionWrapper(
+        F("timestamp") / seconds * seconds, output_field=IntegerField()
+    )
+
+
+def grouped_aggregates(queryset, lookups, seconds, functions):
+    """Run `functions` (keys of `AGGREGATES`) over `lookups` per device and
+    bucket. Yields `((uid, devName, bucket), row)` where `row` holds the
+    number of `readings` and a `{field}__{function}` value per aggregate.
+    """
+    annotations = {"readings": Count("pk")}
+    for field, lookup in lookups.items():
+        for function in functions:
+            annotations[f"{field}__{function}"] = AGGREGATES[function](lookup)
+
+    rows = (
+        queryset.annotate(bucket=bucket_expression(seconds))
+        .values(*GROUP_FIELDS)
+        .annotate(**annotations)
+        .order_by(*GROUP_FIELDS)
+    )
+    for row in rows:
+        yield tuple(row[name] for name in GROUP_FIELDS), row
+
+
+def last_values(queryset, lookups, seconds):
+    """Values of the latest reading of every device and bucket.
+
+    There is no portable `last` aggregate, so the latest row of every group
+    is picked with a window function. Returns
+    `{(uid, devName, bucket): (timestamp, {field: value})}`.
+    """
+    latest = (
+        queryset.annotate(
+            bucket=bucket_expression(seconds),
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F("uid"), F("devName"), bucket_expression(seconds)],
+                order_by=[F("timestamp").desc(), F("pk").desc()],
+            ),
+        )
+        .filter(row_number=1)
+        .values_list(*GROUP_FIELDS, "timestamp", *lookups.values())
+    )
+    return {row[:3]: (row[3], dict(zip(lookups, row[4:]))) for row in latest}
+
+
+def aggregate_readings(queryset, lookups, seconds, functions):
+    """Aggregate `queryset` per device and time bucket of `seconds`.
+
+    `lookups` maps output field names to ORM lookups or expressions: the SCB
+    string currents are `StringCurrent` expressions over the packed
+    `_scb_strings` column, which only SQLite can evaluate (with the
+    `scb_string` function registered on its connections). Returns one dict
+    per (uid, devName, bucket) with a `count` and a `{function: value}` dict
+    per field.
+    """
+    latest = last_values(queryset, lookups, seconds) if "last" in functions else {}
+    rows = grouped_aggregates(
+        queryset, lookups, seconds, [f for f in functions if f != "last"]
+    )
+    for key, row in rows:
+        result = dict(zip(GROUP_FIELDS, key))
+        result["count"] = row["readings"]
+        for field in lookups:
+            result[field] = {
+                function: (
+                    latest[key][1][field]
+                    if function == "last"
+                    else row[f"{field}__{function}"]
+                )
+                for function in functions
+            }
+        yield result
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ScadaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'scada'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from scada.strings import register_functions
+
+        connection_created.connect(register_functions)
+
+        if getattr(settings, "SCADA_FAST_VALIDATION", False):
+            # Compile the row validators at startup rather than on the
+            # first request
+            from scada.validation import get_row_validator
+            from scada.views import SERIALIZER_MAPPING
+
+            for Serializer in SERIALIZER_MAPPING.values():
+                get_row_validator(Serializer)
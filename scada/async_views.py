@@ -0,0 +1,163 @@
+"""Async versions of the ingestion and read views, for ASGI servers.
+
+Enabled with `SCADA_ASYNC_VIEWS`. These views read through Django's async
+ORM and hand their writes to the writer thread of `scada.ingest_queue`, so
+no request holds a thread while SQLite writes.
+"""
+
+import asyncio
+import inspect
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .cache import (
+    aget_plant_snapshot,
+    aplant_snapshot_version,
+    aset_plant_snapshot,
+    plant_etag,
+)
+from .ingest import save_readings
+from .ingest_queue import get_ingest_timeout
+from .live import KEEPALIVE, get_plant_feed
+from .partitions import archive_horizons
+from .serializers import PlantDataResponseSerializer
+from .views import (
+    DataView,
+    IngestTimeout,
+    InverterDetailView,
+    PlantDataView,
+    PlantStreamView,
+)
+
+
+class AsyncAPIView(APIView):
+    """`APIView` whose handlers are coroutines.
+
+    DRF only calls sync handlers, this dispatch runs the same steps around
+    an awaited one. Authentication, permissions and throttling run in a
+    thread: the authenticators query the database synchronously.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(
+                    self, request.method.lower(), self.http_method_not_allowed
+                )
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncDataView(AsyncAPIView, DataView):
+    async def post(self, request):
+        # Read from here: connections of the validation thread are not
+        # closed at the end of the request
+        self.archive_horizons = await sync_to_async(archive_horizons)()
+        # Parsing and validation are CPU bound, keep them off the event loop
+        validated, errors = await sync_to_async(
+            self._read_payload, thread_sensitive=False
+        )(request)
+
+        rows_by_model = self._rows_by_model(validated)
+        if not getattr(settings, "SCADA_INGEST_QUEUE", False):
+            await sync_to_async(save_readings)(rows_by_model)
+            return self._created_response(errors)
+
+        # Receipts are stored by the writer too, the request only queues
+        job = self._submit(request, rows_by_model, errors)
+        future = job.accepted if job.receipt_id else job.future
+        try:
+            # Shielded: cancelling the wait must not cancel the job
+            await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)), get_ingest_timeout()
+            )
+        except TimeoutError:
+            raise IngestTimeout()
+        if job.receipt_id:
+            return self._accepted_response(job)
+        return self._created_response(errors)
+
+
+class AsyncPlantDataView(AsyncAPIView, PlantDataView):
+    async def get(self, request, uid):
+        version = await aplant_snapshot_version(uid)
+        etag = plant_etag(uid, version)
+        if self._not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        data = await aget_plant_snapshot(uid, version)
+        if data is None:
+            # Picking the tables to read takes queries too
+            latest_data = await sync_to_async(self._get_latest_data)(uid)
+            data = {
+                device_type: [
+                    reading for queryset in querysets async for reading in queryset
+                ]
+                for device_type, querysets in latest_data.items()
+            }
+            data = PlantDataResponseSerializer(data).data
+            await aset_plant_snapshot(uid, version, data)
+
+        return Response(data, status=status.HTTP_200_OK, headers={"ETag": etag})
+
+
+class AsyncInverterDetailView(AsyncAPIView, InverterDetailView):
+    async def get(self, request, devName):
+        querysets, fields, limit, layout = await sync_to_async(self._get_rows)(
+            request, devName
+        )
+        # The page is fetched at once: `aiterator()` cannot stream the
+        # `values_list()` querysets
+        rows = []
+        for queryset in querysets:
+            rows += [row async for row in queryset[: limit + 1 - len(rows)]]
+            if len(rows) > limit:
+                break
+        if layout == "columnar":
+            content = self._render_columnar(rows, fields, limit)
+        else:
+            content = self._stream_rows(rows, fields, limit)
+        return StreamingHttpResponse(
+            self._aiter(content), content_type="application/json"
+        )
+
+    async def _aiter(self, chunks):
+        for chunk in chunks:
+            yield chunk
+
+
+class AsyncPlantStreamView(AsyncAPIView, PlantStreamView):
+    """`PlantStreamView` without a thread per client."""
+
+    async def get(self, request, uid):
+        return self._event_stream(self._aevents(uid))
+
+    async def _aevents(self, uid):
+        feed = get_plant_feed()
+        subscription = feed.subscribe(uid, loop=asyncio.get_running_loop())
+        try:
+            while True:
+                events = await subscription.aget(timeout=self._keepalive())
+                yield b"".join(events) or KEEPALIVE
+        finally:
+            feed.unsubscribe(subscription)
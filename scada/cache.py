@@ -0,0 +1,97 @@
+"""Cache of the serialized `/api/v1/plant/<uid>/` snapshot.
+
+Every uid has a version number in the cache. Snapshots are stored under
+the version they were computed for and the ingestion path bumps the
+version once its transaction commits, so a snapshot computed concurrently
+with an ingestion can never be served after it. The version also doubles
+as the ETag, which lets unchanged polls be answered from the cache alone.
+
+Works with any Django cache backend. The default local-memory backend is
+per process: run a shared backend (Redis, Memcached) when several worker
+processes serve the API.
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def _cache():
+    return caches[getattr(settings, "SCADA_PLANT_CACHE", "default")]
+
+
+def _version_key(uid):
+    return f"scada:plant:{uid}:version"
+
+
+def _snapshot_key(uid, version):
+    return f"scada:plant:{uid}:{version}"
+
+
+def plant_snapshot_version(uid):
+    cache = _cache()
+    version = cache.get(_version_key(uid))
+    if version is None:
+        # A fresh starting point, so that versions (and ETags) handed out
+        # before the key was evicted are never reused
+        version = time.time_ns()
+        if not cache.add(_version_key(uid), version, timeout=None):
+            version = cache.get(_version_key(uid), version)
+    return version
+
+
+def plant_etag(uid, version):
+    return f'"{uid}-{version}"'
+
+
+def get_plant_snapshot(uid, version):
+    return _cache().get(_snapshot_key(uid, version))
+
+
+def set_plant_snapshot(uid, version, data):
+    _cache().set(
+        _snapshot_key(uid, version),
+        data,
+        timeout=getattr(settings, "SCADA_PLANT_CACHE_TIMEOUT", 300),
+    )
+
+
+def invalidate_plant_snapshot(uid):
+    try:
+        _cache().incr(_version_key(uid))
+    except ValueError:
+        # No version yet: the next read starts a new one anyway
+        pass
+
+
+def invalidate_plant_snapshots(uids):
+    """Invalidate the snapshots of every plant of `uids`.
+
+    Call it whenever `LatestReading` rows are written or deleted, once the
+    transaction commits.
+    """
+    for uid in uids:
+        invalidate_plant_snapshot(uid)
+
+
+async def aplant_snapshot_version(uid):
+    cache = _cache()
+    version = await cache.aget(_version_key(uid))
+    if version is None:
+        version = time.time_ns()
+        if not await cache.aadd(_version_key(uid), version, timeout=None):
+            version = await cache.aget(_version_key(uid), version)
+    return version
+
+
+async def aget_plant_snapshot(uid, version):
+    return await _cache().aget(_snapshot_key(uid, version))
+
+
+async def aset_plant_snapshot(uid, version, data):
+    await _cache().aset(
+        _snapshot_key(uid, version),
+        data,
+        timeout=getattr(settings, "SCADA_PLANT_CACHE_TIMEOUT", 300),
+    )
@@ -0,0 +1,186 @@
+"""Columnar export of device readings, as Parquet or Arrow IPC.
+
+Readings are read from the device table and its archived months with
+chunked cursors (`iterator`), `chunk_size` rows at a time, and each chunk
+becomes an Arrow record batch. Parquet files get a row group per
+`row_group_size` rows, Arrow streams a record batch per chunk, and the
+output is yielded as it is written, so memory use does not grow with the
+exported range.
+
+Columns keep their types: `timestamp` is a UTC timestamp, the SCB string
+currents are float32 like their packed storage, and missing values are
+nulls. Needs the optional `pyarrow` package.
+"""
+
+import itertools
+
+from django.db.models import Q
+
+from .partitions import reading_querysets
+from .strings import STRING_FIELDS, unpack_strings
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# File extension of every format
+EXPORT_FORMATS = {
+    "parquet": "parquet",
+    "arrow": "arrows",
+}
+
+EXPORT_CHUNK_SIZE = 10000
+EXPORT_ROW_GROUP_SIZE = 100000
+
+# Arrow types of the model fields, by internal type
+ARROW_TYPES = {
+    "CharField": "string",
+    "IntegerField": "int64",
+    "BigIntegerField": "int64",
+    "FloatField": "float64",
+    "BooleanField": "bool_",
+}
+
+
+def export_columns(model):
+    """Names of the exportable columns of `model`, in model order: its
+    fields without the primary key, the SCB string currents in place of
+    their packed column."""
+    columns = []
+    for field in model._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        if field.name == "_scb_strings":
+            columns.extend(STRING_FIELDS)
+        else:
+            columns.append(field.name)
+    return columns
+
+
+def arrow_schema(model, columns):
+    types = {}
+    for field in model._meta.concrete_fields:
+        if field.name == "timestamp":
+            types[field.name] = pyarrow.timestamp("s", tz="UTC")
+        elif field.get_internal_type() in ARROW_TYPES:
+            types[field.name] = getattr(
+                pyarrow, ARROW_TYPES[field.get_internal_type()]
+            )()
+    types.update({name: pyarrow.float32() for name in STRING_FIELDS})
+    return pyarrow.schema([(column, types[column]) for column in columns])
+
+
+def export_readings(
+    model,
+    columns,
+    format="parquet",
+    uid=None,
+    dev_names=None,
+    start=None,
+    end=None,
+    chunk_size=EXPORT_CHUNK_SIZE,
+    row_group_size=EXPORT_ROW_GROUP_SIZE,
+):
+    """Yield the bytes of the readings of `model` exported as `format` (a
+    key of `EXPORT_FORMATS`), with the given `columns` of `export_columns`.
+
+    Readings are filtered on `uid`, `dev_names` and the `start` (inclusive)
+    to `end` (exclusive) time range, and ordered by time.
+    """
+    schema = arrow_schema(model, columns)
+    sink = _Sink()
+    if format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+
+    with writer:
+        pending = []
+        pending_rows = 0
+        for batch in _record_batches(
+            model, columns, schema, uid, dev_names, start, end, chunk_size
+        ):
+            if format != "parquet":
+                writer.write_batch(batch)
+                yield sink.take()
+                continue
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= row_group_size:
+                writer.write_table(
+                    pyarrow.Table.from_batches(pending), row_group_size=row_group_size
+                )
+                pending = []
+                pending_rows = 0
+                yield sink.take()
+        if pending:
+            writer.write_table(
+                pyarrow.Table.from_batches(pending), row_group_size=row_group_size
+            )
+    yield sink.take()
+
+
+def _record_batches(model, columns, schema, uid, dev_names, start, end, chunk_size):
+    filters = Q()
+    if uid:
+        filters &= Q(uid=uid)
+    if dev_names:
+        filters &= Q(devName__in=dev_names)
+    if start is not None:
+        filters &= Q(timestamp__gte=start)
+    if end is not None:
+        filters &= Q(timestamp__lt=end)
+
+    strings = [column for column in columns if column in STRING_FIELDS]
+    fields = [column for column in columns if column not in STRING_FIELDS]
+    if strings:
+        # The currents are unpacked from their column, only once per row
+        fields.append("_scb_strings")
+        positions = [STRING_FIELDS.index(name) for name in strings]
+
+    for queryset in reading_querysets(model, start, end):
+        rows = (
+            queryset.filter(filters)
+            .order_by("timestamp", "pk")
+            .values_list(*fields)
+            .iterator(chunk_size)
+        )
+        for chunk in itertools.batched(rows, chunk_size):
+            values = dict(zip(fields, zip(*chunk)))
+            if strings:
+                currents = [
+                    unpack_strings(packed) for packed in values.pop("_scb_strings")
+                ]
+                for name, position in zip(strings, positions):
+                    values[name] = [row[position] for row in currents]
+            yield pyarrow.record_batch(
+                [
+                    pyarrow.array(values[column], field.type)
+                    for column, field in zip(columns, schema)
+                ],
+                schema=schema,
+            )
+
+
+class _Sink:
+    """File-like object the writers write to, emptied as it is read."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
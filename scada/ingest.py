@@ -0,0 +1,153 @@
+from django.db import connection, transaction
+from django.db.models import Q
+
+from scada.cache import invalidate_plant_snapshots
+from scada.live import get_plant_feed
+from scada.models import NATURAL_KEY, LatestReading, Rollup
+from scada.rollups import refresh_rollups, update_rollups
+
+
+def bulk_save(model, rows: list[dict]):
+    """Persist already validated rows of a single device table.
+
+    `rows` are the `validated_data` dicts produced by the device serializers.
+    Each table is written with one `bulk_create` (Django splits it into
+    batches that fit the backend's parameter limit), so callers should wrap
+    the calls in a transaction to get a single commit per payload.
+
+    Rows are upserted on their natural key: sending a reading again
+    overwrites the stored one instead of duplicating it.
+    """
+    if not rows:
+        return []
+
+    existing = _existing_keys(model, rows)
+    # SCB string currents (`strings`) are packed into their row
+    instances = _bulk_upsert(model, [model(**row) for row in rows])
+
+    new = [instance for instance in instances if _key(instance) not in existing]
+    update_latest_readings(model, instances)
+    update_rollups(Rollup, model, new)
+    if len(new) < len(instances):
+        # Replaced readings are already counted in their rollup buckets
+        replaced = [instance for instance in instances if _key(instance) in existing]
+        refresh_rollups(Rollup, model, replaced)
+
+    uids = {instance.uid for instance in instances}
+    # The readings are committed whatever happens to the cache or to the
+    # subscribers
+    transaction.on_commit(lambda: invalidate_plant_snapshots(uids), robust=True)
+    transaction.on_commit(
+        lambda: get_plant_feed().publish(model, instances), robust=True
+    )
+    return instances
+
+
+def save_readings(rows_by_model):
+    """Save the validated rows of several device tables in one transaction."""
+    with transaction.atomic():
+        for model, rows in rows_by_model.items():
+            bulk_save(model, rows)
+
+
+def _key(instance):
+    return tuple(getattr(instance, field) for field in NATURAL_KEY)
+
+
+def _existing_keys(model, rows):
+    """Natural keys of `rows` already stored.
+
+    This costs a query per payload and device table, answered from the
+    unique index of the natural key: the readings of an interval share
+    their plant and timestamp, so the query looks up one list of device
+    names per interval and device model.
+    """
+    devices = {}
+    for row in rows:
+        key = (row["uid"], row["devType"], row["timestamp"])
+        devices.setdefault(key, set()).add(row["devName"])
+    stored = Q(pk__in=[])
+    for (uid, devType, timestamp), dev_names in devices.items():
+        stored |= Q(uid=uid, devType=devType, timestamp=timestamp, devName__in=dev_names)
+    keys = {tuple(row[field] for field in NATURAL_KEY) for row in rows}
+    return keys & set(model.objects.filter(stored).values_list(*NATURAL_KEY))
+
+
+def _bulk_upsert(model, instances, unique_fields=NATURAL_KEY):
+    """Insert `instances`, updating the rows sharing their `unique_fields`.
+
+    Returns the instances actually written, with their primary keys set:
+    when a payload holds the same reading twice the last one wins.
+    """
+    instances = list(
+        {
+            tuple(getattr(instance, field) for field in unique_fields): instance
+            for instance in instances
+        }.values()
+    )
+    update_fields = [
+        field.name
+        for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in unique_fields
+    ]
+
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(
+            instances,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields,
+        )
+
+    # Without RETURNING the primary keys are not set on the instances, but
+    # they are needed to link latest readings.
+    for instance in instances:
+        instance.pk = (
+            model.objects.filter(
+                **{field: getattr(instance, field) for field in unique_fields}
+            )
+            .values_list("pk", flat=True)
+            .first()
+        )
+        instance.save(force_insert=instance.pk is None)
+    return instances
+
+
+def update_latest_readings(model, instances):
+    """Upsert the `LatestReading` of every device in `instances`.
+
+    Readings older than the one already recorded (backfills) are ignored.
+    """
+    device_type = model.__name__
+    latest = {}
+    for instance in instances:
+        key = (instance.uid, instance.devType, instance.devName)
+        if key not in latest or instance.timestamp >= latest[key].timestamp:
+            latest[key] = instance
+
+    current = LatestReading.objects.filter(
+        device_type=device_type,
+        uid__in={key[0] for key in latest},
+        devName__in={key[2] for key in latest},
+    ).values_list("uid", "devType", "devName", "timestamp")
+    for uid, devType, devName, timestamp in current:
+        key = (uid, devType, devName)
+        if key in latest and latest[key].timestamp < timestamp:
+            del latest[key]
+
+    LatestReading.objects.bulk_create(
+        [
+            LatestReading(
+                device_type=device_type,
+                uid=instance.uid,
+                devType=instance.devType,
+                devName=instance.devName,
+                timestamp=instance.timestamp,
+                reading_id=instance.pk,
+            )
+            for instance in latest.values()
+        ],
+        update_conflicts=True,
+        unique_fields=["device_type", "uid", "devType", "devName"],
+        update_fields=["timestamp", "reading_id"],
+    )
@@ -0,0 +1,263 @@
+"""Single writer of the ingestion endpoints.
+
+SQLite takes one writer at a time: requests writing on their own wait on
+the file lock and fail with `database is locked` once its timeout expires.
+Instead, the views submit their validated rows to `IngestQueue`, whose
+thread writes everything queued meanwhile in one transaction. While a
+transaction commits the next payloads pile up, so the busier the API, the
+more payloads each commit coalesces. Requests never write themselves.
+
+Payloads accepted with a receipt are stored in a pending `IngestReceipt` by
+the writer too, in one transaction for all the jobs it takes, before their
+rows are written. The `202` is sent once that transaction is committed,
+and the writer replays the pending receipts left by a previous process
+when it starts. The other payloads still queued when
+the process is killed are lost, their callers were not answered yet. The
+queue is drained when the interpreter exits normally.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .ingest import bulk_save
+from .models import IngestReceipt
+
+logger = logging.getLogger(__name__)
+
+
+class IngestJob:
+    """The validated rows of one payload, keyed by device model.
+
+    `future` is resolved once they are committed. Jobs with a `receipt_id`
+    record the outcome in their `IngestReceipt`, `accepted` is resolved
+    once it is stored.
+    """
+
+    def __init__(self, rows_by_model, receipt_id=None, errors=None):
+        self.rows_by_model = rows_by_model
+        self.receipt_id = receipt_id
+        self.errors = errors
+        self.accepted = Future()
+        self.future = Future()
+
+    @classmethod
+    def from_receipt(cls, receipt):
+        """Job of a pending receipt stored by a previous process."""
+        job = cls(
+            {
+                apps.get_model("scada", model_name): rows
+                for model_name, rows in receipt.payload.items()
+            },
+            receipt.id,
+            receipt.errors,
+        )
+        job.accepted.set_result(receipt.id)
+        return job
+
+    @property
+    def rows(self):
+        return sum(len(rows) for rows in self.rows_by_model.values())
+
+    def pending_receipt(self):
+        """Receipt holding the payload until it is written."""
+        return IngestReceipt(
+            id=self.receipt_id,
+            status=IngestReceipt.PENDING,
+            rows=self.rows,
+            errors=self.errors or None,
+            payload={
+                model.__name__: rows for model, rows in self.rows_by_model.items()
+            },
+            accepted_at=timezone.now(),
+        )
+
+
+class IngestQueue:
+    """Bounded queue of `IngestJob`s written by a single thread.
+
+    A transaction takes the jobs already queued, up to `max_rows` rows,
+    waiting up to `linger` seconds for more.
+    """
+
+    def __init__(self, maxsize=1000, max_rows=10000, linger=0.0):
+        self.queue = queue.Queue(maxsize)
+        self.max_rows = max_rows
+        self.linger = linger
+        # Pending receipts accepted from then on belong to this process
+        self.started_at = timezone.now()
+        self._thread = threading.Thread(
+            target=self._run, name="scada-ingest-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, rows_by_model, receipt=False, errors=None):
+        """Queue validated rows, raises `queue.Full` when the queue is full.
+
+        With a `receipt` the writer stores the payload in a pending receipt
+        before writing it, so that it survives the process.
+        """
+        job = IngestJob(rows_by_model, uuid.uuid4() if receipt else None, errors)
+        self.queue.put_nowait(job)
+        return job
+
+    def close(self, timeout=30):
+        """Write the queued jobs and stop the writer thread."""
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            self._replay()
+        except Exception:
+            logger.exception("Could not replay the pending receipts")
+            connection.close()
+
+        closing = False
+        while not closing:
+            job = self.queue.get()
+            if job is None:
+                return
+            jobs = [job]
+            rows = job.rows
+            deadline = time.monotonic() + self.linger
+            while rows < self.max_rows:
+                try:
+                    job = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if job is None:
+                    closing = True
+                    break
+                jobs.append(job)
+                rows += job.rows
+            jobs = self._accept(jobs)
+            if jobs:
+                self._write(jobs)
+
+    def _accept(self, jobs):
+        """Store the pending receipts of `jobs` in one transaction, returns
+        the jobs left to write."""
+        new = [job for job in jobs if job.receipt_id and not job.accepted.done()]
+        if not new:
+            return jobs
+        try:
+            with transaction.atomic():
+                IngestReceipt.objects.bulk_create([job.pending_receipt() for job in new])
+        except Exception as exc:
+            logger.exception("Could not store the pending receipts")
+            connection.close()
+            for job in new:
+                job.accepted.set_exception(exc)
+                job.future.set_exception(exc)
+            return [job for job in jobs if not job.future.done()]
+        for job in new:
+            job.accepted.set_result(job.receipt_id)
+        return jobs
+
+    def _replay(self):
+        """Write the payloads of the receipts left pending by a previous
+        process, killed before writing them.
+
+        With several processes, a receipt accepted by another one before
+        this one started may be written twice, which the upsert of the
+        readings makes harmless.
+        """
+        receipts = (
+            IngestReceipt.objects.filter(
+                status=IngestReceipt.PENDING, accepted_at__lt=self.started_at
+            )
+            .exclude(payload=None)
+            .order_by("accepted_at")
+        )
+        jobs = []
+        rows = 0
+        for receipt in receipts.iterator(chunk_size=100):
+            jobs.append(IngestJob.from_receipt(receipt))
+            rows += jobs[-1].rows
+            if rows >= self.max_rows:
+                self._write(jobs)
+                jobs = []
+                rows = 0
+        if jobs:
+            self._write(jobs)
+
+    def _write(self, jobs):
+        try:
+            with transaction.atomic():
+                rows_by_model = {}
+                for job in jobs:
+                    for model, rows in job.rows_by_model.items():
+                        rows_by_model.setdefault(model, []).extend(rows)
+                for model, rows in rows_by_model.items():
+                    bulk_save(model, rows)
+                IngestReceipt.objects.filter(
+                    pk__in=[job.receipt_id for job in jobs if job.receipt_id]
+                ).update(
+                    status=IngestReceipt.COMMITTED,
+                    payload=None,
+                    completed_at=timezone.now(),
+                )
+        except Exception as exc:
+            error = exc
+            # Start over on a new connection, in case it is the broken part
+            connection.close()
+        else:
+            for job in jobs:
+                job.future.set_result(job.rows)
+            return
+
+        if len(jobs) > 1:
+            # Write the payloads one by one to only fail the culprit
+            for job in jobs:
+                self._write([job])
+        else:
+            self._fail(jobs[0], error)
+
+    def _fail(self, job, exc):
+        logger.exception("Ingestion of a queued payload failed", exc_info=exc)
+        if job.receipt_id:
+            try:
+                IngestReceipt.objects.filter(pk=job.receipt_id).update(
+                    status=IngestReceipt.FAILED,
+                    payload=None,
+                    detail=str(exc),
+                    completed_at=timezone.now(),
+                )
+            except Exception:
+                logger.exception(f"Could not store the receipt {job.receipt_id}")
+                connection.close()
+        job.future.set_exception(exc)
+
+
+_ingest_queue = None
+_ingest_queue_lock = threading.Lock()
+
+
+def get_ingest_timeout():
+    """Seconds a request waits for the writer to commit its payload."""
+    return getattr(settings, "SCADA_INGEST_TIMEOUT", 30)
+
+
+def get_ingest_queue():
+    """The queue of this process, started on first use."""
+    global _ingest_queue
+    with _ingest_queue_lock:
+        if _ingest_queue is None:
+            _ingest_queue = IngestQueue(
+                maxsize=getattr(settings, "SCADA_INGEST_QUEUE_SIZE", 1000),
+                max_rows=getattr(settings, "SCADA_INGEST_MAX_ROWS", 10000),
+                linger=getattr(settings, "SCADA_INGEST_LINGER", 0.0),
+            )
+        return _ingest_queue
@@ -0,0 +1,165 @@
+"""Live feed of the readings ingested for each plant.
+
+Once an ingestion commits, its readings are published to the subscribers
+of their plant (`/api/v1/plant/<uid>/stream/`). An event is serialized and
+encoded once, whatever the number of subscribers, and nothing is read back
+from the database.
+
+Every subscriber has a bounded queue of events. When a slow client lets it
+fill up, its pending events are replaced by a `resync` event telling it to
+fetch the plant snapshot again, so publishing never waits for a client and
+a client never holds more than `maxsize` events in memory.
+
+The feed is per process: with several worker processes, a subscriber only
+sees the readings ingested by its own process.
+"""
+
+import asyncio
+import collections
+import json
+import threading
+
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import (
+    InverterSerializer,
+    MeterSerializer,
+    PlantSerializer,
+    SCBSerializer,
+    WeatherSerializer,
+)
+
+SERIALIZERS = {
+    Serializer.Meta.model: Serializer
+    for Serializer in (
+        PlantSerializer,
+        InverterSerializer,
+        MeterSerializer,
+        WeatherSerializer,
+        SCBSerializer,
+    )
+}
+
+
+def encode_event(event, data):
+    """A server-sent event, `data` being encoded as JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, cls=JSONEncoder)}\n\n".encode()
+
+
+RESYNC = encode_event("resync", {})
+# Sent when nothing happened for a while, so that proxies keep the
+# connection open and disconnected clients are noticed
+KEEPALIVE = b": keepalive\n\n"
+
+
+class Subscription:
+    """Events published for one plant, read by one client.
+
+    Read with `get` from a thread, or with `aget` from the event loop the
+    subscription was made on.
+    """
+
+    def __init__(self, uid, maxsize, loop=None):
+        self.uid = uid
+        self.maxsize = maxsize
+        self._events = collections.deque()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = loop
+        self._aready = asyncio.Event() if loop else None
+
+    def put(self, event):
+        with self._lock:
+            if len(self._events) >= self.maxsize:
+                self._events.clear()
+                self._events.append(RESYNC)
+            self._events.append(event)
+            self._ready.set()
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._aready.set)
+            except RuntimeError:
+                # The loop is closed, and the client with it
+                pass
+
+    def get(self, timeout=None):
+        """The pending events, waiting up to `timeout` seconds for some."""
+        self._ready.wait(timeout)
+        return self._drain()
+
+    async def aget(self, timeout=None):
+        try:
+            await asyncio.wait_for(self._aready.wait(), timeout)
+        except TimeoutError:
+            pass
+        self._aready.clear()
+        return self._drain()
+
+    def _drain(self):
+        with self._lock:
+            events = list(self._events)
+            self._events.clear()
+            self._ready.clear()
+        return events
+
+
+class PlantFeed:
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self._subscriptions = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, uid, loop=None):
+        """Subscribe to the readings of a plant. The first event is a
+        `resync`: the snapshot fetched after it misses no reading."""
+        subscription = Subscription(uid, self.maxsize, loop)
+        subscription.put(RESYNC)
+        with self._lock:
+            self._subscriptions[uid].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.uid)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.uid]
+
+    def publish(self, model, instances):
+        """Send newly committed readings of a device table to the
+        subscribers of their plants."""
+        with self._lock:
+            subscribers = {
+                uid: list(subscriptions)
+                for uid, subscriptions in self._subscriptions.items()
+            }
+        by_uid = collections.defaultdict(list)
+        for instance in instances:
+            if instance.uid in subscribers:
+                by_uid[instance.uid].append(instance)
+
+        Serializer = SERIALIZERS[model]
+        for uid, readings in by_uid.items():
+            event = encode_event(
+                "readings",
+                {model.__name__: Serializer(readings, many=True).data},
+            )
+            for subscription in subscribers[uid]:
+                subscription.put(event)
+
+
+_plant_feed = None
+_plant_feed_lock = threading.Lock()
+
+
+def get_plant_feed():
+    """The feed of this process, created on first use."""
+    global _plant_feed
+    with _plant_feed_lock:
+        if _plant_feed is None:
+            _plant_feed = PlantFeed(
+                maxsize=getattr(settings, "SCADA_LIVE_QUEUE_SIZE", 100),
+            )
+        return _plant_feed
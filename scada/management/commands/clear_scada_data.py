@@ -1,9 +1,14 @@
 from django.core.management.base import BaseCommand
 from django.apps import apps
-from django.db import connection
+from django.db import connection, transaction
+
+from scada.cache import invalidate_plant_snapshots
+from scada.models import LatestReading, ReadingPartition
+from scada.partitions import drop_partition
+from scada.retention import incremental_vacuum
 
 class Command(BaseCommand):
-    help = 'Clear all data from scada app tables'
+    help = 'Clear all data from scada app tables (see purge_readings to delete old readings)'
 
     def handle(self, *args, **options):
         # Get all models from the scada app
@@ -12,21 +17,41 @@ class Command(BaseCommand):
             if model._meta.app_label == 'scada'
         ]
         
-        # Disable foreign key checks
-        with connection.cursor() as cursor:
-            cursor.execute('PRAGMA foreign_keys = OFF;')
-            try:
-                # Delete data from each model
-                for model in scada_models:
-                    count = model.objects.count()
-                    model.objects.all().delete()
-                    self.stdout.write(
-                        self.style.SUCCESS(f'Deleted {count} records from {model._meta.db_table}')
-                    )
-            finally:
-                # Re-enable foreign key checks
-                cursor.execute('PRAGMA foreign_keys = ON;')
-        
+        # Plants with a non-empty snapshot, which all become empty
+        uids = set(LatestReading.objects.values_list('uid', flat=True).distinct())
+
+        # Archived months live in tables of their own
+        for partition in ReadingPartition.objects.all():
+            drop_partition(apps.get_model('scada', partition.device_type), partition)
+
+        if connection.vendor == 'sqlite':
+            # Disable foreign key checks
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA foreign_keys = OFF;')
+                try:
+                    self._delete_all(cursor, scada_models)
+                finally:
+                    # Re-enable foreign key checks
+                    cursor.execute('PRAGMA foreign_keys = ON;')
+        else:
+            # Foreign keys are checked at commit (Django creates them
+            # deferrable), once every table is empty
+            with transaction.atomic(), connection.cursor() as cursor:
+                self._delete_all(cursor, scada_models)
+
+        invalidate_plant_snapshots(uids)
+        if connection.vendor == 'sqlite':
+            incremental_vacuum()
         self.stdout.write(
             self.style.SUCCESS('Successfully cleared scada app data')
-        )
\ No newline at end of file
+        )
+
+    def _delete_all(self, cursor, models):
+        # A plain DELETE empties a table at once, where the ORM would load
+        # the rows and their relations first
+        for model in models:
+            table = model._meta.db_table
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(table)}')
+            self.stdout.write(
+                self.style.SUCCESS(f'Deleted {cursor.rowcount} records from {table}')
+            )
\ No newline at end of file
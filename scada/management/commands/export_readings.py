@@ -0,0 +1,122 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scada.export import (
+    EXPORT_CHUNK_SIZE,
+    EXPORT_FORMATS,
+    EXPORT_ROW_GROUP_SIZE,
+    export_columns,
+    export_readings,
+    pyarrow,
+)
+from scada.views import SERIALIZER_MAPPING, DeviceType
+
+
+class Command(BaseCommand):
+    help = 'Export the readings of a device type as a Parquet file or an Arrow IPC stream'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'device_type',
+            choices=[device_type.value for device_type in DeviceType],
+        )
+        parser.add_argument(
+            '--format',
+            choices=list(EXPORT_FORMATS),
+            default='parquet',
+            help='Output format (default parquet)',
+        )
+        parser.add_argument(
+            '--output',
+            help='Output file, <device type>.parquet or .arrows by default',
+        )
+        parser.add_argument('--uid', help='Only export the readings of this plant')
+        parser.add_argument(
+            '--dev-name',
+            action='append',
+            help='Only export this device (can be repeated)',
+        )
+        parser.add_argument(
+            '--from',
+            dest='start',
+            metavar='FROM',
+            help='Start date (YYYY-MM-DD) or timestamp, inclusive',
+        )
+        parser.add_argument(
+            '--to',
+            dest='end',
+            metavar='TO',
+            help='End date (YYYY-MM-DD) or timestamp, exclusive',
+        )
+        parser.add_argument(
+            '--fields',
+            help='Comma separated columns, all by default',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPORT_CHUNK_SIZE,
+            help=f'Readings fetched at a time (default {EXPORT_CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--row-group-size',
+            type=int,
+            default=EXPORT_ROW_GROUP_SIZE,
+            help=f'Readings per Parquet row group (default {EXPORT_ROW_GROUP_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        if pyarrow is None:
+            raise CommandError('Exports need the pyarrow package: pip install pyarrow')
+        if options['chunk_size'] < 1 or options['row_group_size'] < 1:
+            raise CommandError('--chunk-size and --row-group-size must be positive.')
+
+        device_type = options['device_type']
+        model = SERIALIZER_MAPPING[DeviceType(device_type)].Meta.model
+        columns = export_columns(model)
+        if options['fields']:
+            fields = [field for field in options['fields'].split(',') if field]
+            unknown = [field for field in fields if field not in columns]
+            if unknown:
+                raise CommandError(f'Unknown fields: {", ".join(unknown)}')
+            columns = fields
+        output = options['output'] or f'{device_type}.{EXPORT_FORMATS[options["format"]]}'
+
+        started = time.perf_counter()
+        size = 0
+        with open(output, 'wb') as file:
+            for data in export_readings(
+                model,
+                columns,
+                options['format'],
+                uid=options['uid'],
+                dev_names=options['dev_name'],
+                start=self._parse_time(options['start']),
+                end=self._parse_time(options['end']),
+                chunk_size=options['chunk_size'],
+                row_group_size=options['row_group_size'],
+            ):
+                file.write(data)
+                size += len(data)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Exported {device_type} readings to {output} '
+                f'({size / 1024 / 1024:.1f} MiB) in {time.perf_counter() - started:.2f}s'
+            )
+        )
+
+    def _parse_time(self, value):
+        if value is None:
+            return None
+        if value.isdigit():
+            return int(value)
+        try:
+            date = datetime.date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f'Invalid time {value}, expected YYYY-MM-DD or a timestamp.')
+        return int(
+            datetime.datetime.combine(date, datetime.time(), datetime.UTC).timestamp()
+        )
@@ -0,0 +1,206 @@
+import collections
+import concurrent.futures
+import json
+import os
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from scada.ingest import bulk_save
+from scada.partitions import archive_horizons, format_month
+from scada.validation import get_row_validator
+from scada.views import SERIALIZER_MAPPING, DeviceType
+from suryalog import Transformer
+
+# Rows written by a single `bulk_save` call
+WRITE_BATCH_SIZE = 5000
+
+# Transformer of the worker processes, built once per process
+_transformer = None
+
+
+def get_transformer():
+    global _transformer
+    if _transformer is None:
+        _transformer = Transformer.from_files(
+            settings.BASE_DIR / 'device_mapping.json',
+            settings.BASE_DIR / 'suryalog_mapping.json',
+            settings.BASE_DIR / 'payload_tags.json',
+        )
+    return _transformer
+
+
+def parse_file(path, uid):
+    """Transform and validate a Suryalog response dump.
+
+    Returns the validated rows `{timestamp: {device_type: rows}}` and the
+    error messages of the rejected rows.
+    """
+    with open(path) as f:
+        content = json.load(f)
+    if not isinstance(content, dict):
+        raise ValueError('Expected a Suryalog response object')
+    if content.get('result') != 0:
+        raise ValueError(f'Invalid result {content.get("result")}')
+    if not isinstance(content.get('data'), dict):
+        raise ValueError('Missing data in response')
+
+    transformer = get_transformer()
+    validated = {}
+    errors = []
+    for timestamp, formatted_data in transformer.transform(content['data']).items():
+        extra_fields = {'timestamp': timestamp, 'uid': uid}
+        intervals = validated[timestamp] = {}
+        for device_type, device_data in formatted_data.items():
+            rows, errs = get_row_validator(
+                SERIALIZER_MAPPING[DeviceType(device_type)]
+            ).validate(device_data, transformer.payload_tags[device_type], extra_fields)
+            if rows:
+                intervals[device_type] = rows
+            errors.extend(f'{timestamp} {device_type} {err}' for err in errs)
+    return validated, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Import archived Suryalog responses (shaped like '
+        'samples/suryalog-api-response.json) straight into the database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', metavar='file')
+        parser.add_argument(
+            '--uid',
+            required=True,
+            help='UID of the plant the responses belong to',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Processes parsing the files (default one per CPU, 0 to parse '
+            'in this process)',
+        )
+        parser.add_argument(
+            '--transaction-size',
+            type=int,
+            default=100000,
+            help='Readings written per transaction (default 100000)',
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 0 or options['transaction_size'] < 1:
+            raise CommandError(
+                '--workers must not be negative and --transaction-size must be positive.'
+            )
+        missing = [path for path in options['files'] if not os.path.isfile(path)]
+        if missing:
+            raise CommandError(f'No such files: {", ".join(missing)}')
+
+        self.uid = options['uid']
+        self.verbosity = options['verbosity']
+        self.horizons = archive_horizons()
+        self.imported = 0
+        self.rejected = 0
+        self.failed = 0
+
+        started = time.perf_counter()
+        batches = self._batches(options['files'], options['workers'])
+        done = False
+        while not done:
+            # Large transactions: a commit every `--transaction-size` readings
+            with transaction.atomic():
+                written = 0
+                for model, rows in batches:
+                    bulk_save(model, rows)
+                    written += len(rows)
+                    if written >= options['transaction_size']:
+                        break
+                else:
+                    done = True
+            self.imported += written
+        elapsed = time.perf_counter() - started
+
+        message = (
+            f'Imported {self.imported} readings from {len(options["files"]) - self.failed} '
+            f'files in {elapsed:.2f}s ({self.imported / elapsed:.0f} readings/s)'
+        )
+        if self.rejected:
+            message += f', {self.rejected} rejected'
+        self.stdout.write(self.style.SUCCESS(message))
+        if self.failed:
+            raise CommandError(f'{self.failed} files could not be imported.')
+
+    def _parse(self, files, workers):
+        """Yield every file with its `parse_file` result, or the exception
+        it raised, in order."""
+        if not workers:
+            for path in files:
+                try:
+                    yield path, parse_file(path, self.uid)
+                except Exception as exc:
+                    # A malformed dump only fails its own file
+                    yield path, exc
+            return
+
+        # Workers started with spawn or forkserver have to set Django up
+        # before this module can be imported
+        with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=django.setup
+        ) as executor:
+            # A few files ahead of the writes, so parsed rows do not pile up
+            queued = collections.deque()
+            for path in files:
+                queued.append((path, executor.submit(parse_file, path, self.uid)))
+                if len(queued) < 2 * workers:
+                    continue
+                yield self._result(*queued.popleft())
+            while queued:
+                yield self._result(*queued.popleft())
+
+    def _result(self, path, future):
+        try:
+            return path, future.result()
+        except Exception as exc:
+            return path, exc
+
+    def _batches(self, files, workers):
+        """Yield the `(model, rows)` to write, `WRITE_BATCH_SIZE` rows of a
+        device table at a time."""
+        pending = collections.defaultdict(list)
+        for path, result in self._parse(files, workers):
+            if isinstance(result, Exception):
+                self.failed += 1
+                self.stderr.write(f'{path}: {result!r}')
+                continue
+
+            validated, errors = result
+            self.rejected += len(errors)
+            self._report(path, errors)
+            for timestamp, intervals in validated.items():
+                for device_type, rows in intervals.items():
+                    model = SERIALIZER_MAPPING[DeviceType(device_type)].Meta.model
+                    horizon = self.horizons.get(model.__name__)
+                    if horizon is not None and timestamp < horizon:
+                        # Archived months are read-only, as for the API
+                        self.rejected += len(rows)
+                        self._report(
+                            path,
+                            [
+                                f'{timestamp} {device_type} Readings before '
+                                f'{format_month(horizon)} are archived.'
+                            ],
+                        )
+                        continue
+                    pending[model].extend(rows)
+                    if len(pending[model]) >= WRITE_BATCH_SIZE:
+                        yield model, pending.pop(model)
+        yield from pending.items()
+
+    def _report(self, path, errors):
+        if self.verbosity >= 2:
+            for error in errors:
+                self.stderr.write(f'{path} {error}')
@@ -0,0 +1,108 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+
+from scada.models import ReadingPartition
+from scada.partitions import (
+    archive_month,
+    drop_partition,
+    format_month,
+    month_start,
+    next_month,
+    parse_month,
+    partition_table,
+)
+from scada.views import SERIALIZER_MAPPING, DeviceType
+
+
+class Command(BaseCommand):
+    help = 'Move whole months of readings to their own tables, or drop archived months'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--archive-before',
+            metavar='YYYY-MM',
+            help='Archive the months before this one, they become read-only',
+        )
+        parser.add_argument(
+            '--drop-before',
+            metavar='YYYY-MM',
+            help='Delete the archived months before this one',
+        )
+        parser.add_argument(
+            '--device-type',
+            choices=[device_type.value for device_type in DeviceType],
+            action='append',
+            help='Only partition this device type (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        device_types = options['device_type'] or list(DeviceType)
+        models = [
+            SERIALIZER_MAPPING[DeviceType(device_type)].Meta.model
+            for device_type in device_types
+        ]
+
+        if options['archive_before']:
+            before = self._parse_month(options['archive_before'])
+            if before > month_start(time.time()):
+                raise CommandError('Only past months can be archived.')
+            for model in models:
+                self._archive(model, before)
+
+        if options['drop_before']:
+            before = self._parse_month(options['drop_before'])
+            for model in models:
+                self._drop(model, before)
+
+        if not options['archive_before'] and not options['drop_before']:
+            partitions = ReadingPartition.objects.filter(
+                device_type__in=[model.__name__ for model in models]
+            ).order_by('device_type', 'start')
+            for partition in partitions:
+                model = next(m for m in models if m.__name__ == partition.device_type)
+                self.stdout.write(
+                    f'{partition.device_type} {format_month(partition.start)}: '
+                    f'{partition.rows} readings in {partition_table(model, partition.start)}'
+                )
+
+    def _parse_month(self, value):
+        try:
+            return parse_month(value)
+        except ValueError:
+            raise CommandError(f'Invalid month {value}, expected YYYY-MM.')
+
+    def _archive(self, model, before):
+        readings = model.objects.filter(timestamp__lt=before)
+        first = readings.aggregate(first=Min('timestamp'))['first']
+        start = month_start(first) if first is not None else before
+        while start < before:
+            end = next_month(start)
+            if readings.filter(timestamp__gte=start, timestamp__lt=end).exists():
+                started = time.perf_counter()
+                rows = archive_month(model, start)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'Archived {rows} {model.__name__} readings of '
+                        f'{format_month(start)} in {elapsed:.2f}s '
+                        f'({rows / max(elapsed, 1e-6):.0f} rows/s)'
+                    )
+                )
+            start = end
+
+    def _drop(self, model, before):
+        partitions = ReadingPartition.objects.filter(
+            device_type=model.__name__, end__lte=before
+        ).order_by('start')
+        for partition in partitions:
+            started = time.perf_counter()
+            drop_partition(model, partition)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Dropped {partition.rows} {model.__name__} readings of '
+                    f'{format_month(partition.start)} in '
+                    f'{time.perf_counter() - started:.2f}s'
+                )
+            )
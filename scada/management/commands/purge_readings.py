@@ -0,0 +1,152 @@
+import datetime
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from scada.retention import (
+    enable_incremental_vacuum,
+    incremental_vacuum,
+    purge_readings,
+    uses_incremental_vacuum,
+)
+from scada.views import SERIALIZER_MAPPING, DeviceType
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete old device readings in small chunks, without blocking ingestion. '
+        'Rollups are kept for an age cutoff, except for the dropped archived months, '
+        'and deleted with the readings of a plant.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            metavar='AGE',
+            help='Delete the readings older than a date (YYYY-MM-DD) or a number '
+            'of days before today (e.g. 90d), both from midnight UTC',
+        )
+        parser.add_argument('--uid', help='Only delete the readings of this plant')
+        parser.add_argument(
+            '--device-type',
+            choices=[device_type.value for device_type in DeviceType],
+            action='append',
+            help='Only purge this device type (can be repeated)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Readings deleted per transaction (default 10000)',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.0,
+            help='Seconds to wait between two chunks (default 0)',
+        )
+        parser.add_argument(
+            '--no-vacuum',
+            action='store_true',
+            help='Do not return the freed space to the filesystem',
+        )
+        parser.add_argument(
+            '--convert-vacuum',
+            action='store_true',
+            help='Convert a database created without incremental vacuum, once. '
+            'Rewrites the whole file, writes are blocked meanwhile.',
+        )
+
+    def handle(self, *args, **options):
+        before = self._parse_age(options['older_than']) if options['older_than'] else None
+        if options['convert_vacuum'] and connection.vendor != 'sqlite':
+            raise CommandError('--convert-vacuum only applies to SQLite.')
+        if before is None and not options['uid']:
+            if options['convert_vacuum']:
+                self._convert_vacuum()
+                return
+            raise CommandError(
+                'Pass --older-than and/or --uid, clear_scada_data deletes everything.'
+            )
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+
+        device_types = options['device_type'] or list(DeviceType)
+        total = 0
+        started = time.perf_counter()
+        for device_type in device_types:
+            model = SERIALIZER_MAPPING[DeviceType(device_type)].Meta.model
+            device_started = time.perf_counter()
+            count = purge_readings(
+                model,
+                before=before,
+                uid=options['uid'],
+                chunk_size=options['chunk_size'],
+                pause=options['pause'],
+            )
+            total += count
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Deleted {count} {device_type} readings'
+                    f'{self._throughput(count, device_started)}'
+                )
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f'Deleted {total} readings{self._throughput(total, started)}')
+        )
+
+        if options['convert_vacuum'] and not uses_incremental_vacuum():
+            # The conversion vacuums the whole file already
+            self._convert_vacuum()
+            return
+        if options['no_vacuum'] or connection.vendor != 'sqlite':
+            return
+        vacuum_started = time.perf_counter()
+        freed = incremental_vacuum()
+        if freed is None:
+            self.stdout.write(
+                'The database does not use incremental vacuum, the freed pages are '
+                'reused by new readings. Convert it once with --convert-vacuum '
+                '(writes are blocked meanwhile).'
+            )
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'Returned {freed / 1024 / 1024:.1f} MiB to the filesystem in '
+                    f'{time.perf_counter() - vacuum_started:.2f}s'
+                )
+            )
+
+    def _convert_vacuum(self):
+        if uses_incremental_vacuum():
+            self.stdout.write('The database already uses incremental vacuum.')
+            return
+        started = time.perf_counter()
+        freed = enable_incremental_vacuum()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Converted the database to incremental vacuum, freeing '
+                f'{freed / 1024 / 1024:.1f} MiB in {time.perf_counter() - started:.2f}s'
+            )
+        )
+
+    def _parse_age(self, value):
+        match = re.fullmatch(r'(\d+)d', value)
+        if match:
+            # Whole days, so that every run of the day deletes the same readings
+            today = datetime.datetime.now(datetime.UTC).date()
+            date = today - datetime.timedelta(days=int(match[1]))
+        else:
+            try:
+                date = datetime.date.fromisoformat(value)
+            except ValueError:
+                raise CommandError(f'Invalid age {value}, expected e.g. 90d or YYYY-MM-DD.')
+        return int(
+            datetime.datetime.combine(date, datetime.time(), datetime.UTC).timestamp()
+        )
+
+    def _throughput(self, count, started):
+        elapsed = time.perf_counter() - started
+        return f' in {elapsed:.2f}s ({count / max(elapsed, 1e-6):.0f} rows/s)'
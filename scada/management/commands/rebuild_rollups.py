@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from scada.models import Rollup
+from scada.partitions import reading_querysets
+from scada.rollups import rebuild_rollups
+from scada.views import SERIALIZER_MAPPING, DeviceType
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the hourly and daily rollups from the raw device readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--device-type',
+            choices=[device_type.value for device_type in DeviceType],
+            action='append',
+            help='Only rebuild this device type (can be repeated)',
+        )
+        parser.add_argument('--uid', help='Only rebuild the rollups of this plant')
+
+    def handle(self, *args, **options):
+        device_types = options['device_type'] or list(DeviceType)
+        for device_type in device_types:
+            model = SERIALIZER_MAPPING[DeviceType(device_type)].Meta.model
+            # The device table and its archived months
+            tables = reading_querysets(model)
+            rollups = Rollup.objects.filter(device_type=model.__name__)
+            if options['uid']:
+                tables = [readings.filter(uid=options['uid']) for readings in tables]
+                rollups = rollups.filter(uid=options['uid'])
+
+            with transaction.atomic():
+                rollups.delete()
+                count = sum(rebuild_rollups(Rollup, model, readings) for readings in tables)
+
+            self.stdout.write(
+                self.style.SUCCESS(f'Rebuilt {count} rollups for {device_type}')
+            )
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:06
+
+from django.db import migrations, models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+
+def populate_latest_readings(apps, schema_editor):
+    LatestReading = apps.get_model("scada", "LatestReading")
+    for model_name in ["Plant", "Meter", "Inverter", "Weather", "SCB"]:
+        model = apps.get_model("scada", model_name)
+        latest = (
+            model.objects.annotate(
+                row_number=Window(
+                    expression=RowNumber(),
+                    partition_by=[F("uid"), F("devType"), F("devName")],
+                    order_by=[F("timestamp").desc(), F("id").desc()],
+                )
+            )
+            .filter(row_number=1)
+            .values_list("id", "uid", "devType", "devName", "timestamp")
+        )
+        LatestReading.objects.bulk_create(
+            LatestReading(
+                device_type=model_name,
+                uid=uid,
+                devType=devType,
+                devName=devName,
+                timestamp=timestamp,
+                reading_id=pk,
+            )
+            for pk, uid, devType, devName, timestamp in latest.iterator()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scada", "0002_alter_inverter__inv_alarm1_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LatestReading",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("device_type", models.CharField(max_length=30)),
+                ("uid", models.CharField(max_length=10)),
+                ("devType", models.CharField(max_length=30)),
+                ("devName", models.CharField(max_length=30)),
+                ("timestamp", models.IntegerField()),
+                ("reading_id", models.BigIntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="inverter",
+            index=models.Index(
+                fields=["uid", "devType", "devName", "timestamp"],
+                name="scada_inver_uid_6efba4_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="meter",
+            index=models.Index(
+                fields=["uid", "devType", "devName", "timestamp"],
+                name="scada_meter_uid_faf755_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="plant",
+            index=models.Index(
+                fields=["uid", "devType", "devName", "timestamp"],
+                name="scada_plant_uid_8a8d94_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scb",
+            index=models.Index(
+                fields=["uid", "devType", "devName", "timestamp"],
+                name="scada_scb_uid_24da45_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="weather",
+            index=models.Index(
+                fields=["uid", "devType", "devName", "timestamp"],
+                name="scada_weath_uid_c056ea_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="latestreading",
+            constraint=models.UniqueConstraint(
+                fields=("device_type", "uid", "devType", "devName"),
+                name="unique_latest_reading",
+            ),
+        ),
+        migrations.RunPython(populate_latest_readings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scada", "0003_latest_reading_and_device_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="inverter",
+            index=models.Index(
+                fields=["devName", "timestamp"], name="scada_inver_devName_a93453_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,120 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:10
+
+import itertools
+
+from django.db import migrations, models
+
+# `scada.rollups.DEFAULT_ROLLUP_FIELDS` and `ROLLUP_PERIODS` as of this
+# migration. Run `rebuild_rollups` after migrating when SCADA_ROLLUP_FIELDS
+# differs.
+ROLLUP_FIELDS = {
+    "Inverter": ["_inv_w", "_inv_dayyld"],
+    "Meter": ["_mtr_whexp"],
+}
+ROLLUP_PERIODS = [60 * 60, 24 * 60 * 60]
+
+
+def populate_rollups(apps, schema_editor):
+    Rollup = apps.get_model("scada", "Rollup")
+    for model_name, fields in ROLLUP_FIELDS.items():
+        model = apps.get_model("scada", model_name)
+        rebuild_rollups(Rollup, model, fields, model.objects.all())
+
+
+def rebuild_rollups(Rollup, model, fields, queryset, batch_size=1000):
+    """Roll up the readings of `queryset`, one device at a time."""
+    readings = queryset.order_by("uid", "devName", "timestamp", "pk").values_list(
+        "uid", "devName", "timestamp", *fields
+    )
+    batch = []
+    for (uid, devName), rows in itertools.groupby(
+        readings.iterator(chunk_size=10000), key=lambda row: row[:2]
+    ):
+        rollups = {}
+        for row in rows:
+            timestamp = row[2]
+            for period in ROLLUP_PERIODS:
+                bucket = timestamp // period * period
+                for field, value in zip(fields, row[3:]):
+                    rollup = rollups.get((period, bucket, field))
+                    if rollup is None:
+                        rollup = rollups[(period, bucket, field)] = Rollup(
+                            device_type=model.__name__,
+                            uid=uid,
+                            devName=devName,
+                            period=period,
+                            bucket=bucket,
+                            field=field,
+                        )
+                    _merge(rollup, timestamp, value)
+        batch.extend(rollups.values())
+        if len(batch) >= batch_size:
+            Rollup.objects.bulk_create(batch)
+            batch = []
+    Rollup.objects.bulk_create(batch)
+
+
+def _merge(rollup, timestamp, value):
+    rollup.readings += 1
+    # Readings come in time order
+    rollup.last = value
+    rollup.last_timestamp = timestamp
+    if value is None:
+        return
+    rollup.count += 1
+    rollup.sum = value if rollup.sum is None else rollup.sum + value
+    rollup.min = value if rollup.min is None else min(rollup.min, value)
+    rollup.max = value if rollup.max is None else max(rollup.max, value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scada", "0004_inverter_devname_timestamp_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Rollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("device_type", models.CharField(max_length=30)),
+                ("uid", models.CharField(max_length=10)),
+                ("devName", models.CharField(max_length=30)),
+                ("period", models.IntegerField()),
+                ("bucket", models.IntegerField()),
+                ("field", models.CharField(max_length=30)),
+                ("readings", models.IntegerField(default=0)),
+                ("count", models.IntegerField(default=0)),
+                ("min", models.FloatField(blank=True, null=True)),
+                ("max", models.FloatField(blank=True, null=True)),
+                ("sum", models.FloatField(blank=True, null=True)),
+                ("last", models.FloatField(blank=True, null=True)),
+                ("last_timestamp", models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "device_type",
+                            "uid",
+                            "devName",
+                            "period",
+                            "bucket",
+                            "field",
+                        ),
+                        name="unique_rollup",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
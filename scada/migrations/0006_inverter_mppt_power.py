@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:16
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_mppt_power(apps, schema_editor):
+    # Same as the `_multiply` rules of suryalog_mapping.json; SQL multiplication
+    # propagates nulls like the collector does
+    Inverter = apps.get_model("scada", "Inverter")
+    Inverter.objects.update(
+        **{f"_inv_mpw{n}": F(f"_inv_mpv{n}") * F(f"_inv_mpi{n}") for n in range(1, 5)}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scada", "0005_rollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="inverter",
+            name="_inv_mpw1",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="inverter",
+            name="_inv_mpw2",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="inverter",
+            name="_inv_mpw3",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="inverter",
+            name="_inv_mpw4",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_mppt_power, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,124 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:21
+
+import importlib
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+# The frozen rollup builder of 0005, kept there only
+rollup_migration = importlib.import_module("scada.migrations.0005_rollup")
+
+# Natural key of the readings as of this migration
+NATURAL_KEY = ["uid", "devType", "devName", "timestamp"]
+
+
+def remove_duplicate_readings(apps, schema_editor):
+    # The unique constraints cannot be created over duplicates
+    SCBString = apps.get_model("scada", "SCBString")
+    Rollup = apps.get_model("scada", "Rollup")
+    for model_name in ["Plant", "Meter", "Inverter", "Weather", "SCB"]:
+        model = apps.get_model("scada", model_name)
+        deduplicate(
+            model,
+            SCBString=SCBString if model_name == "SCB" else None,
+            Rollup=Rollup,
+        )
+
+
+def deduplicate(model, SCBString, Rollup, batch_size=500):
+    """Delete the readings sharing their natural key with a more recently
+    inserted one, and rebuild the rollups of their devices."""
+    groups = list(
+        model.objects.values(*NATURAL_KEY)
+        .annotate(rows=Count("pk"), keep=Max("pk"))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    devices = {}
+    for start in range(0, len(groups), batch_size):
+        duplicates = Q()
+        for group in groups[start : start + batch_size]:
+            duplicates |= Q(**{field: group[field] for field in NATURAL_KEY}) & ~Q(
+                pk=group["keep"]
+            )
+            devices.setdefault(group["uid"], set()).add(group["devName"])
+        ids = list(model.objects.filter(duplicates).values_list("pk", flat=True))
+        if SCBString is not None:
+            SCBString.objects.filter(scb_id__in=ids).delete()
+        model.objects.filter(pk__in=ids).delete()
+
+    fields = rollup_migration.ROLLUP_FIELDS.get(model.__name__)
+    if fields and devices:
+        device_filter = Q()
+        for uid, dev_names in devices.items():
+            device_filter |= Q(uid=uid, devName__in=dev_names)
+        Rollup.objects.filter(device_filter, device_type=model.__name__).delete()
+        rollup_migration.rebuild_rollups(
+            Rollup, model, fields, model.objects.filter(device_filter)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scada", "0006_inverter_mppt_power"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_readings, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name="inverter",
+            name="scada_inver_uid_6efba4_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="meter",
+            name="scada_meter_uid_faf755_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="plant",
+            name="scada_plant_uid_8a8d94_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="scb",
+            name="scada_scb_uid_24da45_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="weather",
+            name="scada_weath_uid_c056ea_idx",
+        ),
+        migrations.AddConstraint(
+            model_name="inverter",
+            constraint=models.UniqueConstraint(
+                fields=("uid", "devType", "devName", "timestamp"),
+                name="unique_inverter_reading",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="meter",
+            constraint=models.UniqueConstraint(
+                fields=("uid", "devType", "devName", "timestamp"),
+                name="unique_meter_reading",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="plant",
+            constraint=models.UniqueConstraint(
+                fields=("uid", "devType", "devName", "timestamp"),
+                name="unique_plant_reading",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="scb",
+            constraint=models.UniqueConstraint(
+                fields=("uid", "devType", "devName", "timestamp"),
+                name="unique_scb_reading",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="weather",
+            constraint=models.UniqueConstraint(
+                fields=("uid", "devType", "devName", "timestamp"),
+                name="unique_weather_reading",
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scada", "0007_unique_readings"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestReceipt",
+            fields=[
+                ("id", models.UUIDField(primary_key=True, serialize=False)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("committed", "Committed"),
+                            ("failed", "Failed"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("rows", models.IntegerField(default=0)),
+                ("errors", models.JSONField(blank=True, null=True)),
+                ("detail", models.TextField(blank=True)),
+                ("accepted_at", models.DateTimeField()),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scada", "0008_ingest_receipt"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReadingPartition",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("device_type", models.CharField(max_length=30)),
+                ("start", models.IntegerField()),
+                ("end", models.IntegerField()),
+                ("rows", models.IntegerField(default=0)),
+                ("archived_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("device_type", "start"), name="unique_reading_partition"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,163 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:06
+
+import datetime
+import math
+import struct
+
+from django.db import migrations, models
+from django.db.migrations.exceptions import IrreversibleError
+
+# Copies of `scada.strings` and `scada.partitions` as of this migration
+STRING_FIELDS = [f"_scb_i{number}" for number in range(1, 25)]
+FLOAT32_MAX = struct.unpack("<f", b"\xff\xff\x7f\x7f")[0]
+
+
+def pack_strings(strings):
+    values = [strings.get(name) for name in STRING_FIELDS]
+    while values and values[-1] is None:
+        values.pop()
+    if not values:
+        return None
+    return struct.pack(
+        f"<{len(values)}f", *(math.nan if value is None else value for value in values)
+    )
+
+
+def unpack_strings(packed):
+    values = [None] * len(STRING_FIELDS)
+    if packed:
+        for index, value in enumerate(struct.unpack(f"<{len(packed) // 4}f", packed)):
+            values[index] = None if math.isnan(value) else float(f"{value:.7g}")
+    return values
+
+
+def partition_table(model, start):
+    month = datetime.datetime.fromtimestamp(start, datetime.UTC).strftime("%Y%m")
+    return f"{model._meta.db_table}_{month}"
+
+
+def pack_string_currents(apps, schema_editor):
+    # Archived months have an SCB and an SCBString table of their own too
+    SCB = apps.get_model("scada", "SCB")
+    SCBString = apps.get_model("scada", "SCBString")
+    ReadingPartition = apps.get_model("scada", "ReadingPartition")
+    tables = [(SCB._meta.db_table, SCBString._meta.db_table)]
+    for start in ReadingPartition.objects.filter(device_type="SCB").values_list(
+        "start", flat=True
+    ):
+        tables.append((partition_table(SCB, start), partition_table(SCBString, start)))
+
+    connection = schema_editor.connection
+    quote = connection.ops.quote_name
+    existing = set(connection.introspection.table_names())
+    _check_packable([table for _, table in tables if table in existing], connection)
+
+    packed = SCB._meta.get_field("_scb_strings")
+    columns = ", ".join(quote(name) for name in STRING_FIELDS)
+    for scb_table, strings_table in tables:
+        if scb_table != SCB._meta.db_table:
+            schema_editor.execute(
+                f"ALTER TABLE {quote(scb_table)} ADD COLUMN "
+                f"{quote(packed.column)} {packed.db_type(connection)} NULL"
+            )
+        if strings_table not in existing:
+            continue
+
+        last = 0
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT {quote('scb_id')}, {columns} FROM {quote(strings_table)} "
+                    f"WHERE {quote('scb_id')} > %s ORDER BY {quote('scb_id')} LIMIT 10000",
+                    [last],
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                cursor.executemany(
+                    f"UPDATE {quote(scb_table)} SET {quote(packed.column)} = %s "
+                    f"WHERE {quote('id')} = %s",
+                    [
+                        (
+                            pack_strings(dict(zip(STRING_FIELDS, row[1:]))),
+                            row[0],
+                        )
+                        for row in rows
+                    ],
+                )
+            last = rows[-1][0]
+
+        if strings_table != SCBString._meta.db_table:
+            schema_editor.execute(f"DROP TABLE {quote(strings_table)}")
+
+
+def unpack_string_currents(apps, schema_editor):
+    # Only the device table: the SCBString tables of the archived months
+    # are not recreated
+    ReadingPartition = apps.get_model("scada", "ReadingPartition")
+    if ReadingPartition.objects.filter(device_type="SCB").exists():
+        raise IrreversibleError(
+            "SCB has archived months, drop them with `partition_readings "
+            "--drop-before` before unpacking the string currents."
+        )
+
+    SCB = apps.get_model("scada", "SCB")
+    SCBString = apps.get_model("scada", "SCBString")
+    packed = (
+        SCB.objects.exclude(_scb_strings=None)
+        .order_by("pk")
+        .values_list("pk", "_scb_strings")
+    )
+    batch = []
+    for scb_id, strings in packed.iterator(chunk_size=10000):
+        batch.append(
+            SCBString(
+                scb_id=scb_id, **dict(zip(STRING_FIELDS, unpack_strings(strings)))
+            )
+        )
+        if len(batch) >= 10000:
+            SCBString.objects.bulk_create(batch)
+            batch = []
+    SCBString.objects.bulk_create(batch)
+
+
+def _check_packable(tables, connection):
+    """Stop before anything is changed if a current is beyond float32."""
+    quote = connection.ops.quote_name
+    beyond = " OR ".join(f"ABS({quote(name)}) > %s" for name in STRING_FIELDS)
+    counts = {}
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {quote(table)} WHERE {beyond}",
+                [FLOAT32_MAX] * len(STRING_FIELDS),
+            )
+            count = cursor.fetchone()[0]
+            if count:
+                counts[table] = count
+    if counts:
+        rows = ", ".join(f"{count} in {table}" for table, count in counts.items())
+        raise ValueError(
+            f"SCB string rows with currents beyond float32 ({FLOAT32_MAX:.4g}) cannot "
+            f"be packed: {rows}. Set these currents to NULL and migrate again."
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scada", "0009_reading_partition"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scb",
+            name="_scb_strings",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        # Only reversible without archived SCB months
+        migrations.RunPython(pack_string_currents, unpack_string_currents),
+        migrations.DeleteModel(
+            name="SCBString",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scada", "0010_packed_scb_strings"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingestreceipt",
+            name="payload",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
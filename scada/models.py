@@ -1,5 +1,14 @@
 from django.db import models
 
+from scada.strings import PackedStrings
+
+# Natural key of a device reading, unique in every device table
+NATURAL_KEY = ["uid", "devType", "devName", "timestamp"]
+
+
+def unique_reading(name):
+    return models.UniqueConstraint(fields=NATURAL_KEY, name=f"unique_{name}_reading")
+
 class Plant(models.Model): 
     uid       = models.CharField(max_length=10)
     devType   = models.CharField(max_length=30)
@@ -9,6 +18,9 @@ class Plant(models.Model):
     slf       = models.FloatField()
     
     
+    class Meta:
+        constraints = [unique_reading("plant")]
+
     def __str__(self): 
         return str(self.devName)
     
@@ -58,6 +70,9 @@ class Meter(models.Model):
     _mtr_var2   = models.FloatField(null=True, blank=True)
     _mtr_var3   = models.FloatField(null=True, blank=True)
 
+    class Meta:
+        constraints = [unique_reading("meter")]
+
     def __str__(self): 
         return str(self.devName)
 
@@ -114,6 +129,11 @@ class Inverter(models.Model):
     _inv_mpi11   = models.FloatField(null=True, blank=True)
     _inv_mpv12   = models.FloatField(null=True, blank=True)
     _inv_mpi12   = models.FloatField(null=True, blank=True)
+    # MPPT power, derived from the `_multiply` rules of suryalog_mapping.json
+    _inv_mpw1    = models.FloatField(null=True, blank=True)
+    _inv_mpw2    = models.FloatField(null=True, blank=True)
+    _inv_mpw3    = models.FloatField(null=True, blank=True)
+    _inv_mpw4    = models.FloatField(null=True, blank=True)
     _inv_dayyld  = models.FloatField(null=True, blank=True)
     # _inv_stat    = models.BooleanField(default=False)
     # _inv_event   = models.BooleanField(default=False)
@@ -125,6 +145,13 @@ class Inverter(models.Model):
     _inv_error1  = models.IntegerField(null=True, blank=True)
 
 
+    class Meta:
+        constraints = [unique_reading("inverter")]
+        indexes = [
+            # InverterDetailView pages through a single inverter by time
+            models.Index(fields=["devName", "timestamp"]),
+        ]
+
     def __str__(self): 
         return str(self.devName)
 
@@ -147,11 +174,14 @@ class Weather(models.Model):
     mbWMWSE    = models.FloatField(null=True, blank=True)
     mbWMWDE    = models.FloatField(null=True, blank=True)
 
+    class Meta:
+        constraints = [unique_reading("weather")]
+
     def __str__(self): 
         return str(self.devName)
 
 
-class SCB(models.Model): 
+class SCB(PackedStrings, models.Model): 
     uid       = models.CharField(max_length=10)
     devType   = models.CharField(max_length=30)
     devName   = models.CharField(max_length=30)
@@ -162,39 +192,110 @@ class SCB(models.Model):
     _scb_ptot     = models.FloatField(null=True, blank=True)
     _scb_inttemp  = models.FloatField(null=True, blank=True)
     _scb_exttemp1 = models.FloatField(null=True, blank=True)
+    # Currents of the strings, `_scb_i1` to `_scb_i24` (see scada.strings)
+    _scb_strings  = models.BinaryField(null=True, blank=True)
+
+    class Meta:
+        constraints = [unique_reading("scb")]
 
     def __str__(self): 
         return str(self.devName)
 
 
-class SCBString(models.Model):
-    scb           = models.OneToOneField(SCB, on_delete=models.SET_NULL, null=True, related_name='strings') 
-    _scb_i1       = models.FloatField(null=True, blank=True)
-    _scb_i2       = models.FloatField(null=True, blank=True)
-    _scb_i3       = models.FloatField(null=True, blank=True)
-    _scb_i4       = models.FloatField(null=True, blank=True)
-    _scb_i5       = models.FloatField(null=True, blank=True)
-    _scb_i6       = models.FloatField(null=True, blank=True)
-    _scb_i7       = models.FloatField(null=True, blank=True)
-    _scb_i8       = models.FloatField(null=True, blank=True)
-    _scb_i9       = models.FloatField(null=True, blank=True)
-    _scb_i10      = models.FloatField(null=True, blank=True)
-    _scb_i11      = models.FloatField(null=True, blank=True)
-    _scb_i12      = models.FloatField(null=True, blank=True)
-    _scb_i13      = models.FloatField(null=True, blank=True)
-    _scb_i14      = models.FloatField(null=True, blank=True)
-    _scb_i15      = models.FloatField(null=True, blank=True)
-    _scb_i16      = models.FloatField(null=True, blank=True)
-    _scb_i17      = models.FloatField(null=True, blank=True)
-    _scb_i18      = models.FloatField(null=True, blank=True)
-    _scb_i19      = models.FloatField(null=True, blank=True)
-    _scb_i20      = models.FloatField(null=True, blank=True)
-    _scb_i21      = models.FloatField(null=True, blank=True)
-    _scb_i22      = models.FloatField(null=True, blank=True)
-    _scb_i23      = models.FloatField(null=True, blank=True)
-    _scb_i24      = models.FloatField(null=True, blank=True)
+class LatestReading(models.Model):
+    """Latest reading of every device, upserted by the ingestion path so that
+    the plant snapshot is a lookup instead of a scan over the history."""
+    device_type = models.CharField(max_length=30)
+    uid         = models.CharField(max_length=10)
+    devType     = models.CharField(max_length=30)
+    devName     = models.CharField(max_length=30)
+    timestamp   = models.IntegerField()
+    reading_id  = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["device_type", "uid", "devType", "devName"],
+                name="unique_latest_reading",
+            )
+        ]
+
+    def __str__(self): 
+        return f"{self.device_type} {self.devName}"
+
+
+class Rollup(models.Model):
+    """Hourly and daily aggregates of one field of a device, updated by the
+    ingestion path and rebuilt from history by `rebuild_rollups`."""
+    device_type    = models.CharField(max_length=30)
+    uid            = models.CharField(max_length=10)
+    devName        = models.CharField(max_length=30)
+    period         = models.IntegerField()
+    bucket         = models.IntegerField()
+    field          = models.CharField(max_length=30)
+
+    readings       = models.IntegerField(default=0)
+    count          = models.IntegerField(default=0)
+    min            = models.FloatField(null=True, blank=True)
+    max            = models.FloatField(null=True, blank=True)
+    sum            = models.FloatField(null=True, blank=True)
+    last           = models.FloatField(null=True, blank=True)
+    last_timestamp = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["device_type", "uid", "devName", "period", "bucket", "field"],
+                name="unique_rollup",
+            )
+        ]
+
+    def __str__(self): 
+        return f"{self.device_type} {self.devName} {self.field} @ {self.bucket}"
+
+
+class ReadingPartition(models.Model):
+    """A month of readings of a device table, moved to its own table by
+    `partition_readings` (see `scada.partitions`)."""
+    device_type = models.CharField(max_length=30)
+    start       = models.IntegerField()
+    end         = models.IntegerField()
+    rows        = models.IntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["device_type", "start"], name="unique_reading_partition"
+            )
+        ]
+
+    def __str__(self): 
+        return f"{self.device_type} @ {self.start}"
+
+
+class IngestReceipt(models.Model):
+    """Outcome of a payload accepted with a `202` by the ingestion queue.
+
+    The receipt is stored `pending` with the validated rows of the payload
+    before the `202` is sent, and marked `committed` in the same transaction
+    as the rows, which drops the payload. Receipts still pending when the
+    server restarts are written again by the queue.
+    """
+    PENDING   = "pending"
+    COMMITTED = "committed"
+    FAILED    = "failed"
+    STATUSES  = [(PENDING, "Pending"), (COMMITTED, "Committed"), (FAILED, "Failed")]
+
+    id           = models.UUIDField(primary_key=True)
+    status       = models.CharField(max_length=10, choices=STATUSES)
+    rows         = models.IntegerField(default=0)
+    errors       = models.JSONField(null=True, blank=True)
+    # Validated rows by device model name, until they are written
+    payload      = models.JSONField(null=True, blank=True)
+    detail       = models.TextField(blank=True)
+    accepted_at  = models.DateTimeField()
+    completed_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self): 
-        # return 'SCB String'
-        return self.scb.devName + '_String'
-        
+        return f"{self.id} {self.status}"
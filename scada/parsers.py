@@ -0,0 +1,114 @@
+"""Request parsers of the ingestion endpoints.
+
+Besides `application/json`, payloads can be sent as `application/msgpack`
+(when the optional `msgpack` package is installed) and either can be
+compressed with `Content-Encoding: gzip`.
+
+MessagePack carries `NaN` and `Infinity` as plain floats, they are rejected
+as the JSON parser does unless DRF's `STRICT_JSON` is disabled.
+"""
+
+import gzip
+import io
+import math
+import zlib
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.settings import api_settings
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DEFAULT_MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+GZIP_ERRORS = (OSError, EOFError, zlib.error)
+
+
+def open_stream(stream, encoding):
+    """Stream of the decoded body of a request with the given
+    `Content-Encoding`, decompressed as it is read."""
+    if encoding in ("", "identity"):
+        return stream
+    if encoding not in ("gzip", "x-gzip"):
+        raise UnsupportedMediaType(
+            encoding, detail=f'Unsupported content encoding "{encoding}" in request.'
+        )
+    return gzip.GzipFile(fileobj=stream)
+
+
+def decompress(stream, encoding):
+    """Decoded body of a request with the given `Content-Encoding`."""
+    body = open_stream(stream, encoding)
+    if body is stream:
+        return stream
+
+    # Bounded, so that a small compressed body cannot exhaust the memory
+    limit = getattr(
+        settings, "SCADA_MAX_DECOMPRESSED_SIZE", DEFAULT_MAX_DECOMPRESSED_SIZE
+    )
+    try:
+        body = body.read(limit + 1)
+    except GZIP_ERRORS as exc:
+        raise ParseError(f"Invalid gzip body - {exc}")
+    if len(body) > limit:
+        raise ParseError(f"Decompressed body larger than {limit} bytes.")
+    return io.BytesIO(body)
+
+
+class DecompressingParserMixin:
+    """Decodes the `Content-Encoding` of the body before parsing it."""
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get("request")
+        encoding = ""
+        if request is not None:
+            encoding = request.headers.get("Content-Encoding", "").strip().lower()
+        return super().parse(decompress(stream, encoding), media_type, parser_context)
+
+
+class CompressedJSONParser(DecompressingParserMixin, JSONParser):
+    pass
+
+
+def strict_values(values):
+    """`list_hook` of the MessagePack decoder rejecting non-finite floats."""
+    for value in values:
+        if type(value) is float and not math.isfinite(value):
+            raise ParseError(
+                f"MessagePack parse error - Out of range float values are not "
+                f"allowed: {value!r}"
+            )
+    return values
+
+
+def strict_object(obj):
+    strict_values(obj.values())
+    return obj
+
+
+class MsgPackParser(BaseParser):
+    media_type = "application/msgpack"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        hooks = {}
+        if api_settings.STRICT_JSON:
+            hooks = {"list_hook": strict_values, "object_hook": strict_object}
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, **hooks)
+        except ValueError as exc:
+            raise ParseError(f"MessagePack parse error - {exc}")
+
+
+class CompressedMsgPackParser(DecompressingParserMixin, MsgPackParser):
+    pass
+
+
+PAYLOAD_PARSERS = [CompressedJSONParser]
+if msgpack is not None:
+    PAYLOAD_PARSERS.append(CompressedMsgPackParser)
+
+PAYLOAD_MEDIA_TYPES = [parser.media_type for parser in PAYLOAD_PARSERS]
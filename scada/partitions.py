@@ -0,0 +1,196 @@
+"""Monthly partitions of the device tables.
+
+The device tables hold the recent readings. Whole months of older ones are
+moved by `python manage.py partition_readings` to a table per device table
+and month, e.g. `scada_inverter_202501`, recorded in `ReadingPartition`.
+Range queries only read the tables of the months they overlap, and an old
+month is deleted by dropping its tables, and its rollups.
+
+Archived months are read-only: the ingestion endpoints reject readings
+older than the end of the last archived month of their device type (its
+archive horizon), so a reading is always in the table of its month.
+Primary keys are kept when rows are moved, `LatestReading` still points at
+them.
+"""
+
+import calendar
+import datetime
+import threading
+
+from django.apps.registry import Apps
+from django.db import connection, models, transaction
+from django.db.migrations.state import AppConfigStub
+from django.db.models import Max
+
+from .cache import invalidate_plant_snapshots
+from .models import LatestReading, ReadingPartition, Rollup
+
+# Registry of the partition models, apart from the project's models so that
+# migrations never see them
+partition_apps = Apps([AppConfigStub("scada")])
+
+_partition_models = {}
+_partition_models_lock = threading.Lock()
+
+
+def month_start(timestamp):
+    """Timestamp of the start of the (UTC) month of `timestamp`."""
+    date = datetime.datetime.fromtimestamp(timestamp, datetime.UTC)
+    return calendar.timegm((date.year, date.month, 1, 0, 0, 0))
+
+
+def next_month(start):
+    date = datetime.datetime.fromtimestamp(start, datetime.UTC)
+    year, month = divmod(date.year * 12 + date.month, 12)
+    return calendar.timegm((year, month + 1, 1, 0, 0, 0))
+
+
+def parse_month(value):
+    """Start timestamp of a `YYYY-MM` month."""
+    date = datetime.datetime.strptime(value, "%Y-%m")
+    return calendar.timegm((date.year, date.month, 1, 0, 0, 0))
+
+
+def format_month(start):
+    return datetime.datetime.fromtimestamp(start, datetime.UTC).strftime("%Y-%m")
+
+
+def partition_table(model, start):
+    month = datetime.datetime.fromtimestamp(start, datetime.UTC).strftime("%Y%m")
+    return f"{model._meta.db_table}_{month}"
+
+
+def partition_model(model, start):
+    """Model of the table holding the readings of `model` for the month
+    starting at `start`."""
+    key = (model, start)
+    with _partition_models_lock:
+        if key not in _partition_models:
+            _partition_models[key] = _make_model(model, start)
+        return _partition_models[key]
+
+
+def _make_model(model, start):
+    table = partition_table(model, start)
+    attrs = {field.name: field.clone() for field in model._meta.local_fields}
+
+    class Meta:
+        apps = partition_apps
+        app_label = "scada"
+        db_table = table
+        # Index names are global to the database
+        constraints = [
+            models.UniqueConstraint(
+                fields=constraint.fields, name=f"{table}_{constraint.name}"
+            )
+            for constraint in model._meta.constraints
+        ]
+        indexes = [models.Index(fields=index.fields) for index in model._meta.indexes]
+
+    # Mixins such as `PackedStrings` are kept
+    return type(
+        f"{model.__name__}{table.rsplit('_', 1)[1]}",
+        model.__bases__,
+        {"__module__": __name__, "Meta": Meta, **attrs},
+    )
+
+
+def archive_horizons():
+    """End of the last archived month of every partitioned device type."""
+    return dict(
+        ReadingPartition.objects.values("device_type")
+        .annotate(horizon=Max("end"))
+        .values_list("device_type", "horizon")
+    )
+
+
+def reading_querysets(model, start=None, end=None, horizon=None):
+    """Querysets over the tables of `model` that hold readings between
+    `start` (inclusive) and `end` (exclusive), in time order.
+
+    Pass `horizon` when `archive_horizons` was already read. Callers still
+    filter the querysets by time, the tables are only picked by month.
+    """
+    partitions = ReadingPartition.objects.filter(device_type=model.__name__)
+    if start is not None:
+        partitions = partitions.filter(end__gt=start)
+    if end is not None:
+        partitions = partitions.filter(start__lt=end)
+    querysets = [
+        partition_model(model, partition_start).objects.all()
+        for partition_start in partitions.order_by("start").values_list(
+            "start", flat=True
+        )
+    ]
+
+    if horizon is None:
+        horizon = archive_horizons().get(model.__name__)
+    if end is None or horizon is None or end > horizon:
+        querysets.append(model.objects.all())
+    return querysets
+
+
+def archive_month(model, start):
+    """Move the readings of `model` for the month starting at `start` to
+    their own table, returns how many were moved."""
+    end = next_month(start)
+    archive = partition_model(model, start)
+
+    # The SQLite schema editor cannot run in a transaction
+    if archive._meta.db_table not in connection.introspection.table_names():
+        with connection.schema_editor() as editor:
+            editor.create_model(archive)
+
+    quote = connection.ops.quote_name
+    readings = quote(model._meta.db_table)
+    in_month = f"{quote('timestamp')} >= %s AND {quote('timestamp')} < %s"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(_copy_sql(model, archive, f"WHERE {in_month}"), [start, end])
+        rows = cursor.rowcount
+        cursor.execute(f"DELETE FROM {readings} WHERE {in_month}", [start, end])
+
+        partition, _ = ReadingPartition.objects.get_or_create(
+            device_type=model.__name__, start=start, defaults={"end": end}
+        )
+        partition.rows += rows
+        partition.save()
+    return rows
+
+
+def _copy_sql(model, partition, where):
+    quote = connection.ops.quote_name
+    columns = ", ".join(
+        quote(field.column) for field in model._meta.local_concrete_fields
+    )
+    return (
+        f"INSERT INTO {quote(partition._meta.db_table)} ({columns}) "
+        f"SELECT {columns} FROM {quote(model._meta.db_table)} {where}"
+    )
+
+
+def drop_partition(model, partition):
+    """Delete an archived month by dropping its table, with its rollups.
+
+    The month's readings could be stored again later, they would be counted
+    twice in rollups kept for them.
+    """
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Devices whose latest reading is dropped are left without one
+        latest = LatestReading.objects.filter(
+            device_type=model.__name__,
+            timestamp__gte=partition.start,
+            timestamp__lt=partition.end,
+        )
+        uids = set(latest.values_list("uid", flat=True))
+        latest.delete()
+        partition.delete()
+        Rollup.objects.filter(
+            device_type=model.__name__,
+            bucket__gte=partition.start,
+            bucket__lt=partition.end,
+        ).delete()
+        cursor.execute(
+            f"DROP TABLE IF EXISTS {quote(partition_table(model, partition.start))}"
+        )
+        transaction.on_commit(lambda: invalidate_plant_snapshots(uids), robust=True)
@@ -0,0 +1,37 @@
+"""Response renderers of the API."""
+
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class StreamedRenderer(BaseRenderer):
+    """Lets clients asking for a media type the view streams by itself
+    through content negotiation. Only error responses are rendered, as
+    JSON."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, cls=JSONEncoder).encode()
+
+
+class EventStreamRenderer(StreamedRenderer):
+    """Server-sent events, for `Accept: text/event-stream` clients
+    (`EventSource`)."""
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+
+
+class ParquetRenderer(StreamedRenderer):
+    media_type = "application/vnd.apache.parquet"
+    format = "parquet"
+
+
+class ArrowStreamRenderer(StreamedRenderer):
+    """Arrow IPC streaming format."""
+
+    media_type = "application/vnd.apache.arrow.stream"
+    format = "arrow"
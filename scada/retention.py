@@ -0,0 +1,199 @@
+"""Deletion of old device readings, in bounded chunks.
+
+Readings are deleted by ranges of primary keys with plain `DELETE`
+statements, each range in its own short transaction, so that ingestion can
+write between two chunks. The ORM delete collector is avoided: it loads the
+rows before deleting them, in one long transaction.
+
+Archived months entirely older than the cutoff are dropped whole, with
+their rollups. The rollups of a purged plant are deleted too. Otherwise an
+age cutoff keeps the rollups, so that aggregates of purged ranges are still
+served from them, except in the buckets the cutoff cuts in two: these are
+rebuilt from the readings left.
+"""
+
+import time
+
+from django.db import connection
+from django.db.models import F, Q
+
+from .cache import invalidate_plant_snapshots
+from .models import LatestReading, ReadingPartition, Rollup
+from .partitions import drop_partition, partition_model, reading_querysets
+from .rollups import ROLLUP_PERIODS, rebuild_rollups
+
+
+def purge_readings(model, before=None, uid=None, chunk_size=10000, pause=0.0):
+    """Delete the readings of `model` older than `before` and/or of the
+    plant `uid`, archived months included. Waits `pause` seconds between
+    chunks of `chunk_size` rows. Returns the number of readings deleted."""
+    deleted = 0
+    partitions = ReadingPartition.objects.filter(device_type=model.__name__)
+    if before is not None:
+        partitions = partitions.filter(start__lt=before)
+    for partition in partitions.order_by("start"):
+        if uid is None and (before is None or partition.end <= before):
+            drop_partition(model, partition)
+            deleted += partition.rows
+            continue
+        rows = delete_chunks(
+            partition_model(model, partition.start), before, uid, chunk_size, pause
+        )
+        ReadingPartition.objects.filter(pk=partition.pk).update(rows=F("rows") - rows)
+        deleted += rows
+
+    deleted += delete_chunks(model, before, uid, chunk_size, pause)
+    purge_rollups(model, before, uid)
+
+    # Devices whose latest reading is older than the cutoff have none left
+    latest = LatestReading.objects.filter(device_type=model.__name__)
+    if before is not None:
+        latest = latest.filter(timestamp__lt=before)
+    if uid is not None:
+        latest = latest.filter(uid=uid)
+    uids = set(latest.values_list("uid", flat=True))
+    latest.delete()
+    invalidate_plant_snapshots(uids)
+    return deleted
+
+
+def purge_rollups(model, before=None, uid=None):
+    """Delete or rebuild the rollups of the readings purged by
+    `purge_readings`.
+
+    Readings stored again after a purge are counted as new, so the rollups
+    of a purged plant are deleted, and the buckets an age cutoff cuts in
+    two are recomputed from the readings left.
+    """
+    rollups = Rollup.objects.filter(device_type=model.__name__)
+    if uid is not None:
+        rollups = rollups.filter(uid=uid)
+        if before is None:
+            rollups.delete()
+            return
+        covered = Q()
+        for period in ROLLUP_PERIODS.values():
+            covered |= Q(period=period, bucket__lte=before - period)
+        rollups.filter(covered).delete()
+
+    cut = {
+        period: before // period * period
+        for period in ROLLUP_PERIODS.values()
+        if before % period
+    }
+    if not cut:
+        return
+    in_cut = Q()
+    for period, bucket in cut.items():
+        in_cut |= Q(period=period, bucket=bucket)
+    rollups.filter(in_cut).delete()
+    # The longest cut bucket holds the shorter ones
+    start = min(cut.values())
+    end = start + max(cut)
+    for queryset in reading_querysets(model, start, end):
+        queryset = queryset.filter(timestamp__gte=start, timestamp__lt=end)
+        if uid is not None:
+            queryset = queryset.filter(uid=uid)
+        rebuild_rollups(Rollup, model, queryset)
+
+
+def delete_chunks(model, before=None, uid=None, chunk_size=10000, pause=0.0):
+    """Delete the rows of `model` matching `before` and `uid` by ranges of
+    `chunk_size` primary keys. Returns the number of rows deleted."""
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    pk = quote(model._meta.pk.column)
+    filters = ""
+    params = []
+    if before is not None:
+        filters += f" AND {quote('timestamp')} < %s"
+        params.append(before)
+    if uid is not None:
+        filters += f" AND {quote('uid')} = %s"
+        params.append(uid)
+
+    deleted = 0
+    last = 0
+    while True:
+        # The end of the range is looked up before the write transaction:
+        # new readings get higher primary keys
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT {pk} FROM {table} WHERE {pk} > %s{filters} "
+                f"ORDER BY {pk} LIMIT 1 OFFSET %s",
+                [last, *params, chunk_size - 1],
+            )
+            row = cursor.fetchone()
+        end = row[0] if row else None
+
+        in_range = f"{pk} > %s{filters}"
+        range_params = [last, *params]
+        if end is not None:
+            in_range += f" AND {pk} <= %s"
+            range_params.append(end)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE {in_range}", range_params)
+            deleted += cursor.rowcount
+
+        if end is None:
+            return deleted
+        last = end
+        if pause:
+            time.sleep(pause)
+
+
+def uses_incremental_vacuum():
+    """Whether the SQLite database has `auto_vacuum=INCREMENTAL`."""
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA auto_vacuum")
+        return cursor.fetchone()[0] == 2
+
+
+def enable_incremental_vacuum():
+    """Convert the SQLite database to `auto_vacuum=INCREMENTAL`.
+
+    The setting only applies to new databases, existing ones are converted
+    by a full `VACUUM`: the file is rewritten and the database is locked
+    meanwhile. Returns the number of bytes freed.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA page_size")
+        page_size = cursor.fetchone()[0]
+        cursor.execute("PRAGMA page_count")
+        pages = cursor.fetchone()[0]
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("VACUUM")
+        cursor.execute("PRAGMA page_count")
+        return (pages - cursor.fetchone()[0]) * page_size
+
+
+def incremental_vacuum(pages=4096):
+    """Return the free pages of the SQLite database to the filesystem,
+    `pages` at a time so that writers get the lock in between.
+
+    Returns the number of bytes freed, or None when the database does not
+    have `auto_vacuum=INCREMENTAL`: its free pages are only reused by new
+    rows.
+    """
+    if connection.vendor != "sqlite":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA auto_vacuum")
+        if cursor.fetchone()[0] != 2:
+            return None
+        cursor.execute("PRAGMA page_size")
+        page_size = cursor.fetchone()[0]
+
+        cursor.execute("PRAGMA freelist_count")
+        free = initial = cursor.fetchone()[0]
+        while free:
+            cursor.execute(f"PRAGMA incremental_vacuum({pages})")
+            # The pragma frees a page per step
+            cursor.fetchall()
+            cursor.execute("PRAGMA freelist_count")
+            free, left = cursor.fetchone()[0], free
+            if free >= left:
+                break
+        return (initial - free) * page_size
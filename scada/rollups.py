@@ -0,0 +1,337 @@
+"""Hourly and daily rollups of the device readings.
+
+`Rollup` keeps, per device, field and period bucket, the number of readings
+and the count/min/max/sum/last of the field. Ingestion merges every new
+interval into the affected buckets (`update_rollups`) and the aggregation
+endpoint reads them instead of scanning raw history when the requested
+buckets line up with a rollup period (`aggregate_rollups`).
+
+Every rolled up field adds a row per device and bucket to each write, so
+only the fields of `SCADA_ROLLUP_FIELDS` are rolled up. Aggregates of the
+other fields are computed from the raw readings.
+
+New readings are added to the stored buckets in SQL, with an `INSERT ... ON
+CONFLICT DO UPDATE` like the upsert of the readings themselves, so that
+concurrent writers never lose each other's readings.
+"""
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import Q
+
+from .aggregation import grouped_aggregates, last_values
+from .strings import STRING_FIELDS, StringCurrent, has_string_function
+
+ROLLUP_PERIODS = {
+    "1h": 60 * 60,
+    "1d": 24 * 60 * 60,
+}
+
+ROLLUP_FUNCTIONS = ["count", "min", "max", "sum"]
+
+ROLLUP_KEY_FIELDS = ["device_type", "uid", "devName", "period", "bucket", "field"]
+
+ROLLUP_VALUE_FIELDS = ["readings", "count", "min", "max", "sum", "last", "last_timestamp"]
+
+# Rolled up fields by device type, unless `SCADA_ROLLUP_FIELDS` is set
+DEFAULT_ROLLUP_FIELDS = {
+    "Inverter": ["_inv_w", "_inv_dayyld"],
+    "Meter": ["_mtr_whexp"],
+}
+
+
+def rollup_fields():
+    """Names of the rolled up fields, by device type."""
+    return getattr(settings, "SCADA_ROLLUP_FIELDS", DEFAULT_ROLLUP_FIELDS)
+
+
+def rollup_lookups(model):
+    """ORM lookups of the numeric fields of `model` that are rolled up."""
+    fields = rollup_fields().get(model.__name__, ())
+    return {
+        field: lookup
+        for field, lookup in numeric_lookups(model).items()
+        if field in fields
+    }
+
+
+def numeric_lookups(model):
+    """ORM lookups of the numeric fields of `model`, the fields the
+    aggregation endpoint and the rollups can aggregate.
+
+    The SCB string currents are read out of their packed column with
+    `StringCurrent` expressions, on the databases that can. Before they
+    were packed, historical models reach them through a reverse one-to-one
+    relation.
+    """
+    lookups = {}
+    for field in model._meta.get_fields():
+        if field.one_to_one and field.auto_created:
+            for related_field, _ in numeric_lookups(field.related_model).items():
+                lookups[related_field] = f"{field.name}__{related_field}"
+        elif field.name == "_scb_strings":
+            if not has_string_function():
+                continue
+            for name in STRING_FIELDS:
+                lookups[name] = StringCurrent(name)
+        elif _is_numeric(field):
+            lookups[field.name] = field.name
+    return lookups
+
+
+def _is_numeric(field):
+    return (
+        isinstance(field, (models.FloatField, models.IntegerField))
+        and not field.primary_key
+        and not field.is_relation
+        and field.name != "timestamp"
+    )
+
+
+def _lookup_value(instance, field, lookup):
+    if not isinstance(lookup, str):
+        # Expressions read attributes of the same name
+        return getattr(instance, field)
+    for name in lookup.split("__"):
+        instance = getattr(instance, name, None)
+        if instance is None:
+            return None
+    return instance
+
+
+def update_rollups(Rollup, model, instances):
+    """Merge newly inserted readings into their rollup buckets."""
+    lookups = rollup_lookups(model)
+    if not instances or not lookups:
+        return
+
+    device_type = model.__name__
+    # Rollups of the new readings alone, added to the stored ones below
+    rollups = {}
+    for instance in instances:
+        values = {
+            field: _lookup_value(instance, field, lookup)
+            for field, lookup in lookups.items()
+        }
+        for period in ROLLUP_PERIODS.values():
+            bucket = instance.timestamp // period * period
+            for field, value in values.items():
+                key = (instance.uid, instance.devName, period, bucket, field)
+                rollup = rollups.get(key)
+                if rollup is None:
+                    rollup = rollups[key] = Rollup(
+                        device_type=device_type,
+                        uid=instance.uid,
+                        devName=instance.devName,
+                        period=period,
+                        bucket=bucket,
+                        field=field,
+                    )
+                _merge(rollup, instance.timestamp, value)
+
+    _add_rollups(Rollup, list(rollups.values()))
+
+
+def _add_rollups(Rollup, rollups, batch_size=500):
+    """Add `rollups` to the stored buckets in a single statement per batch."""
+    quote = connection.ops.quote_name
+    table = quote(Rollup._meta.db_table)
+    fields = ROLLUP_KEY_FIELDS + ROLLUP_VALUE_FIELDS
+    column = {name: quote(Rollup._meta.get_field(name).column) for name in fields}
+    stored = {name: f"{table}.{column[name]}" for name in ROLLUP_VALUE_FIELDS}
+    added = {name: f"excluded.{column[name]}" for name in ROLLUP_VALUE_FIELDS}
+    is_last = (
+        f"{stored['last_timestamp']} IS NULL OR "
+        f"{added['last_timestamp']} >= {stored['last_timestamp']}"
+    )
+    updates = {
+        "readings": f"{stored['readings']} + {added['readings']}",
+        "count": f"{stored['count']} + {added['count']}",
+        "min": f"CASE WHEN {stored['min']} IS NULL OR {added['min']} < {stored['min']} "
+        f"THEN {added['min']} ELSE {stored['min']} END",
+        "max": f"CASE WHEN {stored['max']} IS NULL OR {added['max']} > {stored['max']} "
+        f"THEN {added['max']} ELSE {stored['max']} END",
+        "sum": f"CASE WHEN {stored['sum']} IS NULL THEN {added['sum']} "
+        f"WHEN {added['sum']} IS NULL THEN {stored['sum']} "
+        f"ELSE {stored['sum']} + {added['sum']} END",
+        "last": f"CASE WHEN {is_last} THEN {added['last']} ELSE {stored['last']} END",
+        "last_timestamp": f"CASE WHEN {is_last} THEN {added['last_timestamp']} "
+        f"ELSE {stored['last_timestamp']} END",
+    }
+    sql = (
+        f"INSERT INTO {table} ({', '.join(column[name] for name in fields)}) VALUES {{}} "
+        f"ON CONFLICT ({', '.join(column[name] for name in ROLLUP_KEY_FIELDS)}) "
+        f"DO UPDATE SET {', '.join(f'{column[name]} = {updates[name]}' for name in updates)}"
+    )
+    row = f"({', '.join(['%s'] * len(fields))})"
+    with connection.cursor() as cursor:
+        for start in range(0, len(rollups), batch_size):
+            batch = rollups[start : start + batch_size]
+            cursor.execute(
+                sql.format(", ".join([row] * len(batch))),
+                [getattr(rollup, name) for rollup in batch for name in fields],
+            )
+
+
+def _merge(rollup, timestamp, value):
+    rollup.readings += 1
+    if rollup.last_timestamp is None or timestamp >= rollup.last_timestamp:
+        rollup.last = value
+        rollup.last_timestamp = timestamp
+    if value is None:
+        return
+    rollup.count += 1
+    rollup.sum = value if rollup.sum is None else rollup.sum + value
+    rollup.min = value if rollup.min is None else min(rollup.min, value)
+    rollup.max = value if rollup.max is None else max(rollup.max, value)
+
+
+def refresh_rollups(Rollup, model, instances):
+    """Recompute from raw history the rollup buckets of readings that
+    replaced stored ones, which `update_rollups` would count twice."""
+    if not instances or not rollup_lookups(model):
+        return
+
+    day = max(ROLLUP_PERIODS.values())
+    devices = {}
+    for instance in instances:
+        devices.setdefault(instance.uid, set()).add(instance.devName)
+    device_filter = Q()
+    for uid, dev_names in devices.items():
+        device_filter |= Q(uid=uid, devName__in=dev_names)
+    # Whole days, so that the hourly buckets within them are complete too
+    time_filter = Q()
+    bucket_filter = Q()
+    for bucket in {instance.timestamp // day * day for instance in instances}:
+        time_filter |= Q(timestamp__gte=bucket, timestamp__lt=bucket + day)
+        bucket_filter |= Q(bucket__gte=bucket, bucket__lt=bucket + day)
+
+    # Writers adding to these buckets wait until they are rebuilt, where
+    # the database can lock rows
+    list(
+        Rollup.objects.select_for_update()
+        .filter(device_filter, bucket_filter, device_type=model.__name__)
+        .values_list("pk", flat=True)
+    )
+    rebuild_rollups(Rollup, model, model.objects.filter(device_filter, time_filter))
+
+
+def rebuild_rollups(Rollup, model, queryset=None, batch_size=1000):
+    """Recompute the rollups of `model` from raw history with SQL aggregates.
+
+    Takes the models as arguments so that migrations can pass their
+    historical versions. Returns the number of rollup rows written.
+    """
+    device_type = model.__name__
+    lookups = rollup_lookups(model)
+    if not lookups:
+        return 0
+    if queryset is None:
+        queryset = model.objects.all()
+
+    written = 0
+    for period in ROLLUP_PERIODS.values():
+        latest = last_values(queryset, lookups, period)
+        batch = []
+        for key, row in grouped_aggregates(queryset, lookups, period, ROLLUP_FUNCTIONS):
+            uid, devName, bucket = key
+            last_timestamp, last = latest[key]
+            for field in lookups:
+                batch.append(
+                    Rollup(
+                        device_type=device_type,
+                        uid=uid,
+                        devName=devName,
+                        period=period,
+                        bucket=bucket,
+                        field=field,
+                        readings=row["readings"],
+                        last=last[field],
+                        last_timestamp=last_timestamp,
+                        **{
+                            function: row[f"{field}__{function}"]
+                            for function in ROLLUP_FUNCTIONS
+                        },
+                    )
+                )
+            if len(batch) >= batch_size:
+                written += _upsert(Rollup, batch)
+                batch = []
+        written += _upsert(Rollup, batch)
+    return written
+
+
+def _upsert(Rollup, rollups):
+    Rollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=ROLLUP_KEY_FIELDS,
+        update_fields=ROLLUP_VALUE_FIELDS,
+    )
+    return len(rollups)
+
+
+def rollup_period(seconds, start=None, end=None):
+    """The coarsest rollup period able to answer buckets of `seconds`
+    between `start` and `end`, or None when raw readings are needed."""
+    for period in sorted(ROLLUP_PERIODS.values(), reverse=True):
+        if seconds % period:
+            continue
+        if any(bound is not None and bound % period for bound in (start, end)):
+            continue
+        return period
+    return None
+
+
+def aggregate_rollups(queryset, fields, seconds, period, functions):
+    """Same output as `aggregate_readings`, merged from `Rollup` rows.
+
+    `queryset` is a `Rollup` queryset already filtered on device type,
+    devices and time range.
+    """
+    rows = queryset.filter(period=period, field__in=fields).order_by(
+        "uid", "devName", "bucket"
+    )
+    merged = {}
+    for rollup in rows:
+        bucket = rollup.bucket // seconds * seconds
+        key = (rollup.uid, rollup.devName, bucket)
+        group = merged.setdefault(key, {})
+        current = group.get(rollup.field)
+        if current is None:
+            group[rollup.field] = rollup
+        else:
+            _combine(current, rollup)
+
+    for (uid, devName, bucket), group in merged.items():
+        result = {"uid": uid, "devName": devName, "bucket": bucket}
+        result["count"] = next(iter(group.values())).readings
+        for field in fields:
+            rollup = group.get(field)
+            result[field] = {
+                function: _rollup_value(rollup, function) for function in functions
+            }
+        yield result
+
+
+def _combine(rollup, other):
+    rollup.readings += other.readings
+    rollup.count += other.count
+    if other.last_timestamp is not None and (
+        rollup.last_timestamp is None or other.last_timestamp >= rollup.last_timestamp
+    ):
+        rollup.last = other.last
+        rollup.last_timestamp = other.last_timestamp
+    for name, pick in (("min", min), ("max", max)):
+        values = [v for v in (getattr(rollup, name), getattr(other, name)) if v is not None]
+        setattr(rollup, name, pick(values) if values else None)
+    if other.sum is not None:
+        rollup.sum = other.sum if rollup.sum is None else rollup.sum + other.sum
+
+
+def _rollup_value(rollup, function):
+    if rollup is None:
+        return None
+    if function == "avg":
+        return rollup.sum / rollup.count if rollup.count else None
+    return getattr(rollup, function)
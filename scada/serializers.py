@@ -1,7 +1,8 @@
 import copy
 from typing import override
 from rest_framework import serializers
-from scada.models import Inverter, Plant, Meter, Weather, SCB, SCBString
+from scada.models import Inverter, Plant, Meter, Weather, SCB, IngestReceipt
+from scada.strings import FLOAT32_MAX, STRING_FIELDS
 
 
 # Prevents type coersion to string
@@ -34,6 +35,9 @@ class InverterSerializer(serializers.ModelSerializer):
     class Meta:
         model = Inverter
         exclude = ["id"]
+        # Re-sent readings are upserted on their natural key by
+        # `ingest.bulk_save`, they must not fail validation
+        validators = []
 
 class PlantSerializer(serializers.ModelSerializer):
     uid = StrictCharField()
@@ -43,6 +47,7 @@ class PlantSerializer(serializers.ModelSerializer):
     class Meta:
         model = Plant
         exclude = ["id"]
+        validators = []
 
 
 class MeterSerializer(serializers.ModelSerializer):
@@ -53,6 +58,7 @@ class MeterSerializer(serializers.ModelSerializer):
     class Meta:
         model = Meter
         exclude = ["id"]
+        validators = []
 
 
 class WeatherSerializer(serializers.ModelSerializer):
@@ -63,12 +69,22 @@ class WeatherSerializer(serializers.ModelSerializer):
     class Meta:
         model = Weather
         exclude = ["id"]
+        validators = []
 
 
-class SCBStringSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = SCBString
-        exclude = ["id", "scb"]
+class SCBStringSerializer(serializers.Serializer):
+    """Currents of the strings of an SCB, packed in `SCB._scb_strings`."""
+
+    def get_fields(self):
+        return {
+            name: serializers.FloatField(
+                allow_null=True,
+                required=False,
+                min_value=-FLOAT32_MAX,
+                max_value=FLOAT32_MAX,
+            )
+            for name in STRING_FIELDS
+        }
 
 
 class SCBSerializer(serializers.ModelSerializer):
@@ -79,7 +95,8 @@ class SCBSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SCB
-        exclude = ["id"]
+        exclude = ["id", "_scb_strings"]
+        validators = []
 
     def __init__(self, *args, **kwargs):
         """Transforms the flat SCB+string data into a nested object
@@ -94,14 +111,14 @@ class SCBSerializer(serializers.ModelSerializer):
         super().__init__(*args, **kwargs)
 
     def _transform_data(self, data):
-        data = copy.deepcopy(data)
+        string_fields = STRING_FIELDS
+        if "strings" in data and not any(f in data for f in string_fields):
+            # Already nested, e.g. projected through a `TagPlan`
+            return data
 
-        if "strings" not in data:
-            data["strings"] = {}
-
-        string_fields = [
-            f.name for f in SCBString._meta.get_fields() if f.name not in ["id", "scb"]
-        ]
+        # Values are scalars, so shallow copies are enough
+        data = copy.copy(data)
+        data["strings"] = copy.copy(data.get("strings", {}))
 
         for field_name in string_fields:
             if field_name in data:
@@ -111,10 +128,7 @@ class SCBSerializer(serializers.ModelSerializer):
 
     @override
     def create(self, validated_data):
-        strings_data = validated_data.pop("strings")
-        scb = SCB.objects.create(**validated_data)
-        SCBString.objects.create(scb=scb, **strings_data)
-        return scb
+        return SCB.objects.create(**validated_data)
 
     @override
     def to_representation(self, instance):
@@ -161,6 +175,16 @@ class DataViewRequestSerializer(serializers.Serializer):
     UID = serializers.CharField()
 
 
+class BatchDataViewRequestSerializer(serializers.Serializer):
+    class IntervalSerializer(serializers.Serializer):
+        Timestamp = serializers.IntegerField()
+        Data = DataViewRequestSerializer.DataSerializer()
+
+    Tags = DataViewRequestSerializer.TagsSerializer()
+    UID = serializers.CharField()
+    Intervals = IntervalSerializer(many=True)
+
+
 class PlantDataResponseSerializer(serializers.Serializer):
     Plant = PlantSerializer(many=True)
     Inverter = InverterSerializer(many=True)
@@ -168,6 +192,36 @@ class PlantDataResponseSerializer(serializers.Serializer):
     SCB = SCBSerializer(many=True)
 
 
+class InverterDetailResponseSerializer(serializers.Serializer):
+    results = InverterSerializer(
+        many=True,
+        help_text="Rows, or a list of values per field with `layout=columnar`",
+    )
+    next = serializers.CharField(
+        allow_null=True, help_text="Cursor of the next page, null on the last page"
+    )
+
+
+class PlantTimestampsResponseSerializer(serializers.Serializer):
+    timestamps = serializers.ListField(
+        child=serializers.IntegerField(),
+        help_text="Timestamps with readings of any device type, in ascending order",
+    )
+
+
+class AggregateResponseSerializer(serializers.Serializer):
+    class BucketSerializer(serializers.Serializer):
+        uid = serializers.CharField()
+        devName = serializers.CharField()
+        bucket = serializers.IntegerField(help_text="Start timestamp of the bucket")
+        count = serializers.IntegerField(help_text="Number of readings in the bucket")
+
+    results = BucketSerializer(
+        many=True,
+        help_text="Each bucket also holds a `{aggregate: value}` object per field",
+    )
+
+
 class DataViewResponseSerializer(serializers.Serializer):
     detail = serializers.CharField(help_text="Success or error message", required=False)
     errors = serializers.DictField(
@@ -175,3 +229,29 @@ class DataViewResponseSerializer(serializers.Serializer):
         required=False,
         help_text="Dictionary of errors by device type, if any",
     )
+
+
+class BatchDataViewResponseSerializer(serializers.Serializer):
+    detail = serializers.CharField(help_text="Success or error message", required=False)
+    errors = serializers.DictField(
+        child=serializers.DictField(child=serializers.ListField(child=serializers.CharField())),
+        required=False,
+        help_text="Errors by interval index, then by device type, if any",
+    )
+
+
+class IngestAcceptedResponseSerializer(serializers.Serializer):
+    detail = serializers.CharField()
+    receipt = serializers.UUIDField(
+        help_text="Id of the receipt, polled at `/api/v1/receipts/<id>/`"
+    )
+    errors = serializers.DictField(
+        required=False,
+        help_text="Validation errors, as in the `206` response of the endpoint",
+    )
+
+
+class IngestReceiptSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = IngestReceipt
+        exclude = ["payload"]
@@ -0,0 +1,189 @@
+"""Incremental JSON reading of large request bodies.
+
+`JSONStreamReader` walks a JSON document read from a stream chunk by chunk.
+Containers are iterated (`iter_object`, `iter_array`) and their members are
+either iterated in turn or decoded whole with `read_value`, so only the
+member being decoded and one chunk of the body are held in memory.
+A single value larger than `max_value_size` characters is rejected, and so
+are `NaN` and `Infinity` unless DRF's `STRICT_JSON` is disabled, as with
+the `JSONParser` of the other endpoints.
+"""
+
+import codecs
+import json
+import re
+
+from rest_framework.exceptions import ParseError
+from rest_framework.settings import api_settings
+
+WHITESPACE = " \t\n\r"
+
+DEFAULT_MAX_VALUE_SIZE = 1024 * 1024
+
+NUMBER_START = "-0123456789"
+NUMBER_END = re.compile(r"[^0-9.eE+-]")
+
+
+def strict_constant(constant):
+    raise ParseError(
+        f"JSON parse error - Out of range float values are not JSON compliant: "
+        f"{constant!r}"
+    )
+
+
+class JSONStreamReader:
+    def __init__(
+        self, stream, chunk_size=64 * 1024, max_value_size=DEFAULT_MAX_VALUE_SIZE
+    ):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.max_value_size = max_value_size
+        if api_settings.STRICT_JSON:
+            self.decoder = json.JSONDecoder(parse_constant=strict_constant)
+        else:
+            self.decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        # Characters dropped from the front of the buffer
+        self.consumed = 0
+        self.eof = False
+
+    def _fill(self):
+        """Read the next chunk, returns False at the end of the stream."""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            self.buffer += self._utf8.decode(b"", final=True)
+            return False
+        # Drop what was consumed already
+        self.buffer = self.buffer[self.pos :] + self._utf8.decode(chunk)
+        self.consumed += self.pos
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next significant character, "" at the end of the document."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ParseError(
+                f"JSON parse error - expected {char!r} at {self._where()}, "
+                f"found {found or 'end of data'!r}"
+            )
+        self.pos += 1
+
+    def read_value(self):
+        """Decode the next complete value."""
+        if self.peek() in NUMBER_START:
+            # A number is only complete once something else follows it
+            while not NUMBER_END.search(self.buffer, self.pos) and self._fill_value():
+                pass
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as exc:
+                # Most likely a value cut at the end of the buffer
+                if self._fill_value():
+                    continue
+                raise ParseError(
+                    f"JSON parse error - {exc.msg}: offset {self.consumed + exc.pos}"
+                )
+            self.pos = end
+            return value
+
+    def _fill_value(self):
+        if len(self.buffer) - self.pos > self.max_value_size:
+            raise ParseError(
+                f"JSON value at {self._where()} larger than "
+                f"{self.max_value_size} characters."
+            )
+        return self._fill()
+
+    def iter_object(self):
+        """Yield the keys of an object; the caller consumes each value."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise ParseError(
+                    f"JSON parse error - expected a key at {self._where()}"
+                )
+            key = self.read_value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("}")
+            return
+
+    def iter_array(self):
+        """Yield once per element of an array; the caller consumes each one."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+    def iter_values(self):
+        """Decode the elements of an array one at a time."""
+        for _ in self.iter_array():
+            yield self.read_value()
+
+    def skip_value(self):
+        """Consume the next value, iterating containers to bound memory."""
+        char = self.peek()
+        if char == "{":
+            for _ in self.iter_object():
+                self.skip_value()
+        elif char == "[":
+            for _ in self.iter_array():
+                self.skip_value()
+        else:
+            self.read_value()
+
+    def copy_value(self, out):
+        """Write the next value to the binary file `out` as compact JSON,
+        iterating containers to bound memory."""
+        char = self.peek()
+        if char == "{":
+            out.write(b"{")
+            for idx, key in enumerate(self.iter_object()):
+                out.write(b"," if idx else b"")
+                out.write(json.dumps(key).encode() + b":")
+                self.copy_value(out)
+            out.write(b"}")
+        elif char == "[":
+            out.write(b"[")
+            for idx, _ in enumerate(self.iter_array()):
+                out.write(b"," if idx else b"")
+                self.copy_value(out)
+            out.write(b"]")
+        else:
+            out.write(json.dumps(self.read_value()).encode())
+
+    def end(self):
+        if self.peek() != "":
+            raise ParseError(f"JSON parse error - extra data at {self._where()}")
+
+    def _where(self):
+        return f"offset {self.consumed + self.pos}"
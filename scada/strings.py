@@ -0,0 +1,132 @@
+"""Packed storage of the SCB string currents.
+
+An SCB has up to 24 strings, most have fewer. Their currents are stored in
+the `_scb_strings` column of the `SCB` row as little-endian float32 values,
+from `_scb_i1` up to the last string with a current, missing ones as NaN.
+A reading is written with a single INSERT and read without a join.
+
+`PackedStrings` gives the model the `_scb_i1`...`_scb_i24` attributes and
+the `strings` dict read and written by `SCBSerializer`. In SQL,
+`StringCurrent` reads a current out of the column with the `scb_string`
+function registered on SQLite connections.
+
+Only SQLite can read the currents in SQL. On other databases the currents
+are stored and served as well, but `has_string_function` is False: they are
+left out of the aggregation endpoint and of the rollups.
+
+float32 keeps about 7 significant digits, values are read back rounded to
+them: `8.53` is stored as `8.5299997...` and read as `8.53`.
+"""
+
+import math
+import struct
+
+from django.db import NotSupportedError, connection
+from django.db.models import F, FloatField, Func, Value
+
+SCB_STRINGS = 24
+STRING_FIELDS = [f"_scb_i{number}" for number in range(1, SCB_STRINGS + 1)]
+# Largest float32, greater currents cannot be packed
+FLOAT32_MAX = struct.unpack("<f", b"\xff\xff\x7f\x7f")[0]
+
+
+def pack_strings(strings):
+    """Pack a `{_scb_iN: current}` dict, None when it holds no current."""
+    values = [strings.get(name) for name in STRING_FIELDS] if strings else []
+    while values and values[-1] is None:
+        values.pop()
+    if not values:
+        return None
+    return struct.pack(
+        f"<{len(values)}f", *(math.nan if value is None else value for value in values)
+    )
+
+
+def unpack_strings(packed):
+    """The current of every string of a packed column, None if missing."""
+    values = [None] * SCB_STRINGS
+    if packed:
+        for index, value in enumerate(struct.unpack(f"<{len(packed) // 4}f", packed)):
+            values[index] = _read(value)
+    return values
+
+
+def _read(value):
+    if math.isnan(value):
+        return None
+    return float(f"{value:.7g}")
+
+
+def scb_string(packed, index):
+    """SQL function reading the current of string `index` (from 0)."""
+    if packed is None or len(packed) < 4 * index + 4:
+        return None
+    return _read(struct.unpack_from("<f", packed, 4 * index)[0])
+
+
+def register_functions(sender, connection, **kwargs):
+    """`connection_created` receiver adding `scb_string` to SQLite."""
+    if connection.vendor == "sqlite":
+        connection.connection.create_function(
+            "scb_string", 2, scb_string, deterministic=True
+        )
+
+
+def has_string_function():
+    """Whether the database reads the currents in SQL (`StringCurrent`)."""
+    return connection.vendor == "sqlite"
+
+
+class StringCurrent(Func):
+    """Current of the string `name` (`_scb_iN`), read from the packed
+    column. Only SQLite has the function to unpack it."""
+
+    function = "scb_string"
+    output_field = FloatField()
+
+    def __init__(self, name, column="_scb_strings"):
+        super().__init__(F(column), Value(STRING_FIELDS.index(name)))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(
+            f"String currents cannot be read in SQL on {connection.vendor}."
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+class PackedStrings:
+    """Attributes of the models storing the string currents packed in a
+    `_scb_strings` column."""
+
+    @property
+    def strings(self):
+        """The currents of the strings, `{_scb_iN: current}`. Assign a new
+        dict to change them."""
+        packed = self._scb_strings
+        unpacked = self.__dict__.get("_unpacked_strings")
+        if unpacked is None or unpacked[0] is not packed:
+            unpacked = self.__dict__["_unpacked_strings"] = (
+                packed,
+                dict(zip(STRING_FIELDS, unpack_strings(packed))),
+            )
+        return unpacked[1]
+
+    @strings.setter
+    def strings(self, strings):
+        self._scb_strings = pack_strings(strings)
+
+
+def _string_property(name):
+    def get(self):
+        return self.strings[name]
+
+    def set(self, value):
+        self.strings = {**self.strings, name: value}
+
+    return property(get, set)
+
+
+for _name in STRING_FIELDS:
+    setattr(PackedStrings, _name, _string_property(_name))
@@ -0,0 +1,76 @@
+import copy
+import json
+
+from django.conf import settings
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import override_settings
+from django.urls import include, path, reverse
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from scada import async_views, views
+
+
+with open(settings.BASE_DIR / "samples" / "suryalog-example-payload.json") as f:
+    SAMPLE_PAYLOAD = json.load(f)
+
+
+# `scada.urls` picks the async views when it is imported, the async tests
+# are routed to them here
+ASYNC_URLS = [
+    path("data/", async_views.AsyncDataView.as_view(), name="data-view"),
+    path(
+        "inverter/<str:devName>/",
+        async_views.AsyncInverterDetailView.as_view(),
+        name="inverter-view",
+    ),
+    path("plant/<str:uid>/", async_views.AsyncPlantDataView.as_view(), name="plant-view"),
+    path(
+        "plant/<str:uid>/stream/",
+        async_views.AsyncPlantStreamView.as_view(),
+        name="plant-stream-view",
+    ),
+    path("receipts/<uuid:receipt_id>/", views.IngestReceiptView.as_view(), name="receipt-view"),
+]
+
+
+urlpatterns = [path("api/v1/", include((ASYNC_URLS, "scada")))]
+
+
+def make_payload(timestamp=None, uid=None):
+    """Copy of the sample payload, at another `timestamp` or plant."""
+    payload = copy.deepcopy(SAMPLE_PAYLOAD)
+    if timestamp is not None:
+        payload["Timestamp"] = timestamp
+    if uid is not None:
+        payload["UID"] = uid
+    return payload
+
+
+# The writer thread of the ingestion queue has its own connection, outside
+# of the transaction of the test
+@override_settings(SCADA_INGEST_QUEUE=False)
+class ScadaTestCase(APITestCase):
+    def post_payload(self, payload):
+        # The plant snapshots are invalidated once the readings are committed
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse("scada:data-view"), payload, format="json")
+
+
+# Archiving a month creates a table, which SQLite cannot do in the
+# transaction of a `TestCase`
+@override_settings(SCADA_INGEST_QUEUE=False)
+class ScadaTransactionTestCase(APITransactionTestCase):
+    def post_payload(self, payload):
+        return self.client.post(reverse("scada:data-view"), payload, format="json")
+
+
+class MigrationTestCase(APITransactionTestCase):
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes("scada"))
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
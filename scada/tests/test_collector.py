@@ -0,0 +1,284 @@
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import unittest.mock
+from argparse import Namespace
+
+import httpx
+from django.test import SimpleTestCase
+
+import collector
+from spool import Spool
+from suryalog import Transformer
+
+from .base import SAMPLE_PAYLOAD
+
+
+class TransformerTests(SimpleTestCase):
+    def setUp(self):
+        self.transformer = Transformer(
+            {"INV1": "Inverter", "INV2": "Inverter", "WS1": "Weather"},
+            {
+                "Inverter": {"DC_V": "_inv_v", "DC_I": "_inv_i"},
+                "Weather": {"GHI": "_wms_ghi"},
+            },
+            {
+                "Inverter": ["devType", "devName", "DC_V", "DC_I", "TEMP"],
+                "Weather": ["devType", "devName", "GHI"],
+            },
+        )
+
+    def test_transform(self):
+        data = {
+            "1700000000": {
+                "INV1": {"_inv_v": 600, "_inv_i": 10},
+                "WS1": {"_wms_ghi": 800},
+                "INV2": {"_inv_v": 610},
+            },
+            "1700000300": {"INV2": {"_inv_v": 620, "_inv_i": 11}},
+        }
+        self.assertEqual(
+            self.transformer.transform(data),
+            {
+                1700000000: {
+                    "Inverter": [
+                        ["INV1", "INV1", 600, 10, None],
+                        ["INV2", "INV2", 610, None, None],
+                    ],
+                    "Weather": [["WS1", "WS1", 800]],
+                },
+                1700000300: {"Inverter": [["INV2", "INV2", 620, 11, None]]},
+            },
+        )
+
+    def test_transform_interval(self):
+        self.assertEqual(
+            self.transformer.transform_interval({"INV1": {"_inv_v": 600}}),
+            {"Inverter": [["INV1", "INV1", 600, None, None]]},
+        )
+
+    def test_unknown_devices_are_skipped(self):
+        data = {"1700000000": {"X1": {"_inv_v": 1}}, "1700000300": {"X1": {}}}
+        with self.assertLogs(level="WARNING") as logs:
+            result = self.transformer.transform(data)
+        self.assertEqual(result, {1700000000: {}, 1700000300: {}})
+        # Warned about once
+        self.assertEqual(len(logs.output), 1)
+
+
+class DerivedFieldTests(SimpleTestCase):
+    TAGS = ["devType", "devName", "V", "I", "W", "RATIO"]
+
+    def transform(self, rules, reading):
+        transformer = Transformer(
+            {"INV1": "Inverter"},
+            {"Inverter": {"V": "_inv_v", "I": "_inv_i", **rules}},
+            {"Inverter": self.TAGS},
+        )
+        row = transformer.transform({"1700000000": {"INV1": reading}})[1700000000]["Inverter"][0]
+        return dict(zip(self.TAGS, row))
+
+    def test_operations(self):
+        rules = {
+            "_w_multiply": {"target": "W", "sources": ["_inv_v", "I"]},
+            "ratio": {"target": "RATIO", "op": "ratio", "sources": ["V", "I"]},
+        }
+        row = self.transform(rules, {"_inv_v": 600, "_inv_i": 10})
+        self.assertEqual((row["W"], row["RATIO"]), (6000, 60))
+
+        row = self.transform(
+            {
+                "_w_sum": {"target": "W", "sources": ["V", "I"]},
+                "_ratio_scale": {"target": "RATIO", "sources": ["I"], "factor": 0.5},
+            },
+            {"_inv_v": 600, "_inv_i": 10},
+        )
+        self.assertEqual((row["W"], row["RATIO"]), (610, 5))
+
+    def test_null_sources(self):
+        rules = {
+            "_w_multiply": {"target": "W", "sources": ["V", "I"]},
+            "_r_ratio": {"target": "RATIO", "sources": ["V", "I"]},
+        }
+        row = self.transform(rules, {"_inv_v": 600})
+        self.assertEqual((row["W"], row["RATIO"]), (None, None))
+        # Division by zero and non-numeric readings give null too
+        self.assertIsNone(self.transform(rules, {"_inv_v": 600, "_inv_i": 0})["RATIO"])
+        self.assertIsNone(self.transform(rules, {"_inv_v": "n/a", "_inv_i": 2})["RATIO"])
+        # Not repeated by `multiply`
+        row = self.transform(rules, {"_inv_v": "2", "_inv_i": 3})
+        self.assertEqual((row["W"], row["RATIO"]), (None, None))
+        self.assertIsNone(self.transform(rules, {"_inv_v": True, "_inv_i": 3})["W"])
+
+    def test_invalid_rules(self):
+        for rules in [
+            {"_w_power": {"target": "W", "sources": ["V", "I"]}},
+            {"_w_ratio": {"target": "W", "sources": ["V"]}},
+            {"_w_sum": {"target": "X", "sources": ["V", "I"]}},
+        ]:
+            with self.subTest(rules=rules), self.assertRaises(ValueError):
+                self.transform(rules, {})
+
+
+class CollectorPlantsTests(SimpleTestCase):
+    def get_plants(self, plants, plant=None):
+        with unittest.mock.patch.multiple(
+            collector, SURYALOG_PLANTS=plants, SURYALOG_PLANT=plant
+        ):
+            return collector.get_plants()
+
+    def test_plants(self):
+        self.assertEqual(self.get_plants("a:UID1, b:UID2"), [("a", "UID1"), ("b", "UID2")])
+        self.assertEqual(self.get_plants(None, "a"), [("a", collector.DEFAULT_UID)])
+
+    def test_plants_need_a_uid_of_their_own(self):
+        for plants in ["a:UID1,b", "a", "a:UID1,b:UID1", "a:UID1,"]:
+            with self.subTest(plants=plants), self.assertRaises(SystemExit):
+                self.get_plants(plants)
+
+
+class CollectorBackfillTests(SimpleTestCase):
+    start = SAMPLE_PAYLOAD["Timestamp"] // 3600 * 3600
+    window = 3 * collector.INTERVAL
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.device = next(iter(collector.transformer.device_plans))
+        # Every interval of the first window is stored, one of the second
+        self.stored = [self.start + n * collector.INTERVAL for n in range(4)]
+        self.fetched = []
+        self.sent = []
+
+    def handler(self, request):
+        if request.url == collector.SURYALOG_URL:
+            params = json.loads(request.content)
+            self.fetched.append((params["stime"], params["etime"]))
+            data = {
+                str(timestamp): {self.device: {}}
+                for timestamp in range(params["stime"], params["etime"], collector.INTERVAL)
+            }
+            return httpx.Response(
+                200,
+                json={"result": 0, "data": data, "cmsg": "", "server_time": 0},
+            )
+        if request.method == "GET":
+            stime, etime = int(request.url.params["from"]), int(request.url.params["to"])
+            timestamps = [t for t in self.stored if stime <= t < etime]
+            return httpx.Response(200, json={"timestamps": timestamps})
+        self.sent.append(json.loads(gzip.decompress(request.content)))
+        return httpx.Response(201, json={"detail": "Created"})
+
+    def backfill(self, end):
+        args = Namespace(
+            window=self.window,
+            checkpoint=os.path.join(self.directory, "checkpoint.json"),
+            rate=0,
+            fetch_concurrency=1,
+            concurrency=1,
+            retries=0,
+        )
+
+        async def run():
+            transport = httpx.MockTransport(self.handler)
+            async with httpx.AsyncClient(transport=transport) as client:
+                await collector.backfill(
+                    client, spool, [("plant", "UID1")], self.start, end, args
+                )
+
+        spool = Spool(os.path.join(self.directory, "spool"), fsync="never")
+        self.addCleanup(spool.close)
+        with self.assertLogs(level="INFO"):
+            asyncio.run(run())
+        return spool
+
+    def test_backfill_sends_the_missing_intervals(self):
+        end = self.start + 2 * self.window
+        spool = self.backfill(end)
+        self.assertEqual(self.fetched, [(self.start + self.window, end)])
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(self.sent[0]["UID"], "UID1")
+        self.assertEqual(
+            [interval["Timestamp"] for interval in self.sent[0]["Intervals"]],
+            [self.start + n * collector.INTERVAL for n in (4, 5)],
+        )
+        self.assertEqual(list(spool.pending()), [])
+
+    def test_checkpoint_skips_completed_windows(self):
+        self.backfill(self.start + 2 * self.window)
+        self.fetched.clear()
+        self.sent.clear()
+        self.backfill(self.start + 3 * self.window)
+        # Only the new window is looked at
+        end = self.start + 3 * self.window
+        self.assertEqual(self.fetched, [(end - self.window, end)])
+        self.assertEqual(len(self.sent), 1)
+
+
+class SpoolTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def open_spool(self, **kwargs):
+        spool = Spool(self.directory, fsync="never", **kwargs)
+        self.addCleanup(spool.close)
+        return spool
+
+    def test_unacknowledged_records_are_replayed(self):
+        spool = self.open_spool()
+        positions = [spool.append({"Timestamp": number}) for number in range(3)]
+        spool.ack(positions[0])
+        spool.close()
+
+        spool = self.open_spool()
+        self.assertEqual(
+            list(spool.pending()),
+            [(positions[1], {"Timestamp": 1}), (positions[2], {"Timestamp": 2})],
+        )
+        for position, _ in spool.pending():
+            spool.ack(position)
+        self.assertEqual(list(spool.pending()), [])
+        spool.close()
+        self.assertEqual(list(self.open_spool().pending()), [])
+
+    def test_out_of_order_acknowledgement(self):
+        spool = self.open_spool()
+        positions = [spool.append({"Timestamp": number}) for number in range(3)]
+        spool.ack(positions[1])
+        self.assertEqual(
+            [position for position, _ in spool.pending()], [positions[0], positions[2]]
+        )
+        spool.close()
+
+        # Only remembered in memory: sent again after a restart
+        spool = self.open_spool()
+        self.assertEqual([position for position, _ in spool.pending()], positions)
+
+    def test_acknowledged_segments_are_deleted(self):
+        spool = self.open_spool(segment_bytes=64)
+        positions = [spool.append({"Data": "x" * 40}) for _ in range(4)]
+        self.assertEqual(len(spool.segments()), 4)
+
+        for position in positions[:3]:
+            spool.ack(position)
+        self.assertEqual(spool.segments(), [positions[3][0]])
+        self.assertEqual([position for position, _ in spool.pending()], positions[3:])
+
+    def test_torn_record_is_truncated(self):
+        spool = self.open_spool()
+        position = spool.append({"Timestamp": 0})
+        spool.close()
+        with open(os.path.join(self.directory, "000000000001.log"), "ab") as f:
+            f.write(b"\x00\x00\x01\x00{")
+
+        with self.assertLogs(level="WARNING"):
+            spool = self.open_spool()
+        later = spool.append({"Timestamp": 1})
+        self.assertEqual(
+            list(spool.pending()), [(position, {"Timestamp": 0}), (later, {"Timestamp": 1})]
+        )
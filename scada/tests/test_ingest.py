@@ -0,0 +1,496 @@
+import asyncio
+import gzip
+import io
+import json
+import tempfile
+import time
+import unittest
+import unittest.mock
+import uuid
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITransactionTestCase
+
+from scada import ingest, views
+from scada.ingest_queue import IngestJob, IngestQueue
+from scada.live import get_plant_feed
+from scada.models import SCB, IngestReceipt, Inverter, LatestReading, Meter, Plant, Rollup, Weather
+from scada.parsers import msgpack
+from scada.validation import get_tag_plan, tag_plan_cache_info
+
+from .base import SAMPLE_PAYLOAD, ScadaTestCase, make_payload
+
+
+class IngestTests(ScadaTestCase):
+    def test_rows_are_saved_per_device_table(self):
+        payload = make_payload()
+        self.assertEqual(self.post_payload(payload).status_code, 201)
+        for model in [Inverter, Plant, Weather, Meter, SCB]:
+            with self.subTest(model=model.__name__):
+                self.assertEqual(
+                    model.objects.count(), len(payload["Data"][model.__name__])
+                )
+
+    def test_payload_is_saved_in_one_transaction(self):
+        bulk_upsert = ingest._bulk_upsert
+
+        def fail_on_scb(model, instances, **kwargs):
+            if model is SCB:
+                raise RuntimeError("SCB table is unavailable")
+            return bulk_upsert(model, instances, **kwargs)
+
+        with unittest.mock.patch.object(ingest, "_bulk_upsert", fail_on_scb):
+            with self.assertRaises(RuntimeError):
+                self.post_payload(make_payload())
+        # The tables written before SCB are rolled back with it
+        self.assertFalse(Inverter.objects.exists())
+        self.assertFalse(LatestReading.objects.exists())
+
+    def test_resend_is_idempotent(self):
+        payload = make_payload()
+        self.assertEqual(self.post_payload(payload).status_code, 201)
+        counts = (Inverter.objects.count(), SCB.objects.count(), LatestReading.objects.count())
+        rollups = list(Rollup.objects.order_by("pk").values_list("field", "readings", "sum"))
+
+        self.assertEqual(self.post_payload(payload).status_code, 201)
+        self.assertEqual(
+            (Inverter.objects.count(), SCB.objects.count(), LatestReading.objects.count()),
+            counts,
+        )
+        self.assertEqual(
+            list(Rollup.objects.order_by("pk").values_list("field", "readings", "sum")),
+            rollups,
+        )
+
+    def test_resend_updates_the_reading(self):
+        payload = make_payload()
+        self.post_payload(payload)
+        payload["Data"]["Inverter"][0][2] = 123.5
+        self.assertEqual(self.post_payload(payload).status_code, 201)
+
+        devType, devName = payload["Data"]["Inverter"][0][:2]
+        inverter = Inverter.objects.get(devType=devType, devName=devName)
+        self.assertEqual(inverter._inv_vin, 123.5)
+        self.assertEqual(Inverter.objects.count(), len(payload["Data"]["Inverter"]))
+
+
+class BatchIngestTests(ScadaTestCase):
+    def post_batch(self, intervals, tags=None):
+        batch = {
+            "UID": SAMPLE_PAYLOAD["UID"],
+            "Tags": SAMPLE_PAYLOAD["Tags"] if tags is None else tags,
+            "Intervals": intervals,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse("scada:batch-data-view"), batch, format="json")
+
+    def interval(self, timestamp):
+        return {"Timestamp": timestamp, "Data": SAMPLE_PAYLOAD["Data"]}
+
+    def test_intervals_are_stored(self):
+        timestamp = SAMPLE_PAYLOAD["Timestamp"]
+        response = self.post_batch([self.interval(timestamp), self.interval(timestamp + 300)])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            set(Inverter.objects.values_list("timestamp", flat=True)),
+            {timestamp, timestamp + 300},
+        )
+        self.assertEqual(Inverter.objects.count(), 2 * len(SAMPLE_PAYLOAD["Data"]["Inverter"]))
+
+    def test_malformed_intervals_are_reported(self):
+        timestamp = SAMPLE_PAYLOAD["Timestamp"]
+        response = self.post_batch(
+            [
+                1,
+                {"Timestamp": timestamp, "Data": []},
+                {"Timestamp": timestamp},
+                {"Timestamp": timestamp, "Data": {"Inverter": 5}},
+                self.interval(timestamp),
+            ]
+        )
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response.data["errors"],
+            {
+                "0": {"non_field_errors": ["Expected an object."]},
+                "1": {"Data": ["Expected an object."]},
+                "2": {"missing_required_attributes": ["Data"]},
+                "3": {"Inverter": ["Expected a list of rows."]},
+            },
+        )
+        self.assertEqual(Inverter.objects.count(), len(SAMPLE_PAYLOAD["Data"]["Inverter"]))
+
+    def test_missing_tags_are_rejected(self):
+        tags = {**SAMPLE_PAYLOAD["Tags"]}
+        del tags["Inverter"]
+        response = self.post_batch([self.interval(SAMPLE_PAYLOAD["Timestamp"])], tags)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"Tags": ["Missing the tags of Inverter."]})
+        self.assertFalse(Inverter.objects.exists())
+
+    def test_intervals_must_be_a_list(self):
+        response = self.post_batch({"0": self.interval(SAMPLE_PAYLOAD["Timestamp"])})
+        self.assertEqual(response.status_code, 400)
+
+
+class ValidationTests(ScadaTestCase):
+    def invalid_payload(self):
+        payload = make_payload()
+        inverters = payload["Data"]["Inverter"]
+        inverters[0] = inverters[0][:-1]
+        inverters[1][2] = "abc"
+        inverters[2][1] = None
+        inverters[3][2] = 10**400
+        payload["Data"]["Meter"][0][2] = {"value": 1}
+        return payload
+
+    def post_invalid_payload(self):
+        response = self.post_payload(self.invalid_payload())
+        rows = list(Inverter.objects.order_by("devType", "devName").values())
+        for row in rows:
+            del row["id"]
+        return response, rows
+
+    def test_fast_validation_matches_serializers(self):
+        with self.settings(SCADA_FAST_VALIDATION=False):
+            response, rows = self.post_invalid_payload()
+        Inverter.objects.all().delete()
+        with self.settings(SCADA_FAST_VALIDATION=True):
+            fast_response, fast_rows = self.post_invalid_payload()
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(set(response.data["errors"]), {"Inverter", "Meter"})
+        self.assertEqual(len(response.data["errors"]["Inverter"]), 4)
+        self.assertIn("too large", response.data["errors"]["Inverter"][3])
+        self.assertEqual(fast_response.status_code, 206)
+        self.assertEqual(fast_response.data, response.data)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(fast_rows, rows)
+
+
+class TagPlanTests(ScadaTestCase):
+    def setUp(self):
+        get_tag_plan.cache_clear()
+
+    def test_plans_are_reused_across_payloads(self):
+        device_types = len(SAMPLE_PAYLOAD["Tags"])
+        self.post_payload(make_payload())
+        self.assertEqual(tag_plan_cache_info()["misses"], device_types)
+        self.post_payload(make_payload(timestamp=SAMPLE_PAYLOAD["Timestamp"] + 300))
+        info = tag_plan_cache_info()
+        self.assertEqual((info["hits"], info["misses"]), (device_types, device_types))
+
+    def test_unknown_tags_are_ignored(self):
+        payload = make_payload()
+        payload["Tags"]["Inverter"].append("_inv_unknown")
+        for row in payload["Data"]["Inverter"]:
+            row.append(1.0)
+        with self.assertLogs("scada.validation", level="WARNING") as logs:
+            self.assertEqual(self.post_payload(payload).status_code, 201)
+            self.post_payload(payload)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("_inv_unknown", logs.output[0])
+        self.assertEqual(Inverter.objects.count(), len(payload["Data"]["Inverter"]))
+
+
+class PayloadFormatTests(ScadaTestCase):
+    def post_body(self, body, content_type="application/json", **headers):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("scada:data-view"), body, content_type=content_type, headers=headers
+            )
+
+    def test_gzip_json(self):
+        body = gzip.compress(json.dumps(make_payload()).encode())
+        self.assertEqual(self.post_body(body, content_encoding="gzip").status_code, 201)
+        self.assertEqual(Inverter.objects.count(), 5)
+
+    def test_invalid_gzip(self):
+        response = self.post_body(b"not gzip", content_encoding="gzip")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post_body(b"{}", content_encoding="br").status_code, 415)
+
+    @override_settings(SCADA_MAX_DECOMPRESSED_SIZE=1024)
+    def test_decompressed_size_is_bounded(self):
+        body = gzip.compress(json.dumps(make_payload()).encode())
+        response = self.post_body(body, content_encoding="gzip")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Inverter.objects.count(), 0)
+
+    def test_json_non_finite_floats(self):
+        body = json.dumps(make_payload()).replace("640.7", "NaN", 1)
+        self.assertEqual(self.post_body(body).status_code, 400)
+
+    @unittest.skipIf(msgpack is None, "MessagePack payloads need msgpack")
+    def test_msgpack(self):
+        body = msgpack.packb(make_payload())
+        self.assertEqual(self.post_body(body, "application/msgpack").status_code, 201)
+        response = self.post_body(
+            gzip.compress(body), "application/msgpack", content_encoding="gzip"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Inverter.objects.count(), 5)
+
+    @unittest.skipIf(msgpack is None, "MessagePack payloads need msgpack")
+    def test_msgpack_non_finite_floats(self):
+        for value in [float("inf"), float("-inf"), float("nan")]:
+            with self.subTest(value=value):
+                payload = make_payload()
+                payload["Data"]["Inverter"][0][2] = value
+                response = self.post_body(msgpack.packb(payload), "application/msgpack")
+                self.assertEqual(response.status_code, 400)
+        payload = make_payload(float("inf"))
+        response = self.post_body(msgpack.packb(payload), "application/msgpack")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Inverter.objects.count(), 0)
+
+
+class StreamIngestTests(ScadaTestCase):
+    def post_stream(self, payload, **headers):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("scada:stream-data-view"),
+                body,
+                content_type="application/json",
+                headers=headers,
+            )
+
+    def stored_inverters(self):
+        return list(
+            Inverter.objects.order_by("timestamp", "devName").values_list(
+                "timestamp", "devName", "_inv_vin"
+            )
+        )
+
+    def test_sample_payload(self):
+        # `Data` comes before `UID` and `Timestamp` in the sample
+        self.assertEqual(self.post_stream(SAMPLE_PAYLOAD).status_code, 201)
+        stored = self.stored_inverters()
+        Inverter.objects.all().delete()
+        self.assertEqual(self.post_payload(SAMPLE_PAYLOAD).status_code, 201)
+        self.assertEqual(stored, self.stored_inverters())
+
+    def test_rows_are_saved_by_chunks(self):
+        payload = {key: SAMPLE_PAYLOAD[key] for key in ["Tags", "UID", "Timestamp", "Data"]}
+        with unittest.mock.patch.object(views.StreamDataView, "chunk_size", 2):
+            response = self.post_stream(
+                gzip.compress(json.dumps(payload).encode()), content_encoding="gzip"
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Inverter.objects.count(), len(SAMPLE_PAYLOAD["Data"]["Inverter"]))
+
+    def test_data_or_intervals_once(self):
+        interval = {"Timestamp": SAMPLE_PAYLOAD["Timestamp"], "Data": SAMPLE_PAYLOAD["Data"]}
+        payload = json.dumps(SAMPLE_PAYLOAD)[:-1]
+        for extra in [
+            f', "Intervals": {json.dumps([interval])}}}',
+            f', "Data": {json.dumps(SAMPLE_PAYLOAD["Data"])}}}',
+        ]:
+            with self.subTest(extra=extra[:12]):
+                response = self.post_stream((payload + extra).encode())
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("either Data or Intervals", str(response.data))
+
+    def test_batch_in_any_order(self):
+        timestamp = SAMPLE_PAYLOAD["Timestamp"]
+        batch = {
+            "Intervals": [
+                {"Data": SAMPLE_PAYLOAD["Data"], "Timestamp": timestamp},
+                {"Timestamp": timestamp + 300, "Data": SAMPLE_PAYLOAD["Data"]},
+                {"Timestamp": timestamp + 600},
+                [],
+            ],
+            "UID": SAMPLE_PAYLOAD["UID"],
+            "Tags": SAMPLE_PAYLOAD["Tags"],
+        }
+        response = self.post_stream(batch)
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response.data["errors"],
+            {
+                "2": {"missing_required_attributes": ["Data"]},
+                "3": {"non_field_errors": ["Expected an object."]},
+            },
+        )
+        self.assertEqual(
+            set(Inverter.objects.values_list("timestamp", flat=True)),
+            {timestamp, timestamp + 300},
+        )
+
+    def test_malformed_rows(self):
+        payload = make_payload()
+        payload["Data"]["Inverter"][0] = 5
+        payload["Data"]["Inverter"][1] = {}
+        payload["Data"]["Meter"] = "rows"
+        for name, post in [("data", self.post_payload), ("stream", self.post_stream)]:
+            for fast in (False, True):
+                with self.subTest(endpoint=name, fast=fast), self.settings(
+                    SCADA_FAST_VALIDATION=fast
+                ):
+                    response = post(payload)
+                    self.assertEqual(response.status_code, 206)
+                    self.assertEqual(
+                        response.data["errors"],
+                        {
+                            "Inverter": [
+                                "[Index: 0] Expected a list of values.",
+                                "[Index: 1] Expected a list of values.",
+                            ],
+                            "Meter": ["Expected a list of rows."],
+                        },
+                    )
+
+    def test_missing_attributes(self):
+        payload = {key: SAMPLE_PAYLOAD[key] for key in ["Data", "Tags", "UID"]}
+        response = self.post_stream(payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {"missing_required_attributes": ["Timestamp"]})
+        self.assertEqual(Inverter.objects.count(), 0)
+
+    def test_non_finite_floats(self):
+        body = json.dumps(make_payload()).replace("640.7", "NaN", 1)
+        self.assertEqual(self.post_stream(body.encode()).status_code, 400)
+
+
+# The writer thread commits on its own connection
+class IngestQueueTests(APITransactionTestCase):
+    def validated_rows(self, payload):
+        view = views.DataView()
+        validated, _ = view._validate_data(
+            payload["Data"],
+            payload["Tags"],
+            {"timestamp": payload["Timestamp"], "uid": payload["UID"]},
+        )
+        return view._rows_by_model(validated)
+
+    def start_queue(self):
+        ingest_queue = IngestQueue()
+        self.addCleanup(ingest_queue.close)
+        return ingest_queue
+
+    def test_receipt_is_committed(self):
+        job = self.start_queue().submit(self.validated_rows(make_payload()), receipt=True)
+        self.assertEqual(job.future.result(timeout=10), job.rows)
+
+        response = self.client.get(reverse("scada:receipt-view", args=[job.receipt_id]))
+        self.assertEqual(response.data["status"], IngestReceipt.COMMITTED)
+        self.assertNotIn("payload", response.data)
+        self.assertIsNone(IngestReceipt.objects.get().payload)
+        self.assertEqual(Inverter.objects.count(), 5)
+
+    def test_receipts_are_stored_by_the_writer(self):
+        ingest_queue = self.start_queue()
+        rows = self.validated_rows(make_payload())
+        # The request thread only queues the job
+        with self.assertNumQueries(0):
+            job = ingest_queue.submit(rows, receipt=True)
+        self.assertEqual(job.accepted.result(timeout=10), job.receipt_id)
+        self.assertTrue(IngestReceipt.objects.filter(pk=job.receipt_id).exists())
+        job.future.result(timeout=10)
+
+    def test_pending_receipts_are_replayed(self):
+        # Accepted by a process killed before writing it
+        job = IngestJob(self.validated_rows(make_payload()), uuid.uuid4())
+        job.pending_receipt().save(force_insert=True)
+
+        self.start_queue().close()
+        receipt = IngestReceipt.objects.get()
+        self.assertEqual(receipt.status, IngestReceipt.COMMITTED)
+        self.assertIsNone(receipt.payload)
+        self.assertEqual(Inverter.objects.count(), 5)
+        self.assertEqual(SCB.objects.get()._scb_i1, SAMPLE_PAYLOAD["Data"]["SCB"][0][7])
+
+
+@override_settings(ROOT_URLCONF="scada.tests.base", SCADA_INGEST_QUEUE=True)
+class AsyncIngestQueueTests(APITransactionTestCase):
+    async def test_receipt(self):
+        response = await self.async_client.post(
+            reverse("scada:data-view"),
+            make_payload(),
+            content_type="application/json",
+            headers={"Prefer": "respond-async"},
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(
+            response["Location"], reverse("scada:receipt-view", args=[response.data["receipt"]])
+        )
+
+        deadline = time.monotonic() + 10
+        while True:
+            receipt = await self.async_client.get(response["Location"])
+            if receipt.data["status"] != IngestReceipt.PENDING or time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(receipt.data["status"], IngestReceipt.COMMITTED)
+        self.assertEqual(await Inverter.objects.acount(), 5)
+
+
+# The writer thread commits on its own connection
+class PlantFeedIngestTests(APITransactionTestCase):
+    def test_closed_loop_does_not_fail_the_ingestion(self):
+        loop = asyncio.new_event_loop()
+        subscription = get_plant_feed().subscribe(SAMPLE_PAYLOAD["UID"], loop=loop)
+        self.addCleanup(get_plant_feed().unsubscribe, subscription)
+        loop.close()
+
+        ingest_queue = IngestQueue()
+        self.addCleanup(ingest_queue.close)
+        rows = IngestQueueTests.validated_rows(self, make_payload())
+        job = ingest_queue.submit(rows, receipt=True)
+        self.assertEqual(job.future.result(timeout=10), job.rows)
+        self.assertEqual(IngestReceipt.objects.get().status, IngestReceipt.COMMITTED)
+
+
+class ImportSuryalogTests(ScadaTestCase):
+    response = str(settings.BASE_DIR / "samples" / "suryalog-api-response.json")
+
+    def import_suryalog(self, *files, **options):
+        stdout = io.StringIO()
+        call_command(
+            "import_suryalog",
+            *files,
+            uid="UID1",
+            workers=0,
+            stdout=stdout,
+            stderr=io.StringIO(),
+            **options,
+        )
+        return stdout.getvalue()
+
+    def test_import(self):
+        output = self.import_suryalog(self.response, transaction_size=10)
+        self.assertIn("Imported 102 readings from 1 files", output)
+        self.assertEqual(Inverter.objects.filter(uid="UID1").count(), 3 * 13)
+        self.assertEqual(SCB.objects.count(), 3 * 13)
+        self.assertEqual(len(set(Meter.objects.values_list("timestamp", flat=True))), 3)
+
+        # Imported again, the readings are overwritten
+        self.import_suryalog(self.response)
+        self.assertEqual(Inverter.objects.count(), 3 * 13)
+
+    def test_invalid_files(self):
+        for content in [
+            {"result": 1, "data": {}},
+            [{"result": 0}],
+            {"result": 0, "data": {"1700000000": ["I1"]}},
+        ]:
+            with self.subTest(content=content), tempfile.NamedTemporaryFile(
+                "w", suffix=".json"
+            ) as f:
+                json.dump(content, f)
+                f.flush()
+                with self.assertRaisesMessage(CommandError, "1 files could not be imported"):
+                    self.import_suryalog(f.name, self.response)
+            # The other files are imported all the same
+            self.assertEqual(Inverter.objects.count(), 3 * 13)
+
+        with self.assertRaisesMessage(CommandError, "No such files"):
+            self.import_suryalog("missing.json")
@@ -0,0 +1,137 @@
+import io
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from scada.models import Inverter, Rollup
+from scada.rollups import rebuild_rollups
+
+from .base import SAMPLE_PAYLOAD, MigrationTestCase, ScadaTestCase, make_payload
+
+
+class AggregateTests(ScadaTestCase):
+    start = SAMPLE_PAYLOAD["Timestamp"] // 3600 * 3600
+    end = start + 3 * 3600
+
+    def setUp(self):
+        self.post_readings()
+
+    def post_readings(self, uid=None):
+        tags = SAMPLE_PAYLOAD["Tags"]["Inverter"]
+        power, yield_ = tags.index("_inv_w"), tags.index("_inv_dayyld")
+        # Values exact in binary, so that sums do not depend on their order
+        for number, timestamp in enumerate(range(self.start, self.end, 15 * 60)):
+            payload = make_payload(timestamp, uid)
+            for index, row in enumerate(payload["Data"]["Inverter"]):
+                row[power] = None if number == 2 else 1000 + 250 * number - 10 * index
+                row[yield_] = 0.5 * number
+            self.post_payload(payload)
+
+    def aggregate(self, **params):
+        response = self.client.get(
+            reverse("scada:aggregate-view", args=["Inverter"]),
+            {"fields": "_inv_w,_inv_dayyld", "agg": "avg,min,max,sum,last", **params},
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def test_rollups_match_raw_readings(self):
+        for params in [
+            {"bucket": "1h", "from": self.start, "to": self.end},
+            {"bucket": "1h", "from": self.start + 3600, "devName": "INVERTER_2"},
+            {"bucket": "1d"},
+        ]:
+            with self.subTest(**params):
+                results = self.aggregate(**params)
+                with self.settings(SCADA_ROLLUP_FIELDS={}):
+                    raw = self.aggregate(**params)
+                self.assertTrue(results)
+                self.assertEqual(results, raw)
+
+        # The results above were read from the rollups
+        Rollup.objects.all().delete()
+        self.assertEqual(self.aggregate(bucket="1d"), [])
+
+    def test_buckets(self):
+        names = [row[1] for row in SAMPLE_PAYLOAD["Data"]["Inverter"]]
+        offset = 10 * names.index("INVERTER_2")
+        results = self.aggregate(bucket="1h", devName="INVERTER_2")
+        self.assertEqual(
+            [result["bucket"] for result in results], list(range(self.start, self.end, 3600))
+        )
+        # The power of the third reading of every hour is null
+        power = [1000 - offset, 1250 - offset, 1750 - offset]
+        self.assertEqual(results[0]["count"], 4)
+        self.assertEqual(
+            results[0]["_inv_w"],
+            {
+                "avg": sum(power) / 3,
+                "min": min(power),
+                "max": max(power),
+                "sum": sum(power),
+                "last": power[-1],
+            },
+        )
+        self.assertEqual(
+            results[0]["_inv_dayyld"],
+            {"avg": 0.75, "min": 0.0, "max": 1.5, "sum": 3.0, "last": 1.5},
+        )
+
+        results = self.aggregate(bucket="1d", devName="INVERTER_2", agg="sum")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["count"], 12)
+        self.assertEqual(set(results[0]["_inv_w"]), {"sum"})
+
+    def test_invalid_parameters(self):
+        url = reverse("scada:aggregate-view", args=["Inverter"])
+        for params in [
+            {"fields": "_inv_w", "bucket": "2h"},
+            {"fields": "_inv_w", "agg": "median"},
+            {"fields": "devName"},
+        ]:
+            with self.subTest(**params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+        url = reverse("scada:aggregate-view", args=["Battery"])
+        self.assertEqual(self.client.get(url, {"fields": "_inv_w"}).status_code, 404)
+
+    def test_rebuilt_rollups_match_ingested_ones(self):
+        fields = ["uid", "devName", "period", "bucket", "field", "readings", "sum", "last"]
+        inverters = Rollup.objects.filter(device_type="Inverter").order_by(*fields[:5])
+        rollups = list(inverters.values_list(*fields))
+        self.assertEqual({rollup[4] for rollup in rollups}, {"_inv_w", "_inv_dayyld"})
+
+        call_command("rebuild_rollups", device_type=["Inverter"], stdout=io.StringIO())
+        self.assertEqual(list(inverters.values_list(*fields)), rollups)
+
+    def test_fields_not_rolled_up_are_read_raw(self):
+        results = self.aggregate(fields="_inv_vin", bucket="1h")
+        self.assertEqual(len(results), 3 * 3)
+        self.assertEqual({result["count"] for result in results}, {4, 12})
+
+
+class RollupMigrationTests(MigrationTestCase):
+    def test_migrated_rollups_match_rebuilt_ones(self):
+        apps = self.migrate([("scada", "0004_inverter_devname_timestamp_index")])
+        Inverter = apps.get_model("scada", "Inverter")
+        start = SAMPLE_PAYLOAD["Timestamp"] // 3600 * 3600
+        for number, timestamp in enumerate(range(start, start + 3 * 3600, 20 * 60)):
+            for name in ["INVERTER_1", "INVERTER_2"]:
+                Inverter.objects.create(
+                    uid="UID",
+                    devType="11",
+                    devName=name,
+                    timestamp=timestamp,
+                    _inv_w=None if number == 4 else 1000.0 + 250 * number,
+                    _inv_dayyld=0.5 * number,
+                )
+
+        apps = self.migrate([("scada", "0005_rollup")])
+        Rollup = apps.get_model("scada", "Rollup")
+        fields = ["uid", "devName", "period", "bucket", "field", "readings", "count"]
+        fields += ["min", "max", "sum", "last", "last_timestamp"]
+        rollups = list(Rollup.objects.order_by(*fields[:5]).values_list(*fields))
+        self.assertEqual(len(rollups), 2 * 2 * (3 + 1))
+
+        Rollup.objects.all().delete()
+        rebuild_rollups(Rollup, apps.get_model("scada", "Inverter"))
+        self.assertEqual(list(Rollup.objects.order_by(*fields[:5]).values_list(*fields)), rollups)
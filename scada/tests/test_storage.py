@@ -0,0 +1,390 @@
+import datetime
+import io
+import json
+import unittest
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.exceptions import IrreversibleError
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from scada.export import export_columns, pyarrow
+from scada.management.commands import purge_readings
+from scada.models import SCB, Inverter, LatestReading, ReadingPartition, Rollup
+from scada.partitions import parse_month, partition_model, partition_table
+from scada.retention import purge_readings as purge_model_readings
+from scada.strings import FLOAT32_MAX, STRING_FIELDS, pack_strings, unpack_strings
+
+from .base import (
+    SAMPLE_PAYLOAD,
+    MigrationTestCase,
+    ScadaTestCase,
+    ScadaTransactionTestCase,
+    make_payload,
+)
+
+
+class UniqueReadingsMigrationTests(MigrationTestCase):
+    def test_duplicates_are_removed(self):
+        apps = self.migrate([("scada", "0006_inverter_mppt_power")])
+        Inverter = apps.get_model("scada", "Inverter")
+        SCB = apps.get_model("scada", "SCB")
+        SCBString = apps.get_model("scada", "SCBString")
+        reading = {"uid": "UID", "devType": "11", "timestamp": SAMPLE_PAYLOAD["Timestamp"]}
+        for power in [1.0, 2.0, 3.0]:
+            Inverter.objects.create(devName="INVERTER_1", _inv_w=power, **reading)
+        Inverter.objects.create(devName="INVERTER_2", _inv_w=4.0, **reading)
+        for current in [1.5, 2.5]:
+            scb = SCB.objects.create(devName="SCB_1", **reading)
+            SCBString.objects.create(scb=scb, _scb_i1=current)
+
+        apps = self.migrate([("scada", "0007_unique_readings")])
+        Inverter = apps.get_model("scada", "Inverter")
+        self.assertEqual(
+            sorted(Inverter.objects.values_list("devName", "_inv_w")),
+            [("INVERTER_1", 3.0), ("INVERTER_2", 4.0)],
+        )
+        self.assertEqual(
+            list(apps.get_model("scada", "SCBString").objects.values_list("_scb_i1", flat=True)),
+            [2.5],
+        )
+        Rollup = apps.get_model("scada", "Rollup")
+        rollups = Rollup.objects.filter(devName="INVERTER_1", field="_inv_w")
+        self.assertEqual(set(rollups.values_list("readings", "sum")), {(1, 3.0)})
+
+
+class PartitionTests(ScadaTransactionTestCase):
+    october = SAMPLE_PAYLOAD["Timestamp"]
+    november = parse_month("2022-11") + 3600
+
+    def setUp(self):
+        self.post_payload(make_payload(self.october))
+        self.post_payload(make_payload(self.november))
+        # Only in the archived month, so its latest reading is archived too
+        self.post_payload(make_payload(self.october, uid="ARCHIVED"))
+        self.partition_readings(archive_before="2022-11")
+
+    def tearDown(self):
+        self.partition_readings(drop_before="2022-11")
+
+    def partition_readings(self, **options):
+        call_command("partition_readings", stdout=io.StringIO(), **options)
+
+    def get_inverter_timestamps(self, **params):
+        response = self.client.get(
+            reverse("scada:inverter-view", args=["INVERTER_2"]), {"fields": "timestamp", **params}
+        )
+        return [
+            row["timestamp"] for row in json.loads(b"".join(response.streaming_content))["results"]
+        ]
+
+    def test_archived_months_are_still_served(self):
+        self.assertEqual(
+            set(ReadingPartition.objects.values_list("device_type", "rows")),
+            {("Inverter", 10), ("Meter", 10), ("Plant", 2), ("SCB", 2), ("Weather", 2)},
+        )
+        self.assertEqual(set(Inverter.objects.values_list("timestamp", flat=True)), {self.november})
+        self.assertEqual(
+            self.get_inverter_timestamps(), [self.october, self.october, self.november]
+        )
+        self.assertEqual(self.get_inverter_timestamps(to=self.november), [self.october] * 2)
+
+        response = self.client.get(reverse("scada:plant-view", args=["ARCHIVED"]))
+        self.assertEqual({row["timestamp"] for row in response.data["Inverter"]}, {self.october})
+
+    def test_archived_months_are_read_only(self):
+        response = self.post_payload(make_payload(self.october + 60))
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response.data["errors"]["Inverter"][0],
+            "[Index: 0] Readings before 2022-11 are archived.",
+        )
+        self.assertFalse(Inverter.objects.filter(timestamp=self.october + 60).exists())
+
+        self.assertEqual(self.post_payload(make_payload(self.november + 60)).status_code, 201)
+
+    def test_invalid_timestamp_is_rejected(self):
+        for timestamp in ["abc", None]:
+            with self.subTest(timestamp=timestamp):
+                response = self.post_payload(make_payload(timestamp))
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(set(response.data["errors"]), set(SAMPLE_PAYLOAD["Data"]))
+
+    def test_drop_archived_months(self):
+        plant_url = reverse("scada:plant-view", args=["ARCHIVED"])
+        etag = self.client.get(plant_url)["ETag"]
+        self.partition_readings(drop_before="2022-11")
+
+        self.assertFalse(ReadingPartition.objects.exists())
+        self.assertNotIn(
+            partition_table(Inverter, parse_month("2022-10")),
+            connection.introspection.table_names(),
+        )
+        self.assertEqual(self.get_inverter_timestamps(), [self.november])
+        self.assertFalse(LatestReading.objects.filter(uid="ARCHIVED").exists())
+        self.assertTrue(LatestReading.objects.filter(uid=SAMPLE_PAYLOAD["UID"]).exists())
+
+        response = self.client.get(plant_url, headers={"if_none_match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["Inverter"], [])
+
+
+class PurgeReadingsTests(ScadaTestCase):
+    october = SAMPLE_PAYLOAD["Timestamp"]
+    november = parse_month("2022-11") + 3600
+
+    def setUp(self):
+        for hour in range(3):
+            self.post_payload(make_payload(self.october + 3600 * hour))
+        self.post_payload(make_payload(self.november))
+        self.post_payload(make_payload(self.october, uid="OTHER"))
+
+    def purge_readings(self, **options):
+        stdout = io.StringIO()
+        call_command("purge_readings", no_vacuum=True, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_purge_older_than(self):
+        rollups = Rollup.objects.count()
+        output = self.purge_readings(older_than="2022-11-01", chunk_size=2)
+
+        self.assertIn("Deleted 20 Inverter readings", output)
+        self.assertEqual(set(Inverter.objects.values_list("timestamp", flat=True)), {self.november})
+        self.assertEqual(SCB.objects.count(), 1)
+        self.assertEqual(Rollup.objects.count(), rollups)
+        self.assertEqual(
+            set(LatestReading.objects.values_list("uid", "timestamp")),
+            {(SAMPLE_PAYLOAD["UID"], self.november)},
+        )
+
+    def test_purge_plant(self):
+        self.purge_readings(uid="OTHER", device_type=["Inverter"])
+
+        self.assertFalse(Inverter.objects.filter(uid="OTHER").exists())
+        self.assertEqual(Inverter.objects.count(), 4 * 5)
+        self.assertTrue(SCB.objects.filter(uid="OTHER").exists())
+        self.assertFalse(LatestReading.objects.filter(uid="OTHER", device_type="Inverter").exists())
+
+    def rollups(self, **filters):
+        rows = Rollup.objects.filter(device_type="Inverter", **filters).order_by(
+            "uid", "devName", "period", "bucket", "field"
+        )
+        return [
+            (*key, round(total, 6) if total is not None else None)
+            for *key, total in rows.values_list(
+                "uid", "devName", "period", "bucket", "field",
+                "readings", "count", "min", "max", "last", "last_timestamp", "sum",
+            )
+        ]
+
+    def test_purged_plant_is_not_counted_twice(self):
+        rollups = self.rollups(uid="OTHER")
+        self.assertTrue(rollups)
+        self.purge_readings(uid="OTHER", device_type=["Inverter"])
+        # Aggregates of the deleted plant are gone with its readings
+        self.assertEqual(self.rollups(uid="OTHER"), [])
+
+        self.post_payload(make_payload(self.october, uid="OTHER"))
+        self.assertEqual(self.rollups(uid="OTHER"), rollups)
+
+    def test_cut_buckets_are_rebuilt(self):
+        rollups = self.rollups()
+        # Cuts the hour and the day of the first October readings
+        purge_model_readings(Inverter, before=self.october + 1)
+        self.assertFalse(Inverter.objects.filter(timestamp=self.october).exists())
+
+        self.post_payload(make_payload(self.october))
+        self.post_payload(make_payload(self.october, uid="OTHER"))
+        self.assertEqual(self.rollups(), rollups)
+
+    def test_purge_needs_a_filter(self):
+        with self.assertRaises(CommandError):
+            self.purge_readings()
+        with self.assertRaises(CommandError):
+            self.purge_readings(older_than="90 days")
+        self.assertEqual(Inverter.objects.count(), 5 * 5)
+
+    def test_ages_count_from_midnight_utc(self):
+        command = purge_readings.Command()
+        date = datetime.datetime.now(datetime.UTC).date() - datetime.timedelta(days=90)
+        self.assertEqual(command._parse_age("90d"), command._parse_age(date.isoformat()))
+        self.assertEqual(command._parse_age("90d") % (24 * 60 * 60), 0)
+
+
+class PurgeArchivedReadingsTests(ScadaTransactionTestCase):
+    def test_purge_archived_months(self):
+        for timestamp in [SAMPLE_PAYLOAD["Timestamp"], parse_month("2022-11") + 3600]:
+            self.post_payload(make_payload(timestamp))
+        self.post_payload(make_payload(SAMPLE_PAYLOAD["Timestamp"], uid="OTHER"))
+        call_command(
+            "partition_readings",
+            archive_before="2022-11",
+            device_type=["Inverter"],
+            stdout=io.StringIO(),
+        )
+
+        # Only part of the month: its rows are deleted from the archive
+        self.assertEqual(ReadingPartition.objects.get().rows, 10)
+        call_command("purge_readings", uid="OTHER", stdout=io.StringIO())
+        self.assertEqual(ReadingPartition.objects.get().rows, 5)
+        self.assertFalse(
+            partition_model(Inverter, parse_month("2022-10")).objects.filter(uid="OTHER").exists()
+        )
+
+        call_command("purge_readings", older_than="2022-11-01", stdout=io.StringIO())
+        self.assertFalse(ReadingPartition.objects.exists())
+        self.assertNotIn(
+            partition_table(Inverter, parse_month("2022-10")),
+            connection.introspection.table_names(),
+        )
+        self.assertEqual(Inverter.objects.count(), 5)
+        # The dropped month could be imported again
+        self.assertFalse(
+            Rollup.objects.filter(
+                device_type="Inverter", bucket__lt=parse_month("2022-11")
+            ).exists()
+        )
+
+
+class PackedStringsTests(SimpleTestCase):
+    def test_round_trip(self):
+        strings = {"_scb_i1": 8.53, "_scb_i2": None, "_scb_i3": -0.1, "_scb_i5": 1250.0}
+        packed = pack_strings(strings)
+        # Up to the last string with a current
+        self.assertEqual(len(packed), 5 * 4)
+        self.assertEqual(
+            dict(zip(STRING_FIELDS, unpack_strings(packed))),
+            {name: strings.get(name) for name in STRING_FIELDS},
+        )
+
+    def test_no_current(self):
+        self.assertIsNone(pack_strings({}))
+        self.assertIsNone(pack_strings(None))
+        self.assertIsNone(pack_strings({"_scb_i1": None}))
+        self.assertEqual(unpack_strings(None), [None] * len(STRING_FIELDS))
+
+
+class PackedStringsAPITests(ScadaTestCase):
+    def test_currents_are_served_as_sent(self):
+        payload = make_payload()
+        self.post_payload(payload)
+
+        tags = payload["Tags"]["SCB"]
+        sent = dict(zip(tags, payload["Data"]["SCB"][0]))
+        response = self.client.get(reverse("scada:plant-view", args=[payload["UID"]]))
+        scb = response.data["SCB"][0]
+        self.assertEqual(
+            {name: scb[name] for name in STRING_FIELDS},
+            {name: sent.get(name) for name in STRING_FIELDS},
+        )
+
+
+class PackedStringsMigrationTests(MigrationTestCase):
+    before = [("scada", "0009_reading_partition")]
+    after = [("scada", "0010_packed_scb_strings")]
+
+    def test_migration_round_trip(self):
+        apps = self.migrate(self.before)
+        SCB = apps.get_model("scada", "SCB")
+        SCBString = apps.get_model("scada", "SCBString")
+        currents = [
+            {"_scb_i1": 8.53, "_scb_i3": 10.25},
+            {"_scb_i1": 1.5, "_scb_i2": 2.5},
+            {},
+        ]
+        for number, strings in enumerate(currents):
+            scb = SCB.objects.create(
+                uid="UID", devType="S1", devName=f"SCB_{number}", timestamp=number
+            )
+            SCBString.objects.create(scb=scb, **strings)
+
+        SCB = self.migrate(self.after).get_model("scada", "SCB")
+        packed = dict(SCB.objects.values_list("devName", "_scb_strings"))
+        self.assertEqual(unpack_strings(packed["SCB_0"])[:3], [8.53, None, 10.25])
+        self.assertEqual(unpack_strings(packed["SCB_1"])[:3], [1.5, 2.5, None])
+        self.assertIsNone(packed["SCB_2"])
+
+        SCBString = self.migrate(self.before).get_model("scada", "SCBString")
+        strings = {
+            row.pop("scb__devName"): row
+            for row in SCBString.objects.values("scb__devName", *STRING_FIELDS)
+        }
+        self.assertEqual(set(strings), {"SCB_0", "SCB_1"})
+        self.assertEqual(strings["SCB_0"], {name: currents[0].get(name) for name in STRING_FIELDS})
+
+    def test_currents_beyond_float32_stop_the_migration(self):
+        apps = self.migrate(self.before)
+        SCB = apps.get_model("scada", "SCB")
+        SCBString = apps.get_model("scada", "SCBString")
+        scb = SCB.objects.create(uid="UID", devType="S1", devName="SCB_0", timestamp=0)
+        SCBString.objects.create(scb=scb, _scb_i1=1.5, _scb_i2=FLOAT32_MAX * 2)
+
+        with self.assertRaisesMessage(ValueError, "1 in scada_scbstring"):
+            self.migrate(self.after)
+        self.assertEqual(SCBString.objects.get()._scb_i2, FLOAT32_MAX * 2)
+
+        SCBString.objects.update(_scb_i2=None)
+        SCB = self.migrate(self.after).get_model("scada", "SCB")
+        self.assertEqual(unpack_strings(SCB.objects.get()._scb_strings)[:2], [1.5, None])
+
+    def test_archived_months_are_irreversible(self):
+        apps = self.migrate(self.after)
+        apps.get_model("scada", "ReadingPartition").objects.create(
+            device_type="SCB", start=0, end=1
+        )
+        with self.assertRaises(IrreversibleError):
+            self.migrate(self.before)
+
+
+@unittest.skipIf(pyarrow is None, "Exports need pyarrow")
+class ExportTests(ScadaTestCase):
+    def setUp(self):
+        for minute in range(3):
+            self.post_payload(make_payload(SAMPLE_PAYLOAD["Timestamp"] + 60 * minute))
+
+    def export(self, device_type, **params):
+        response = self.client.get(reverse("scada:export-view", args=[device_type]), params)
+        self.assertEqual(response.status_code, 200)
+        content = io.BytesIO(b"".join(response.streaming_content))
+        if params.get("format") == "arrow":
+            return pyarrow.ipc.open_stream(content).read_all()
+        return pyarrow.parquet.read_table(content)
+
+    def test_parquet_round_trip(self):
+        table = self.export("Inverter")
+        columns = export_columns(Inverter)
+        self.assertEqual(table.column_names, columns)
+        # Parquet has no second unit, they are read back as milliseconds
+        self.assertEqual(table.schema.field("timestamp").type.tz, "UTC")
+
+        rows = table.to_pylist()
+        for row in rows:
+            row["timestamp"] = int(row["timestamp"].timestamp())
+        self.assertEqual(
+            sorted(rows, key=lambda row: (row["timestamp"], row["devType"])),
+            list(Inverter.objects.order_by("timestamp", "devType").values(*columns)),
+        )
+
+    def test_arrow_round_trip(self):
+        table = self.export(
+            "SCB", format="arrow", fields="devName,_scb_v,_scb_i1,_scb_i24", devName="SCB_1"
+        )
+        self.assertEqual(table.column_names, ["devName", "_scb_v", "_scb_i1", "_scb_i24"])
+        self.assertEqual(str(table.schema.field("_scb_i1").type), "float")
+
+        scbs = SCB.objects.order_by("timestamp")
+        self.assertEqual(table.column("_scb_v").to_pylist(), [scb._scb_v for scb in scbs])
+        # float32 like the packed column
+        self.assertEqual(
+            [round(value, 5) for value in table.column("_scb_i24").to_pylist()],
+            [scb._scb_i24 for scb in scbs],
+        )
+
+    def test_time_range(self):
+        table = self.export(
+            "Inverter",
+            fields="timestamp",
+            **{"from": SAMPLE_PAYLOAD["Timestamp"] + 60, "to": SAMPLE_PAYLOAD["Timestamp"] + 120},
+        )
+        self.assertEqual(table.num_rows, 5)
@@ -0,0 +1,213 @@
+import asyncio
+import base64
+import io
+import json
+import unittest.mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.test import APITransactionTestCase
+
+from scada import async_views
+from scada.live import RESYNC, PlantFeed, get_plant_feed
+from scada.models import Inverter
+
+from .base import SAMPLE_PAYLOAD, ScadaTestCase, make_payload
+
+
+class PlantSnapshotTests(ScadaTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def get_plant(self, uid, **headers):
+        return self.client.get(reverse("scada:plant-view", args=[uid]), headers=headers)
+
+    def test_unchanged_snapshot_is_not_modified(self):
+        payload = make_payload()
+        self.post_payload(payload)
+        response = self.get_plant(payload["UID"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["Inverter"]), len(payload["Data"]["Inverter"]))
+        etag = response["ETag"]
+
+        response = self.get_plant(payload["UID"], if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(self.get_plant(payload["UID"], if_none_match="*").status_code, 304)
+
+    def test_ingestion_changes_the_etag(self):
+        payload = make_payload()
+        self.post_payload(payload)
+        etag = self.get_plant(payload["UID"])["ETag"]
+
+        self.post_payload(make_payload(payload["Timestamp"] + 60))
+        response = self.get_plant(payload["UID"], if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(
+            {row["timestamp"] for row in response.data["Inverter"]}, {payload["Timestamp"] + 60}
+        )
+
+    def test_plants_have_their_own_etag(self):
+        payload = make_payload()
+        self.post_payload(payload)
+        etag = self.get_plant(payload["UID"])["ETag"]
+
+        self.post_payload(make_payload(uid="OTHER"))
+        self.assertEqual(self.get_plant(payload["UID"], if_none_match=etag).status_code, 304)
+
+    def test_clearing_changes_the_etag(self):
+        payload = make_payload()
+        self.post_payload(payload)
+        etag = self.get_plant(payload["UID"])["ETag"]
+
+        call_command("clear_scada_data", stdout=io.StringIO())
+        response = self.get_plant(payload["UID"], if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["Inverter"], [])
+
+
+class InverterPageTests(ScadaTestCase):
+    def setUp(self):
+        # Three inverters share a name, their readings share a timestamp
+        self.timestamps = [SAMPLE_PAYLOAD["Timestamp"] + 60 * minute for minute in range(4)]
+        for timestamp in self.timestamps:
+            self.post_payload(make_payload(timestamp))
+
+    def get_pages(self, **params):
+        pages = []
+        cursor = None
+        while True:
+            response = self.client.get(
+                reverse("scada:inverter-view", args=["INVERTER_1"]),
+                {**params, "limit": 5, **({"cursor": cursor} if cursor else {})},
+            )
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(b"".join(response.streaming_content))
+            pages.append(page["results"])
+            cursor = page["next"]
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_reading_once(self):
+        pages = self.get_pages()
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        rows = [row for page in pages for row in page]
+        self.assertEqual([row["timestamp"] for row in rows], sorted(self.timestamps * 3))
+        self.assertEqual(
+            sorted((row["timestamp"], row["devType"]) for row in rows),
+            sorted(
+                Inverter.objects.filter(devName="INVERTER_1").values_list("timestamp", "devType")
+            ),
+        )
+
+    def test_pages_with_fields(self):
+        pages = self.get_pages(fields="_inv_w,devType")
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        rows = [row for page in pages for row in page]
+        self.assertEqual({tuple(row) for row in rows}, {("timestamp", "_inv_w", "devType")})
+        self.assertEqual(
+            sorted((row["timestamp"], row["devType"], row["_inv_w"]) for row in rows),
+            sorted(
+                Inverter.objects.filter(devName="INVERTER_1").values_list(
+                    "timestamp", "devType", "_inv_w"
+                )
+            ),
+        )
+
+    def test_columnar_pages_match_rows(self):
+        rows = [row for page in self.get_pages(fields="_inv_w") for row in page]
+        columns = self.get_pages(fields="_inv_w", layout="columnar")
+        self.assertEqual([len(page["timestamp"]) for page in columns], [5, 5, 2])
+        self.assertEqual(
+            [
+                {"timestamp": timestamp, "_inv_w": power}
+                for page in columns
+                for timestamp, power in zip(page["timestamp"], page["_inv_w"])
+            ],
+            rows,
+        )
+
+
+@override_settings(ROOT_URLCONF="scada.tests.base")
+class AsyncAuthenticationTests(APITransactionTestCase):
+    @unittest.mock.patch.object(
+        async_views.AsyncPlantDataView, "permission_classes", [IsAuthenticated]
+    )
+    async def test_users_are_authenticated(self):
+        url = reverse("scada:plant-view", args=[SAMPLE_PAYLOAD["UID"]])
+        self.assertEqual((await self.async_client.get(url)).status_code, 403)
+
+        await User.objects.acreate_user("operator", password="secret")
+        credentials = base64.b64encode(b"operator:secret").decode()
+        response = await self.async_client.get(
+            url, headers={"Authorization": f"Basic {credentials}"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class PlantFeedTests(SimpleTestCase):
+    def readings(self, uid):
+        return [Inverter(uid=uid, devType="11", devName="INVERTER_1", timestamp=0, _inv_w=1.5)]
+
+    def test_publish(self):
+        feed = PlantFeed()
+        subscription = feed.subscribe("UID")
+        self.assertEqual(subscription.get(0), [RESYNC])
+
+        feed.publish(Inverter, self.readings("OTHER"))
+        self.assertEqual(subscription.get(0), [])
+        feed.publish(Inverter, self.readings("UID"))
+        (event,) = subscription.get(0)
+        self.assertTrue(event.startswith(b"event: readings\ndata: "))
+        data = json.loads(event.split(b"data: ", 1)[1])
+        self.assertEqual(data["Inverter"][0]["_inv_w"], 1.5)
+
+        feed.unsubscribe(subscription)
+        feed.publish(Inverter, self.readings("UID"))
+        self.assertEqual(subscription.get(0), [])
+
+    def test_slow_subscriber_is_resynced(self):
+        feed = PlantFeed(maxsize=3)
+        subscription = feed.subscribe("UID")
+        for _ in range(5):
+            feed.publish(Inverter, self.readings("UID"))
+        # The missed events are replaced by a resync, the latest is kept
+        events = subscription.get(0)
+        self.assertLessEqual(len(events), 3)
+        self.assertEqual(events[0], RESYNC)
+        self.assertTrue(events[-1].startswith(b"event: readings\n"))
+
+    def test_closed_loop(self):
+        feed = PlantFeed()
+        loop = asyncio.new_event_loop()
+        closed = feed.subscribe("UID", loop=loop)
+        loop.close()
+        subscription = feed.subscribe("UID")
+
+        feed.publish(Inverter, self.readings("UID"))
+        self.assertEqual(len(closed.get(0)), 2)
+        self.assertEqual(len(subscription.get(0)), 2)
+
+
+@override_settings(SCADA_LIVE_KEEPALIVE=0.01)
+class PlantStreamTests(ScadaTestCase):
+    def test_stream(self):
+        response = self.client.get(reverse("scada:plant-stream-view", args=["SLM00E923M"]))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = iter(response.streaming_content)
+        try:
+            self.assertEqual(next(events), RESYNC)
+            self.assertEqual(next(events), b": keepalive\n\n")
+
+            self.post_payload(make_payload())
+            chunk = next(events)
+            self.assertEqual(chunk.count(b"event: readings\n"), len(SAMPLE_PAYLOAD["Data"]))
+            self.assertIn(b'"devName": "INVERTER_2"', chunk)
+        finally:
+            response.close()
+        self.assertFalse(get_plant_feed()._subscriptions)
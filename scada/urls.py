@@ -1,14 +1,55 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = "scada"
 
+if getattr(settings, "SCADA_ASYNC_VIEWS", False):
+    from . import async_views
+
+    DataView = async_views.AsyncDataView
+    InverterDetailView = async_views.AsyncInverterDetailView
+    PlantDataView = async_views.AsyncPlantDataView
+    PlantStreamView = async_views.AsyncPlantStreamView
+else:
+    DataView = views.DataView
+    InverterDetailView = views.InverterDetailView
+    PlantDataView = views.PlantDataView
+    PlantStreamView = views.PlantStreamView
+
 urlpatterns = [
-    path("data/", views.DataView.as_view(), name="data-view"),
+    path("data/", DataView.as_view(), name="data-view"),
+    path("data/batch/", views.BatchDataView.as_view(), name="batch-data-view"),
+    path("data/stream/", views.StreamDataView.as_view(), name="stream-data-view"),
     path(
         "inverter/<str:devName>/",
-        views.InverterDetailView.as_view(),
+        InverterDetailView.as_view(),
         name="inverter-view",
     ),
-    path("plant/<str:uid>/", views.PlantDataView.as_view(), name="plant-view"),
+    path("plant/<str:uid>/", PlantDataView.as_view(), name="plant-view"),
+    path(
+        "plant/<str:uid>/stream/",
+        PlantStreamView.as_view(),
+        name="plant-stream-view",
+    ),
+    path(
+        "plant/<str:uid>/timestamps/",
+        views.PlantTimestampsView.as_view(),
+        name="plant-timestamps-view",
+    ),
+    path(
+        "receipts/<uuid:receipt_id>/",
+        views.IngestReceiptView.as_view(),
+        name="receipt-view",
+    ),
+    path(
+        "aggregate/<str:device_type>/",
+        views.AggregateView.as_view(),
+        name="aggregate-view",
+    ),
+    path(
+        "export/<str:device_type>/",
+        views.ExportView.as_view(),
+        name="export-view",
+    ),
 ]
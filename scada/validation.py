@@ -0,0 +1,339 @@
+"""Serializer-free validation of flat device rows.
+
+`DataView` rows are lists of nullable floats, ints and strings. Running a
+DRF `ModelSerializer` per row spends most of its time in generic machinery,
+so `RowValidator` compiles the fields of a device serializer once into a
+table of per-column coercers and applies them directly to each row.
+
+Only values whose outcome is obvious (a float for a `FloatField`, an
+in-range int for an `IntegerField`, a plain ASCII string for a
+`CharField`...) are handled inline. Everything else is handed to the DRF
+field's own `run_validation`, so coercion rules and error messages stay
+identical to the serializer path.
+"""
+
+import functools
+import logging
+
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import SkipField, empty
+
+logger = logging.getLogger(__name__)
+
+TAG_PLAN_CACHE_SIZE = 128
+
+
+class _Fallback(Exception):
+    """Raised by a fast coercer when DRF has to decide about a value."""
+
+
+def _coerce_float(value):
+    if type(value) is float:
+        return value
+    if type(value) is int:
+        try:
+            return float(value)
+        except OverflowError:
+            # DRF reports it as an invalid value
+            raise _Fallback
+    raise _Fallback
+
+
+def _float_coercer(field):
+    min_value = field.min_value
+    max_value = field.max_value
+
+    def coerce(value):
+        value = _coerce_float(value)
+        if (min_value is None or value >= min_value) and (
+            max_value is None or value <= max_value
+        ):
+            return value
+        raise _Fallback
+
+    return coerce
+
+
+def _integer_coercer(field):
+    min_value = field.min_value
+    max_value = field.max_value
+
+    def coerce(value):
+        if type(value) is int and (
+            (min_value is None or value >= min_value)
+            and (max_value is None or value <= max_value)
+        ):
+            return value
+        raise _Fallback
+
+    return coerce
+
+
+def _char_coercer(field):
+    min_length = field.min_length or 1
+    max_length = field.max_length
+
+    def coerce(value):
+        if (
+            type(value) is str
+            and value.isascii()
+            and "\x00" not in value
+            and min_length <= len(value)
+            and (max_length is None or len(value) <= max_length)
+            and not value[0].isspace()
+            and not value[-1].isspace()
+        ):
+            return value
+        raise _Fallback
+
+    return coerce
+
+
+def _fast_coercer(field):
+    """Return an inline coercer for `field`, or None if DRF must handle it."""
+    if isinstance(field, serializers.FloatField):
+        if len(field.validators) != (field.max_value is not None) + (
+            field.min_value is not None
+        ):
+            return None
+        if field.min_value is None and field.max_value is None:
+            return _coerce_float
+        return _float_coercer(field)
+
+    if isinstance(field, serializers.IntegerField):
+        if len(field.validators) != (field.max_value is not None) + (
+            field.min_value is not None
+        ):
+            return None
+        return _integer_coercer(field)
+
+    if isinstance(field, serializers.CharField):
+        if field.allow_blank or not field.trim_whitespace:
+            return None
+        # max/min length, null character and surrogate validators
+        expected = 2 + (field.max_length is not None) + (field.min_length is not None)
+        if len(field.validators) != expected:
+            return None
+        return _char_coercer(field)
+
+    return None
+
+
+class Column:
+    __slots__ = ("name", "field", "group", "coerce", "allow_null")
+
+    def __init__(self, name, field, group=None):
+        self.name = name
+        self.field = field
+        self.group = group
+        self.coerce = _fast_coercer(field)
+        self.allow_null = field.allow_null
+
+    def run(self, value):
+        """Coerce `value`, raising `ValidationError` exactly like DRF would."""
+        if value is None:
+            if self.allow_null:
+                return None
+        elif self.coerce is not None:
+            try:
+                return self.coerce(value)
+            except _Fallback:
+                pass
+        return self.field.run_validation(value)
+
+
+class RowValidator:
+    """Validates rows for one device serializer without instantiating it.
+
+    Nested serializers (`SCBSerializer.strings`) are flattened so that their
+    fields are looked up in the same row, mirroring
+    `SCBSerializer._transform_data`.
+    """
+
+    def __init__(self, Serializer):
+        self.Serializer = Serializer
+        self.columns = {}
+        self.groups = []
+        self.order = {}
+        self.required = []
+
+        for name, field in Serializer().fields.items():
+            if field.read_only:
+                continue
+            self.order[name] = None
+            if isinstance(field, serializers.Serializer):
+                self.groups.append(name)
+                self.order[name] = []
+                for child_name, child in field.fields.items():
+                    if not child.read_only:
+                        self.columns[child_name] = Column(child_name, child, group=name)
+                        self.order[name].append(child_name)
+                continue
+
+            column = Column(name, field)
+            self.columns[name] = column
+            if field.required:
+                self.required.append(column)
+
+    def validate(self, device_data, tags, extra_fields, start=0):
+        """Validate `device_data` rows described by `tags`.
+
+        Same contract as `DataView._process_device_data`: returns the
+        validated rows and the `[Index: n]` error messages, counted from
+        `start`.
+        """
+        tag_plan = get_tag_plan(self.Serializer, tuple(tags))
+        plan = [
+            (idx, column)
+            for idx, column in tag_plan.columns
+            if column.name not in extra_fields
+        ]
+
+        # Values shared by every row are validated once
+        extra_values = {}
+        extra_errors = {}
+        for name, value in extra_fields.items():
+            column = self.columns.get(name)
+            if column is None:
+                continue
+            try:
+                extra_values[name] = column.run(value)
+            except ValidationError as exc:
+                extra_errors[name] = exc.detail
+
+        provided = {column.name for _, column in plan} | extra_fields.keys()
+        missing = {}
+        for column in self.required:
+            if column.name not in provided:
+                try:
+                    column.field.run_validation(empty)
+                except ValidationError as exc:
+                    missing[column.name] = exc.detail
+                except SkipField:
+                    pass
+
+        width = tag_plan.width
+        rows = []
+        errs = []
+        for idx, data in enumerate(device_data, start):
+            if not isinstance(data, list):
+                errs.append(f"[Index: {idx}] Expected a list of values.")
+                continue
+            if width != len(data):
+                errs.append(f"[Index: {idx}] Tags and data length mismatch.")
+                continue
+
+            validated = dict(extra_values)
+            for group in self.groups:
+                validated[group] = {}
+            errors = {}
+            for col_idx, column in plan:
+                try:
+                    value = column.run(data[col_idx])
+                except ValidationError as exc:
+                    if column.group is None:
+                        errors[column.name] = exc.detail
+                    else:
+                        errors.setdefault(column.group, {})[column.name] = exc.detail
+                    continue
+                if column.group is None:
+                    validated[column.name] = value
+                else:
+                    validated[column.group][column.name] = value
+
+            if errors or extra_errors or missing:
+                errors.update(extra_errors)
+                errors.update(missing)
+                errs.append(f"[Index: {idx}] {self._ordered(errors)}")
+                continue
+            rows.append(validated)
+
+        return rows, errs
+
+    def _ordered(self, errors):
+        """Order errors like `Serializer.errors` (declaration order)."""
+        ordered = {}
+        for name, children in self.order.items():
+            if name not in errors:
+                continue
+            if children is None:
+                ordered[name] = errors[name]
+            else:
+                ordered[name] = {
+                    child: errors[name][child]
+                    for child in children
+                    if child in errors[name]
+                }
+        return ordered
+
+
+@functools.cache
+def get_row_validator(Serializer):
+    return RowValidator(Serializer)
+
+
+class TagPlan:
+    """A `Tags` list compiled against a device serializer.
+
+    Holds the row index feeding each serializer field, split between
+    top-level fields and nested groups (the string currents of an SCB
+    row), and the tags that match no field at all. Rows are projected by
+    index, so unknown tags are dropped without building a dict per row.
+    """
+
+    def __init__(self, validator, tags):
+        positions = {}
+        unknown = []
+        for idx, tag in enumerate(tags):
+            # For duplicated tags the last one wins, as with `dict(zip())`
+            if tag in validator.columns:
+                positions[tag] = idx
+            else:
+                unknown.append(tag)
+
+        self.tags = tags
+        self.width = len(tags)
+        self.columns = [(idx, validator.columns[tag]) for tag, idx in positions.items()]
+        self.fields = [
+            (idx, column.name) for idx, column in self.columns if column.group is None
+        ]
+        self.groups = {
+            group: [
+                (idx, column.name)
+                for idx, column in self.columns
+                if column.group == group
+            ]
+            for group in validator.groups
+        }
+        self.unknown_tags = tuple(unknown)
+
+    def project(self, row):
+        """Build the serializer input for `row`, with groups already nested."""
+        data = {name: row[idx] for idx, name in self.fields}
+        for group, fields in self.groups.items():
+            data[group] = {name: row[idx] for idx, name in fields}
+        return data
+
+
+@functools.lru_cache(maxsize=TAG_PLAN_CACHE_SIZE)
+def get_tag_plan(Serializer, tags: tuple):
+    plan = TagPlan(get_row_validator(Serializer), tags)
+    if plan.unknown_tags:
+        logger.warning(
+            "%s tags without a matching field are ignored: %s",
+            Serializer.Meta.model.__name__,
+            ", ".join(plan.unknown_tags),
+        )
+    return plan
+
+
+def tag_plan_cache_info():
+    """Hit/miss counters of the tag plan cache, for metrics exports."""
+    info = get_tag_plan.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "maxsize": info.maxsize,
+        "currsize": info.currsize,
+    }
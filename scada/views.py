@@ -1,25 +1,93 @@
+import concurrent.futures
+import contextlib
+import functools
+import heapq
+import io
+import itertools
+import json
+import queue
+import tempfile
 from enum import StrEnum
 
-from django.db.models import F, Window
-from django.db.models.functions import RowNumber
-from drf_spectacular.utils import extend_schema
-from rest_framework import status
-from rest_framework.exceptions import UnsupportedMediaType, ValidationError
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import parse_etags
+from drf_spectacular.utils import (
+    OpenApiParameter,
+    PolymorphicProxySerializer,
+    extend_schema,
+)
+from rest_framework import serializers, status
+from rest_framework.exceptions import (
+    APIException,
+    NotFound,
+    ParseError,
+    UnsupportedMediaType,
+    ValidationError,
+)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.serializers import ModelSerializer
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import APIView
 
-from .models import SCB, Inverter, Plant, Weather
+from .aggregation import AGGREGATE_CHOICES, BUCKETS, GROUP_FIELDS, aggregate_readings
+from .cache import (
+    get_plant_snapshot,
+    plant_etag,
+    plant_snapshot_version,
+    set_plant_snapshot,
+)
+from .export import EXPORT_FORMATS, export_columns, export_readings, pyarrow
+from .ingest import save_readings
+from .ingest_queue import get_ingest_queue, get_ingest_timeout
+from .live import KEEPALIVE, get_plant_feed
+from .partitions import (
+    archive_horizons,
+    format_month,
+    month_start,
+    partition_model,
+    reading_querysets,
+)
+from .models import (
+    SCB,
+    IngestReceipt,
+    Inverter,
+    LatestReading,
+    Plant,
+    Rollup,
+    Weather,
+)
+from .parsers import (
+    GZIP_ERRORS,
+    PAYLOAD_MEDIA_TYPES,
+    PAYLOAD_PARSERS,
+    CompressedJSONParser,
+    open_stream,
+)
+from .renderers import ArrowStreamRenderer, EventStreamRenderer, ParquetRenderer
+from .rollups import aggregate_rollups, numeric_lookups, rollup_lookups, rollup_period
 from .serializers import (
+    AggregateResponseSerializer,
+    BatchDataViewRequestSerializer,
+    BatchDataViewResponseSerializer,
     DataViewRequestSerializer,
     DataViewResponseSerializer,
+    IngestAcceptedResponseSerializer,
+    IngestReceiptSerializer,
+    InverterDetailResponseSerializer,
     InverterSerializer,
     MeterSerializer,
     PlantDataResponseSerializer,
     PlantSerializer,
+    PlantTimestampsResponseSerializer,
     SCBSerializer,
     WeatherSerializer,
 )
+from .streaming import JSONStreamReader
+from .validation import get_row_validator, get_tag_plan
 
 
 class DeviceType(StrEnum):
@@ -39,15 +107,103 @@ SERIALIZER_MAPPING = {
 }
 
 
+# Coerces the `Timestamp` of a payload as the device serializers do
+TIMESTAMP_FIELD = serializers.IntegerField()
+
+
+class IngestQueueFull(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Ingestion queue is full, retry later."
+    default_code = "ingest_queue_full"
+
+
+class IngestTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = (
+        "The payload was not committed in time and may still be written. "
+        "Retry later, sending it again does not duplicate readings."
+    )
+    default_code = "ingest_timeout"
+
+
+class ExportUnavailable(APIException):
+    status_code = status.HTTP_501_NOT_IMPLEMENTED
+    default_detail = "Exports need the pyarrow package on the server."
+    default_code = "export_unavailable"
+
+
 @extend_schema(
     request=DataViewRequestSerializer,
-    responses={201: DataViewResponseSerializer, 206: DataViewResponseSerializer},
+    responses={
+        201: DataViewResponseSerializer,
+        202: IngestAcceptedResponseSerializer,
+        206: DataViewResponseSerializer,
+    },
 )
 class DataView(APIView):
+    parser_classes = PAYLOAD_PARSERS
+
     def post(self, request):
+        validated, errors = self._read_payload(request)
+
+        # Persist data into its corresponding tables
+        rows_by_model = self._rows_by_model(validated)
+        if not getattr(settings, "SCADA_INGEST_QUEUE", False):
+            save_readings(rows_by_model)
+            return self._created_response(errors)
+
+        # Write through the ingestion queue, waiting for the commit, or for
+        # the receipt to be stored when the client asked for one
+        job = self._submit(request, rows_by_model, errors)
+        try:
+            (job.accepted if job.receipt_id else job.future).result(
+                timeout=get_ingest_timeout()
+            )
+        except concurrent.futures.TimeoutError:
+            raise IngestTimeout()
+        if job.receipt_id:
+            return self._accepted_response(job)
+        return self._created_response(errors)
+
+    def _rows_by_model(self, validated):
+        return {
+            SERIALIZER_MAPPING[device_type].Meta.model: rows
+            for device_type, rows in validated.items()
+        }
+
+    def _submit(self, request, rows_by_model, errors):
+        """Queue the rows for the writer thread, with a receipt when the
+        client sent `Prefer: respond-async`."""
+        preferences = {
+            preference.split("=")[0].strip().lower()
+            for preference in request.headers.get("Prefer", "").split(",")
+        }
+        try:
+            return get_ingest_queue().submit(
+                rows_by_model, receipt="respond-async" in preferences, errors=errors
+            )
+        except queue.Full:
+            raise IngestQueueFull()
+
+    def _accepted_response(self, job):
+        data = {"detail": "Accepted", "receipt": str(job.receipt_id)}
+        if job.errors:
+            data["errors"] = job.errors
+        return Response(
+            data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={
+                "Location": reverse("scada:receipt-view", args=[job.receipt_id]),
+                "Preference-Applied": "respond-async",
+            },
+        )
+
+    def _read_payload(self, request):
+        """Parse and validate the payload, returns the validated rows and the
+        errors keyed by device type."""
         # Validate Content Type
         content_type = request.content_type
-        if content_type != "application/json":
+        if content_type not in PAYLOAD_MEDIA_TYPES:
             raise UnsupportedMediaType(content_type)
 
         # Validate all required top-level attributes exist in JSON payload
@@ -58,98 +214,862 @@ class DataView(APIView):
         if len(missing_attrs):
             raise ValidationError({"missing_required_attributes": missing_attrs})
 
-        # Validate and persist data into its corresponding tables
-        device_data = req_body["Data"]
-        device_tags = req_body["Tags"]
+        if not isinstance(req_body["Data"], dict):
+            raise ValidationError({"Data": ["Expected an object."]})
+
         extra_fields = {"timestamp": req_body["Timestamp"], "uid": req_body["UID"]}
+        return self._validate_data(req_body["Data"], req_body["Tags"], extra_fields)
+
+    def _created_response(self, errors):
+        if errors:
+            return Response(
+                {"detail": "Partial success", "errors": errors},
+                status=status.HTTP_206_PARTIAL_CONTENT,
+            )
+
+        return Response(
+            {"detail": "Data created successfully"}, status=status.HTTP_201_CREATED
+        )
 
+    def _validate_data(self, device_data, device_tags, extra_fields):
+        """Validate every row of a payload before anything is written.
+
+        Returns the validated rows and the error messages, both keyed by
+        device type.
+        """
         errors = {}
+        validated = {}
         for device_type in DeviceType:
             if device_type in device_data:
-                errs = self._process_device_data(
+                self._validate_tags(device_tags, device_type)
+                if not isinstance(device_data[device_type], list):
+                    errors[device_type] = ["Expected a list of rows."]
+                    continue
+                rows, errs = self._process_device_data(
                     device_data[device_type],
                     device_tags[device_type],
                     SERIALIZER_MAPPING[device_type],
                     extra_fields,
                 )
 
+                if len(rows):
+                    validated[device_type] = rows
                 if len(errs):
                     errors[device_type] = errs
 
-        if errors:
-            return Response(
-                {"detail": "Partial success", "errors": errors},
-                status=status.HTTP_206_PARTIAL_CONTENT,
-            )
-
-        return Response(
-            {"detail": "Data created successfully"}, status=status.HTTP_201_CREATED
-        )
+        return validated, errors
 
     def _validate_attributes(self, data, attrs):
         return [attr for attr in attrs if attr not in data]
 
+    def _validate_tags(self, device_tags, device_type):
+        """Reject the payload unless `Tags` lists the tags of `device_type`."""
+        if not isinstance(device_tags, dict):
+            raise ValidationError({"Tags": ["Expected an object."]})
+        if device_type not in device_tags:
+            raise ValidationError({"Tags": [f"Missing the tags of {device_type}."]})
+        tags = device_tags[device_type]
+        if not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+            raise ValidationError({"Tags": [f"Expected a list of names for {device_type}."]})
+
+    @functools.cached_property
+    def archive_horizons(self):
+        # Read once per request
+        return archive_horizons()
+
+    def _archive_horizon(self, Serializer, timestamp):
+        """Horizon of the archived months `timestamp` falls before, if any.
+
+        Invalid timestamps are left to the row validation to reject.
+        """
+        horizon = self.archive_horizons.get(Serializer.Meta.model.__name__)
+        if horizon is None:
+            return None
+        try:
+            timestamp = TIMESTAMP_FIELD.to_internal_value(timestamp)
+        except ValidationError:
+            return None
+        return horizon if timestamp < horizon else None
+
     def _process_device_data(
         self,
         device_data: list[list],
         fields: list[str],
         Serializer: ModelSerializer,
         extra_fields: dict,
+        start: int = 0,
     ):
+        """Validate the rows of a single device type.
+
+        Returns the `validated_data` of every valid row along with the
+        error messages of the rejected ones, whose indexes are counted
+        from `start`.
+        """
+        horizon = self._archive_horizon(Serializer, extra_fields["timestamp"])
+        if horizon is not None:
+            message = f"Readings before {format_month(horizon)} are archived."
+            return [], [
+                f"[Index: {idx}] {message}" for idx in range(start, start + len(device_data))
+            ]
+
+        if getattr(settings, "SCADA_FAST_VALIDATION", False):
+            return get_row_validator(Serializer).validate(
+                device_data, fields, extra_fields, start
+            )
+
+        plan = get_tag_plan(Serializer, tuple(fields))
+        rows = []
         errs = []
-        for idx, data in enumerate(device_data):
-            if len(fields) != len(data):
+        for idx, data in enumerate(device_data, start):
+            if not isinstance(data, list):
+                errs.append(f"[Index: {idx}] Expected a list of values.")
+                continue
+            if plan.width != len(data):
                 errs.append(f"[Index: {idx}] Tags and data length mismatch.")
                 continue
 
-            data = dict(zip(fields, data))
+            data = plan.project(data)
             data.update(extra_fields)
             s = Serializer(data=data)
             if not s.is_valid():
                 errs.append(f"[Index: {idx}] {s.errors}")
                 continue
-            s.save()
+            rows.append(s.validated_data)
+
+        return rows, errs
+
+
+@extend_schema(
+    request=BatchDataViewRequestSerializer,
+    responses={
+        201: BatchDataViewResponseSerializer,
+        202: IngestAcceptedResponseSerializer,
+        206: BatchDataViewResponseSerializer,
+    },
+)
+class BatchDataView(DataView):
+    """Ingest several intervals sharing the same `UID` and `Tags` at once.
+
+    All intervals are validated first and written in a single transaction,
+    with one bulk insert per device table for the whole batch.
+    """
+
+    def _read_payload(self, request):
+        """Parse and validate the batch, returns the validated rows keyed by
+        device type and the errors keyed by interval index."""
+        # Validate Content Type
+        content_type = request.content_type
+        if content_type not in PAYLOAD_MEDIA_TYPES:
+            raise UnsupportedMediaType(content_type)
+
+        req_body = request.data
+        missing_attrs = self._validate_attributes(req_body, ["UID", "Tags", "Intervals"])
+        if len(missing_attrs):
+            raise ValidationError({"missing_required_attributes": missing_attrs})
+        if not isinstance(req_body["Intervals"], list):
+            raise ValidationError({"Intervals": ["Expected a list of intervals."]})
+
+        errors = {}
+        validated = {}
+        for idx, interval in enumerate(req_body["Intervals"]):
+            if not isinstance(interval, dict):
+                errors[str(idx)] = {"non_field_errors": ["Expected an object."]}
+                continue
+            missing_attrs = self._validate_attributes(interval, ["Timestamp", "Data"])
+            if len(missing_attrs):
+                errors[str(idx)] = {"missing_required_attributes": missing_attrs}
+                continue
+            if not isinstance(interval["Data"], dict):
+                errors[str(idx)] = {"Data": ["Expected an object."]}
+                continue
+
+            extra_fields = {"timestamp": interval["Timestamp"], "uid": req_body["UID"]}
+            interval_rows, interval_errors = self._validate_data(
+                interval["Data"], req_body["Tags"], extra_fields
+            )
+            for device_type, rows in interval_rows.items():
+                validated.setdefault(device_type, []).extend(rows)
+            if interval_errors:
+                errors[str(idx)] = interval_errors
+
+        return validated, errors
+
+
+@extend_schema(
+    request=PolymorphicProxySerializer(
+        component_name="StreamDataViewRequest",
+        serializers=[DataViewRequestSerializer, BatchDataViewRequestSerializer],
+        resource_type_field_name=None,
+    ),
+    responses={
+        (code, "application/json"): PolymorphicProxySerializer(
+            component_name="StreamDataViewResponse",
+            serializers=[DataViewResponseSerializer, BatchDataViewResponseSerializer],
+            resource_type_field_name=None,
+        )
+        for code in (201, 206)
+    },
+)
+class StreamDataView(DataView):
+    """Ingest a `/data/` or `/data/batch/` payload while its body is read.
+
+    The JSON body is parsed incrementally: device rows are validated by
+    chunks of `chunk_size` and written as soon as `chunk_size` valid rows of
+    a device table are pending, so memory use does not grow with the size
+    of the payload. Every chunk is committed on its own, through the ingest
+    queue when enabled, while the next one is read: no transaction stays
+    open across the reads of the body. An interrupted upload leaves its
+    first chunks stored, sending it again overwrites them.
+
+    Rows are read as they arrive when `Tags`, `UID` and `Timestamp` come
+    before `Data` (`Tags` and `UID` before `Intervals`, the `Timestamp` of an
+    interval before its `Data`). Otherwise they are first copied to a
+    temporary file, held in memory up to `buffer_size` bytes, and read once
+    the rest of the object is. A payload with both `Data` and `Intervals`,
+    or either of them twice, is rejected when the second one is reached.
+    """
+
+    parser_classes = [CompressedJSONParser]
+    chunk_size = 1000
+    buffer_size = 1024 * 1024
+    # Top-level attributes needed to read the rows of `Data` and `Intervals`
+    prerequisites = {"Data": ["Tags", "UID", "Timestamp"], "Intervals": ["Tags", "UID"]}
+    # Error messages kept per device type, the others are only counted
+    max_errors = 1000
+
+    def post(self, request):
+        # Validate Content Type
+        content_type = request.content_type
+        if content_type != CompressedJSONParser.media_type:
+            raise UnsupportedMediaType(content_type)
+
+        # Read from the request body, bypassing the parsers
+        encoding = request.headers.get("Content-Encoding", "").strip().lower()
+        body = request.stream or io.BytesIO()
+        stream = open_stream(body, encoding)
+        reader = JSONStreamReader(stream)
+
+        self._job = None
+        try:
+            errors = self._ingest(reader)
+        except GZIP_ERRORS as exc:
+            if stream is body:
+                raise
+            raise ParseError(f"Invalid gzip body - {exc}")
+        self._wait_job()
+
+        if errors:
+            return Response(
+                {"detail": "Partial success", "errors": errors},
+                status=status.HTTP_206_PARTIAL_CONTENT,
+            )
+
+        return Response(
+            {"detail": "Data created successfully"}, status=status.HTTP_201_CREATED
+        )
+
+    def _ingest(self, reader):
+        """Read a payload, saving its rows, and return the errors."""
+        header = {}
+        errors = {}
+        pending = {}
+        with contextlib.ExitStack() as buffers:
+            deferred = []
+            for key in reader.iter_object():
+                if key in self.prerequisites:
+                    if any(rows_key in header for rows_key in self.prerequisites):
+                        # Rows of the other one may already be saved
+                        raise ValidationError(
+                            {key: ["A payload has either Data or Intervals, once."]}
+                        )
+                    if key == "Data" and reader.peek() != "{":
+                        raise ValidationError({"Data": ["Expected an object."]})
+                    if key == "Intervals" and reader.peek() != "[":
+                        raise ValidationError({"Intervals": ["Expected a list of intervals."]})
+                    if self._validate_attributes(header, self.prerequisites[key]):
+                        # Read once the attributes it needs are known
+                        deferred.append((key, buffers.enter_context(self._buffer(reader))))
+                    else:
+                        errors = self._read_rows(key, reader, header, pending)
+                    header[key] = None
+                elif key in ("Tags", "UID", "Timestamp"):
+                    header[key] = reader.read_value()
+                else:
+                    reader.skip_value()
+            reader.end()
+
+            if "Intervals" in header:
+                required = ["UID", "Tags", "Intervals"]
+            else:
+                required = ["Timestamp", "UID", "Data", "Tags"]
+            missing_attrs = self._validate_attributes(header, required)
+            if len(missing_attrs):
+                raise ValidationError({"missing_required_attributes": missing_attrs})
+
+            for key, buffer in deferred:
+                errors = self._read_rows(key, JSONStreamReader(buffer), header, pending)
+
+        for device_type, rows in pending.items():
+            self._save(device_type, rows)
+        return errors
+
+    def _buffer(self, reader):
+        """Copy the next value to a temporary file, kept in memory while it
+        is small, and return the file rewound."""
+        buffer = tempfile.SpooledTemporaryFile(max_size=self.buffer_size)
+        reader.copy_value(buffer)
+        buffer.seek(0)
+        return buffer
+
+    def _read_rows(self, key, reader, header, pending):
+        """Read the `Data` or `Intervals` of the payload, returns the errors."""
+        if key == "Data":
+            extra_fields = {"timestamp": header["Timestamp"], "uid": header["UID"]}
+            return self._stream_data(reader, header["Tags"], extra_fields, pending)
+        return self._stream_intervals(reader, header, pending)
+
+    def _stream_intervals(self, reader, header, pending):
+        """Read the `Intervals` of a batch, returns the errors by interval."""
+        errors = {}
+        for idx, _ in enumerate(reader.iter_array()):
+            if reader.peek() != "{":
+                reader.skip_value()
+                errors[str(idx)] = {"non_field_errors": ["Expected an object."]}
+                continue
+
+            interval = {}
+            interval_errors = {}
+            with contextlib.ExitStack() as buffers:
+                data = None
+                for key in reader.iter_object():
+                    if key == "Timestamp":
+                        interval[key] = reader.read_value()
+                        continue
+                    if key != "Data":
+                        reader.skip_value()
+                        continue
+
+                    interval[key] = None
+                    if reader.peek() != "{":
+                        reader.skip_value()
+                        interval_errors = {key: ["Expected an object."]}
+                    elif "Timestamp" in interval:
+                        extra_fields = {"timestamp": interval["Timestamp"], "uid": header["UID"]}
+                        interval_errors = self._stream_data(
+                            reader, header["Tags"], extra_fields, pending
+                        )
+                    else:
+                        # Read once the Timestamp of the interval is known
+                        data = buffers.enter_context(self._buffer(reader))
+
+                missing_attrs = self._validate_attributes(interval, ["Timestamp", "Data"])
+                if len(missing_attrs):
+                    errors[str(idx)] = {"missing_required_attributes": missing_attrs}
+                    continue
+                if data is not None:
+                    extra_fields = {"timestamp": interval["Timestamp"], "uid": header["UID"]}
+                    interval_errors = self._stream_data(
+                        JSONStreamReader(data), header["Tags"], extra_fields, pending
+                    )
+            if interval_errors:
+                errors[str(idx)] = interval_errors
+        return errors
+
+    def _stream_data(self, reader, device_tags, extra_fields, pending):
+        """Read a `Data` object, validating its rows by chunks and queuing the
+        valid ones in `pending`. Returns the errors by device type."""
+        errors = {}
+        for device_type in reader.iter_object():
+            if device_type not in SERIALIZER_MAPPING:
+                reader.skip_value()
+                continue
+            self._validate_tags(device_tags, device_type)
+            if reader.peek() != "[":
+                reader.skip_value()
+                errors[device_type] = ["Expected a list of rows."]
+                continue
+
+            errs = []
+            rejected = 0
+            start = 0
+            for chunk in itertools.batched(reader.iter_values(), self.chunk_size):
+                rows, chunk_errs = self._process_device_data(
+                    chunk,
+                    device_tags[device_type],
+                    SERIALIZER_MAPPING[device_type],
+                    extra_fields,
+                    start,
+                )
+                start += len(chunk)
+                rejected += len(chunk_errs)
+                errs.extend(chunk_errs[: self.max_errors - len(errs)])
+                self._queue(pending, DeviceType(device_type), rows)
+
+            if rejected > len(errs):
+                errs.append(f"{rejected - len(errs)} more rows rejected.")
+            if len(errs):
+                errors[device_type] = errs
+        return errors
+
+    def _queue(self, pending, device_type, rows):
+        """Add validated rows to `pending`, saving them once a chunk is full."""
+        queued = pending.setdefault(device_type, [])
+        queued.extend(rows)
+        if len(queued) >= self.chunk_size:
+            self._save(device_type, queued)
+            pending[device_type] = []
+
+    def _save(self, device_type, rows):
+        """Commit a chunk of rows in a transaction of its own."""
+        if not rows:
+            return
+        rows_by_model = {SERIALIZER_MAPPING[device_type].Meta.model: rows}
+        if not getattr(settings, "SCADA_INGEST_QUEUE", False):
+            save_readings(rows_by_model)
+            return
+
+        # One chunk in the queue at a time, the next one is read meanwhile
+        self._wait_job()
+        try:
+            self._job = get_ingest_queue().submit(rows_by_model)
+        except queue.Full:
+            raise IngestQueueFull()
+
+    def _wait_job(self):
+        job, self._job = self._job, None
+        if job is None:
+            return
+        try:
+            job.future.result(timeout=get_ingest_timeout())
+        except concurrent.futures.TimeoutError:
+            raise IngestTimeout()
 
-        return errs
 
+def get_int_param(params, name, default=None):
+    value = params.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: ["A valid integer is required."]})
 
-@extend_schema(responses=InverterSerializer(many=True))
+
+def get_fields_param(params, allowed, default):
+    """Parse a comma separated `fields` parameter against `allowed` names."""
+    value = params.get("fields")
+    if not value:
+        return list(default)
+    fields = [field for field in value.split(",") if field]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValidationError({"fields": [f"Unknown fields: {', '.join(unknown)}"]})
+    return fields
+
+
+TIME_RANGE_PARAMETERS = [
+    OpenApiParameter("from", int, description="Start timestamp (inclusive)"),
+    OpenApiParameter("to", int, description="End timestamp (exclusive)"),
+]
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter("uid", str, description="Only rows of this plant"),
+        *TIME_RANGE_PARAMETERS,
+        OpenApiParameter(
+            "fields", str, description="Comma separated fields, `timestamp` is always included"
+        ),
+        OpenApiParameter("cursor", str, description="`next` cursor of the previous page"),
+        OpenApiParameter("limit", int, description="Page size (default 1000, max 10000)"),
+        OpenApiParameter(
+            "layout",
+            str,
+            enum=["rows", "columnar"],
+            description="`columnar` returns one list per field instead of one object per row",
+        ),
+    ],
+    responses=InverterDetailResponseSerializer,
+)
 class InverterDetailView(APIView):
+    default_limit = 1000
+    max_limit = 10000
+    stream_chunk_size = 500
+
     def get(self, request, devName):
-        inverter = Inverter.objects.filter(devName=devName)
-        serializer = InverterSerializer(inverter, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        querysets, fields, limit, layout = self._get_rows(request, devName)
+        rows = self._iter_rows(querysets, limit)
+        if layout == "columnar":
+            content = self._render_columnar(list(rows), fields, limit)
+        else:
+            content = self._stream_rows(rows, fields, limit)
+        return StreamingHttpResponse(content, content_type="application/json")
+
+    def _iter_rows(self, querysets, limit):
+        """Rows of the page, plus one telling whether there is a next page.
+        The tables are read in time order until the page is full."""
+        remaining = limit + 1
+        for queryset in querysets:
+            for row in queryset[:remaining].iterator(self.stream_chunk_size):
+                remaining -= 1
+                yield row
+            if not remaining:
+                return
+
+    def _get_rows(self, request, devName):
+        """Querysets of the requested page, one per table it can span in
+        time order, with its fields, page size and layout."""
+        params = request.query_params
+        serializer_fields = list(InverterSerializer().fields)
+        fields = get_fields_param(params, serializer_fields, serializer_fields)
+        # `timestamp` comes first, the cursors are read from it
+        fields = ["timestamp", *(field for field in fields if field != "timestamp")]
+        limit = min(max(get_int_param(params, "limit", self.default_limit), 1), self.max_limit)
+        layout = params.get("layout", "rows")
+        if layout not in ("rows", "columnar"):
+            raise ValidationError({"layout": ["Must be `rows` or `columnar`."]})
+
+        filters = Q(devName=devName)
+        if params.get("uid"):
+            filters &= Q(uid=params["uid"])
+        start = get_int_param(params, "from")
+        if start is not None:
+            filters &= Q(timestamp__gte=start)
+        end = get_int_param(params, "to")
+        if end is not None:
+            filters &= Q(timestamp__lt=end)
+        if params.get("cursor"):
+            timestamp, pk = self._decode_cursor(params["cursor"])
+            filters &= Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk)
+            start = timestamp if start is None else max(start, timestamp)
+
+        querysets = [
+            queryset.filter(filters)
+            .order_by("timestamp", "pk")
+            .values_list(*fields, "pk")
+            for queryset in reading_querysets(Inverter, start, end)
+        ]
+        return querysets, fields, limit, layout
 
+    def _decode_cursor(self, cursor):
+        try:
+            timestamp, pk = cursor.split(":")
+            return int(timestamp), int(pk)
+        except ValueError:
+            raise ValidationError({"cursor": ["Invalid cursor."]})
 
-@extend_schema(responses=PlantDataResponseSerializer)
+    def _encode_cursor(self, row):
+        # `timestamp` is the first field and the primary key the last column
+        return f"{row[0]}:{row[-1]}"
+
+    def _stream_rows(self, rows, fields, limit):
+        yield '{"results":['
+        last = None
+        for count, row in enumerate(rows):
+            if count == limit:
+                yield f'],"next":{json.dumps(self._encode_cursor(last))}}}'
+                return
+            prefix = "," if count else ""
+            yield prefix + json.dumps(dict(zip(fields, row)), cls=JSONEncoder)
+            last = row
+        yield '],"next":null}'
+
+    def _render_columnar(self, rows, fields, limit):
+        next_cursor = self._encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        columns = dict(zip(fields, map(list, zip(*rows[:limit])))) or {
+            field: [] for field in fields
+        }
+        yield json.dumps({"results": columns, "next": next_cursor}, cls=JSONEncoder)
+
+
+@extend_schema(responses={200: PlantDataResponseSerializer, 304: None})
 class PlantDataView(APIView):
 
     def get(self, request, uid):
-        data = {
-            "Plant": self._get_latest_device_data(Plant, uid),
-            "Inverter": self._get_latest_device_data(Inverter, uid),
-            "Weather": self._get_latest_device_data(Weather, uid),
-            "SCB": self._get_latest_device_data(SCB, uid, select_related=True),
-        }
+        # Unchanged snapshots are answered from the cache alone
+        version = plant_snapshot_version(uid)
+        etag = plant_etag(uid, version)
+        if self._not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
 
-        # Use the response serializer to handle the serialization
-        serializer = PlantDataResponseSerializer(data)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = get_plant_snapshot(uid, version)
+        if data is None:
+            # Use the response serializer to handle the serialization
+            data = PlantDataResponseSerializer(
+                {
+                    device_type: itertools.chain.from_iterable(querysets)
+                    for device_type, querysets in self._get_latest_data(uid).items()
+                }
+            ).data
+            set_plant_snapshot(uid, version, data)
 
-    def _get_latest_device_data(self, model, uid, select_related=False):
+        return Response(data, status=status.HTTP_200_OK, headers={"ETag": etag})
+
+    def _not_modified(self, request, etag):
+        if_none_match = request.headers.get("If-None-Match")
+        return bool(if_none_match) and (
+            if_none_match.strip() == "*" or etag in parse_etags(if_none_match)
+        )
+
+    def _get_latest_data(self, uid):
+        """Querysets of the latest readings of the plant, by device type."""
+        horizons = archive_horizons()
+        return {
+            "Plant": self._get_latest_device_data(Plant, uid, horizons),
+            "Inverter": self._get_latest_device_data(Inverter, uid, horizons),
+            "Weather": self._get_latest_device_data(Weather, uid, horizons),
+            "SCB": self._get_latest_device_data(SCB, uid, horizons),
+        }
+
+    def _get_latest_device_data(self, model, uid, horizons):
         """function to get the latest record for each device type and name."""
-        queryset = model.objects.filter(uid=uid)
-        if select_related:
-            queryset = queryset.select_related()
-            
-        return (
-            queryset
-            .annotate(
-                row_number=Window(
-                    expression=RowNumber(),
-                    partition_by=[F("devType"), F("devName")],
-                    order_by=F("timestamp").desc(),
-                )
+        latest = LatestReading.objects.filter(device_type=model.__name__, uid=uid)
+        querysets = [model.objects.all()]
+        # Devices silent since an archived month have their latest reading
+        # in the partition of that month
+        horizon = horizons.get(model.__name__)
+        if horizon is not None:
+            timestamps = latest.filter(timestamp__lt=horizon).values_list(
+                "timestamp", flat=True
             )
-            .filter(row_number=1)
+            querysets[:0] = [
+                partition_model(model, start).objects.all()
+                for start in sorted({month_start(timestamp) for timestamp in timestamps})
+            ]
+
+        latest_ids = latest.values("reading_id")
+        return [queryset.filter(pk__in=latest_ids) for queryset in querysets]
+
+
+@extend_schema(responses={(200, "text/event-stream"): str})
+class PlantStreamView(APIView):
+    """Server-sent events with the readings of a plant as they are ingested.
+
+    The stream opens with a `resync` event, after which the plant snapshot
+    should be fetched, then every ingestion sends a `readings` event shaped
+    like the snapshot, e.g. `{"Inverter": [...]}`. Clients too slow to keep
+    up get a `resync` event in place of the readings they missed.
+
+    Under WSGI every client holds a thread of the server, serve many of
+    them with the async views.
+    """
+
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    def get(self, request, uid):
+        return self._event_stream(self._events(uid))
+
+    def _event_stream(self, events):
+        response = StreamingHttpResponse(events, content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        # Stops nginx from buffering the events
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    def _events(self, uid):
+        # Subscribed when the response starts, so that the subscription is
+        # always released when it is closed
+        feed = get_plant_feed()
+        subscription = feed.subscribe(uid)
+        try:
+            while True:
+                events = subscription.get(timeout=self._keepalive())
+                yield b"".join(events) or KEEPALIVE
+        finally:
+            feed.unsubscribe(subscription)
+
+    def _keepalive(self):
+        return getattr(settings, "SCADA_LIVE_KEEPALIVE", 15)
+
+
+@extend_schema(parameters=TIME_RANGE_PARAMETERS, responses=PlantTimestampsResponseSerializer)
+class PlantTimestampsView(APIView):
+    """Timestamps of the intervals stored for a plant, used by the collector
+    to skip intervals it already sent."""
+
+    def get(self, request, uid):
+        params = request.query_params
+        start = get_int_param(params, "from")
+        end = get_int_param(params, "to")
+
+        filters = Q(uid=uid)
+        if start is not None:
+            filters &= Q(timestamp__gte=start)
+        if end is not None:
+            filters &= Q(timestamp__lt=end)
+
+        horizons = archive_horizons()
+        querysets = [
+            queryset.filter(filters).values_list("timestamp", flat=True)
+            for Serializer in SERIALIZER_MAPPING.values()
+            for queryset in reading_querysets(
+                Serializer.Meta.model,
+                start,
+                end,
+                horizons.get(Serializer.Meta.model.__name__),
+            )
+        ]
+
+        # UNION drops the duplicates
+        timestamps = querysets[0].union(*querysets[1:]).order_by("timestamp")
+        return Response({"timestamps": list(timestamps)}, status=status.HTTP_200_OK)
+
+
+@extend_schema(responses=IngestReceiptSerializer)
+class IngestReceiptView(APIView):
+    """Outcome of a payload accepted with a `202`: `pending` while it waits
+    in the ingestion queue, then `committed` or `failed`."""
+
+    def get(self, request, receipt_id):
+        receipt = IngestReceipt.objects.filter(pk=receipt_id).first()
+        if receipt is None:
+            raise NotFound("Unknown receipt.")
+        return Response(IngestReceiptSerializer(receipt).data, status=status.HTTP_200_OK)
+
+
+def get_list_param(params, name):
+    """Values of a parameter given repeatedly and/or comma separated."""
+    return [item for value in params.getlist(name) for item in value.split(",") if item]
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter("uid", str, description="Only rows of this plant"),
+        OpenApiParameter(
+            "devName", str, description="Comma separated device names, all by default"
+        ),
+        *TIME_RANGE_PARAMETERS,
+        OpenApiParameter(
+            "fields", str, description="Comma separated numeric fields, all by default"
+        ),
+        OpenApiParameter("bucket", str, enum=list(BUCKETS), description="Default `1h`"),
+        OpenApiParameter(
+            "agg",
+            str,
+            description=f"Comma separated aggregates among {', '.join(AGGREGATE_CHOICES)}"
+            " (default `avg`)",
+        ),
+    ],
+    responses=AggregateResponseSerializer,
+)
+class AggregateView(APIView):
+    def get(self, request, device_type):
+        if device_type not in DeviceType.__members__.values():
+            raise NotFound(f"Unknown device type {device_type}.")
+        model = SERIALIZER_MAPPING[DeviceType(device_type)].Meta.model
+
+        params = request.query_params
+        # The same fields as the rollups
+        lookups = numeric_lookups(model)
+        fields = get_fields_param(params, lookups, lookups)
+
+        bucket = params.get("bucket", "1h")
+        if bucket not in BUCKETS:
+            raise ValidationError({"bucket": [f"Must be one of {', '.join(BUCKETS)}."]})
+
+        functions = get_list_param(params, "agg") or ["avg"]
+        unknown = [function for function in functions if function not in AGGREGATE_CHOICES]
+        if unknown:
+            raise ValidationError({"agg": [f"Unknown aggregates: {', '.join(unknown)}"]})
+
+        filters = Q()
+        if params.get("uid"):
+            filters &= Q(uid=params["uid"])
+        dev_names = get_list_param(params, "devName")
+        if dev_names:
+            filters &= Q(devName__in=dev_names)
+        start = get_int_param(params, "from")
+        if start is not None:
+            filters &= Q(timestamp__gte=start)
+        end = get_int_param(params, "to")
+        if end is not None:
+            filters &= Q(timestamp__lt=end)
+
+        functions = list(dict.fromkeys(functions))
+        seconds = BUCKETS[bucket]
+        period = rollup_period(seconds, start, end)
+        if period is not None and set(fields) <= rollup_lookups(model).keys():
+            rollups = Rollup.objects.filter(device_type=model.__name__)
+            if params.get("uid"):
+                rollups = rollups.filter(uid=params["uid"])
+            if dev_names:
+                rollups = rollups.filter(devName__in=dev_names)
+            if start is not None:
+                rollups = rollups.filter(bucket__gte=start)
+            if end is not None:
+                rollups = rollups.filter(bucket__lt=end)
+            results = aggregate_rollups(rollups, fields, seconds, period, functions)
+        else:
+            # Buckets never span two months, so neither two tables
+            results = heapq.merge(
+                *(
+                    aggregate_readings(
+                        queryset.filter(filters),
+                        {field: lookups[field] for field in fields},
+                        seconds,
+                        functions,
+                    )
+                    for queryset in reading_querysets(model, start, end)
+                ),
+                key=lambda result: [result[name] for name in GROUP_FIELDS],
+            )
+        return Response({"results": list(results)}, status=status.HTTP_200_OK)
+
+
+@extend_schema(
+    parameters=[
+        OpenApiParameter("uid", str, description="Only rows of this plant"),
+        OpenApiParameter(
+            "devName", str, description="Comma separated device names, all by default"
+        ),
+        *TIME_RANGE_PARAMETERS,
+        OpenApiParameter("fields", str, description="Comma separated columns, all by default"),
+        OpenApiParameter(
+            "format",
+            str,
+            enum=list(EXPORT_FORMATS),
+            description="Default `parquet`, also picked by the `Accept` header",
+        ),
+    ],
+    responses={
+        (200, ParquetRenderer.media_type): bytes,
+        (200, ArrowStreamRenderer.media_type): bytes,
+    },
+)
+class ExportView(APIView):
+    """Readings of a device type as a Parquet file or an Arrow IPC stream,
+    streamed as they are read (see `scada.export`)."""
+
+    renderer_classes = [JSONRenderer, ParquetRenderer, ArrowStreamRenderer]
+
+    def get(self, request, device_type):
+        if device_type not in DeviceType.__members__.values():
+            raise NotFound(f"Unknown device type {device_type}.")
+        if pyarrow is None:
+            raise ExportUnavailable()
+        model = SERIALIZER_MAPPING[DeviceType(device_type)].Meta.model
+
+        params = request.query_params
+        columns = export_columns(model)
+        columns = get_fields_param(params, columns, columns)
+        start = get_int_param(params, "from")
+        end = get_int_param(params, "to")
+
+        # JSON is only negotiated for the errors
+        renderer = request.accepted_renderer
+        if renderer.format not in EXPORT_FORMATS:
+            renderer = ParquetRenderer()
+        content = export_readings(
+            model,
+            columns,
+            renderer.format,
+            uid=params.get("uid"),
+            dev_names=get_list_param(params, "devName"),
+            start=start,
+            end=end,
+        )
+        response = StreamingHttpResponse(content, content_type=renderer.media_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="{device_type}.{EXPORT_FORMATS[renderer.format]}"'
         )
+        return response
@@ -0,0 +1,198 @@
+"""Append-only on-disk spool of the payloads sent by the collector.
+
+Payloads are appended to numbered segment files as length-prefixed compact
+JSON records before they are sent. Once the API accepted a payload it is
+acknowledged; the `ack` file keeps the position of the oldest record not
+acknowledged yet, and segments entirely before it are deleted. Records from
+that position on are what `Spool.pending` hands back for a replay.
+
+Delivery is at least once: records acknowledged out of order after an
+unacknowledged one are only remembered in memory, so they are sent again
+when the spool is replayed after a restart.
+"""
+
+import heapq
+import json
+import logging
+import os
+import struct
+
+SEGMENT_BYTES = 16 * 1024 * 1024
+
+# When appended records reach the disk: after every record, when a segment
+# is closed, or whenever the OS decides
+FSYNC_POLICIES = ("always", "segment", "never")
+
+RECORD_HEADER = struct.Struct(">I")
+
+
+def segment_name(segment):
+    return f"{segment:012d}.log"
+
+
+class Spool:
+    """Segment-rotated spool in `directory`.
+
+    Positions are `(segment, offset)` tuples of the start of a record.
+    """
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, fsync="always"):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self.committed = self._read_ack()
+        segments = self.segments()
+        self.segment = segments[-1] if segments else self.committed[0]
+        self._truncate_torn_record()
+        self._file = open(self._path(self.segment), "ab")
+
+        # Positions not acknowledged yet, and acknowledged positions still
+        # behind one of those
+        self._outstanding = []
+        self._registered = set()
+        self._acked = set()
+        # Records left over from a previous run stay outstanding until replayed
+        for position, _ in self._scan():
+            self._register(position)
+
+    def segments(self):
+        return sorted(
+            int(name.removesuffix(".log"))
+            for name in os.listdir(self.directory)
+            if name.endswith(".log")
+        )
+
+    def append(self, payload):
+        """Write `payload` to the spool and return its position."""
+        record = json.dumps(payload, separators=(",", ":")).encode()
+        if self._file.tell() and self._file.tell() + len(record) > self.segment_bytes:
+            self._rotate()
+
+        position = (self.segment, self._file.tell())
+        self._file.write(RECORD_HEADER.pack(len(record)) + record)
+        self._file.flush()
+        if self.fsync == "always":
+            os.fsync(self._file.fileno())
+
+        self._register(position)
+        return position
+
+    def ack(self, position):
+        """Mark the record at `position` as delivered."""
+        if position not in self._registered:
+            return
+        self._acked.add(position)
+        while self._outstanding and self._outstanding[0] in self._acked:
+            acked = heapq.heappop(self._outstanding)
+            self._registered.discard(acked)
+            self._acked.discard(acked)
+
+        committed = (
+            self._outstanding[0]
+            if self._outstanding
+            else (self.segment, self._file.tell())
+        )
+        if committed != self.committed:
+            self._write_ack(committed)
+
+    def pending(self):
+        """Yield `(position, payload)` of the records not acknowledged yet."""
+        for position, record in self._scan(read=True):
+            if position not in self._acked:
+                self._register(position)
+                yield position, json.loads(record)
+
+    def close(self):
+        if self.fsync != "never":
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+    def _register(self, position):
+        if position not in self._registered:
+            self._registered.add(position)
+            heapq.heappush(self._outstanding, position)
+
+    def _rotate(self):
+        if self.fsync != "never":
+            os.fsync(self._file.fileno())
+        self._file.close()
+        self.segment += 1
+        self._file = open(self._path(self.segment), "ab")
+
+    def _scan(self, read=False):
+        """Yield the position and (with `read`) the bytes of every complete
+        record from the committed position on."""
+        committed_segment, committed_offset = self.committed
+        for segment in self.segments():
+            if segment < committed_segment:
+                continue
+            offset = committed_offset if segment == committed_segment else 0
+            for position, length, record in self._scan_segment(segment, offset, read):
+                yield position, record
+
+    def _scan_segment(self, segment, offset=0, read=False):
+        path = self._path(segment)
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                (length,) = RECORD_HEADER.unpack(header)
+                if offset + RECORD_HEADER.size + length > size:
+                    return
+                if read:
+                    record = f.read(length)
+                else:
+                    record = None
+                    f.seek(length, os.SEEK_CUR)
+                yield (segment, offset), length, record
+                offset += RECORD_HEADER.size + length
+
+    def _truncate_torn_record(self):
+        # A crash while appending can leave a partial record at the end of
+        # the last segment
+        path = self._path(self.segment)
+        if not os.path.exists(path):
+            return
+        end = 0
+        for (_, offset), length, _ in self._scan_segment(self.segment):
+            end = offset + RECORD_HEADER.size + length
+        if end < os.path.getsize(path):
+            logging.warning(
+                f"Truncating partial record at {segment_name(self.segment)}:{end}"
+            )
+            with open(path, "r+b") as f:
+                f.truncate(end)
+
+    def _read_ack(self):
+        try:
+            with open(os.path.join(self.directory, "ack")) as f:
+                ack = json.load(f)
+            return ack["segment"], ack["offset"]
+        except FileNotFoundError:
+            segments = self.segments()
+            return (segments[0] if segments else 1), 0
+
+    def _write_ack(self, committed):
+        path = os.path.join(self.directory, "ack")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"segment": committed[0], "offset": committed[1]}, f)
+            if self.fsync != "never":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+        self.committed = committed
+
+        for segment in self.segments():
+            if segment >= committed[0]:
+                break
+            os.remove(self._path(segment))
+
+    def _path(self, segment):
+        return os.path.join(self.directory, segment_name(segment))
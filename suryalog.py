@@ -0,0 +1,214 @@
+"""Transformation of Suryalog responses into `/api/v1/data/` rows.
+
+The mapping files are compiled once into a `DevicePlan` per device type: the
+Suryalog key feeding every position of the `payload_tags` row. A device
+reading is then turned into a row with a single `map(reading.get, keys)`
+instead of walking every tag through the mapping dicts.
+
+Mappings given as a dict instead of a Suryalog key are derived fields:
+
+    "_inv_mpv1_mpi1_multiply": {"target": "MPP_W1", "sources": ["_inv_mpv1", "_inv_mpi1"]}
+
+The operation is the suffix of the rule name (or an explicit `"op"`), one of
+`multiply`, `sum`, `ratio` and `scale` (which takes a `"factor"`). Targets
+and sources are payload tags, or the Suryalog key a payload tag is mapped
+to. Rules are compiled with their plan and evaluated over all the rows of a
+transform; a null or non-numeric source gives a null result.
+"""
+
+import json
+import logging
+import math
+
+# Tags filled with the Suryalog device name rather than a reading
+DEVICE_NAME_TAGS = ("devType", "devName")
+
+
+def load_json_file(file_name):
+    with open(file_name) as f:
+        return json.load(f)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _ratio(rule):
+    def ratio(values):
+        numerator, denominator = values
+        return numerator / denominator if denominator else None
+
+    return ratio
+
+
+def _scale(rule):
+    factor = rule["factor"]
+    return lambda values: values[0] * factor
+
+
+# Operation name -> factory building the function of a rule
+DERIVED_OPERATIONS = {
+    "multiply": lambda rule: math.prod,
+    "sum": lambda rule: sum,
+    "ratio": _ratio,
+    "scale": _scale,
+}
+
+# Number of sources an operation takes, when fixed
+DERIVED_ARITY = {"ratio": 2, "scale": 1}
+
+
+class DerivedField:
+    """A compiled derived-field rule: `function` of the `sources` columns,
+    written to the `target` column."""
+
+    __slots__ = ("name", "target", "sources", "function")
+
+    def __init__(self, name, rule, column):
+        operation = rule.get("op", name.rpartition("_")[2])
+        if operation not in DERIVED_OPERATIONS:
+            raise ValueError(f"Unknown operation {operation!r} of derived field {name}")
+        sources = rule["sources"]
+        arity = DERIVED_ARITY.get(operation)
+        if arity is not None and len(sources) != arity:
+            raise ValueError(
+                f"Derived field {name}: {operation} takes {arity} sources, got {len(sources)}"
+            )
+
+        self.name = name
+        self.target = column(rule["target"], name)
+        self.sources = [column(source, name) for source in sources]
+        self.function = DERIVED_OPERATIONS[operation](rule)
+
+    def apply(self, rows):
+        target, sources, function = self.target, self.sources, self.function
+        for row in rows:
+            values = [row[idx] for idx in sources]
+            # Strings would be repeated by `multiply` rather than fail
+            row[target] = function(values) if all(map(_is_number, values)) else None
+
+
+class DevicePlan:
+    """Row layout of one device type, compiled from the mapping files."""
+
+    __slots__ = ("device_type", "tags", "keys", "name_positions", "derived")
+
+    def __init__(self, device_type, tags, param_map):
+        self.device_type = device_type
+        self.tags = tags
+        # Unmapped tags look up a key that never exists, so they stay None
+        self.keys = [
+            None if tag in DEVICE_NAME_TAGS else _source_key(param_map.get(tag))
+            for tag in tags
+        ]
+        self.name_positions = [
+            idx for idx, tag in enumerate(tags) if tag in DEVICE_NAME_TAGS
+        ]
+
+        def column(name, rule_name):
+            if name in tags:
+                return tags.index(name)
+            if name in self.keys:
+                return self.keys.index(name)
+            raise ValueError(
+                f"Derived field {rule_name}: {name} is not a payload tag of {device_type}"
+            )
+
+        self.derived = [
+            DerivedField(name, rule, column)
+            for name, rule in param_map.items()
+            if isinstance(rule, dict)
+        ]
+
+    def row(self, device_name, reading):
+        row = list(map(reading.get, self.keys))
+        for idx in self.name_positions:
+            row[idx] = device_name
+        return row
+
+    def derive(self, rows):
+        for field in self.derived:
+            field.apply(rows)
+
+
+def _source_key(mapped):
+    # Computed mappings (dicts) have no plain Suryalog key
+    return mapped if isinstance(mapped, str) else None
+
+
+class Transformer:
+    """Turns whole Suryalog `data` dicts into per-interval row matrices."""
+
+    def __init__(self, device_mapping, device_param_mapping, payload_tags):
+        self.payload_tags = payload_tags
+        self.plans = {
+            device_type: DevicePlan(
+                device_type, tags, device_param_mapping.get(device_type, {})
+            )
+            for device_type, tags in payload_tags.items()
+        }
+        self.device_plans = {
+            device_name: self.plans[device_type]
+            for device_name, device_type in device_mapping.items()
+            if device_type in self.plans
+        }
+        self._unknown_devices = set()
+
+    @classmethod
+    def from_files(
+        cls,
+        device_mapping="device_mapping.json",
+        device_param_mapping="suryalog_mapping.json",
+        payload_tags="payload_tags.json",
+    ):
+        return cls(
+            load_json_file(device_mapping),
+            load_json_file(device_param_mapping),
+            load_json_file(payload_tags),
+        )
+
+    def transform_interval(self, point_device_data, derive=True):
+        """Rows of one interval: `{device_type: [row, ...]}`."""
+        formatted_data = {}
+        device_plans = self.device_plans
+        for device_name, reading in point_device_data.items():
+            plan = device_plans.get(device_name)
+            if plan is None:
+                self._warn_unknown(device_name)
+                continue
+            rows = formatted_data.get(plan.device_type)
+            if rows is None:
+                rows = formatted_data[plan.device_type] = []
+            rows.append(plan.row(device_name, reading))
+        if derive:
+            self.derive(formatted_data)
+        return formatted_data
+
+    def transform(self, data):
+        """Rows of every interval of a Suryalog `data` dict, in one pass.
+
+        Returns `{timestamp: {device_type: [row, ...]}}` with int timestamps.
+        """
+        result = {
+            int(sensor_time): self.transform_interval(point_device_data, derive=False)
+            for sensor_time, point_device_data in data.items()
+        }
+        # Derived fields are evaluated once over the rows of all intervals
+        batches = {}
+        for formatted_data in result.values():
+            for device_type, rows in formatted_data.items():
+                batches.setdefault(device_type, []).extend(rows)
+        self.derive(batches)
+        return result
+
+    def derive(self, formatted_data):
+        """Evaluate the derived fields in place over `{device_type: rows}`."""
+        for device_type, rows in formatted_data.items():
+            self.plans[device_type].derive(rows)
+
+    def _warn_unknown(self, device_name):
+        if device_name not in self._unknown_devices:
+            self._unknown_devices.add(device_name)
+            logging.warning(
+                f"Skipping device {device_name} missing from the device mapping"
+            )
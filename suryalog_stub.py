@@ -0,0 +1,48 @@
+"""Local stand-in for the Suryalog API, for testing the collector.
+
+Answers every POST with `samples/suryalog-api-response.json` (or the file
+given with `--response`). Point the collector at it with:
+
+    SURYALOG_URL=http://localhost:8100/ python collector.py --timestamp 1752652230
+"""
+
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(response_body):
+    class SuryalogStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            self.log_message(
+                "plant=%s stime=%s etime=%s",
+                request.get("plant"),
+                request.get("stime"),
+                request.get("etime"),
+            )
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(response_body)))
+            self.end_headers()
+            self.wfile.write(response_body)
+
+    return SuryalogStubHandler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--response", default="samples/suryalog-api-response.json")
+    args = parser.parse_args()
+
+    with open(args.response, "rb") as f:
+        response_body = f.read()
+
+    server = ThreadingHTTPServer(("localhost", args.port), make_handler(response_body))
+    print(f"Serving {args.response} on http://localhost:{args.port}/")
+    server.serve_forever()